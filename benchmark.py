@@ -0,0 +1,462 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from types import SimpleNamespace
+
+import click
+import markdownify
+import pymongo
+import yaml
+from bs4 import BeautifulSoup
+from bson.raw_bson import RawBSONDocument
+from sqlalchemy import create_engine
+
+from pypkg.bbsmarkdown import bbs_markdownify
+from pypkg.codec import load_codecs
+from pypkg.config import load_config
+from pypkg.ephemeral import LocalPostgres, LocalRedis, ServerUnavailable
+from pypkg.models.mongo import MongoPost
+from pypkg.models.postgres import Base
+from pypkg.parser import MetadataPassError, Parser, RegroupPassError, make_parser
+from pypkg.slowlog import load_corpus
+from pypkg.snapshot import Snapshot, SnapshotWriter
+from pypkg.synthetic import reid_entry, synthetic_board
+from pypkg.workqueue import connect
+
+config = load_config()
+
+
+@click.group()
+def benchmark():
+    pass
+
+
+def sample_posts(
+    board: str, sample: int, snapshot: str | None, corpus: str | None = None
+) -> list[MongoPost]:
+    if corpus:
+        return [MongoPost(**doc) for doc in load_corpus(corpus, board)]
+    if snapshot:
+        with Snapshot(snapshot) as s:
+            reids = random.sample(s.reids, min(sample, len(s)))
+            return [MongoPost(**s.get(reid)) for reid in reids]
+    with pymongo.MongoClient(config.mongo) as client:
+        db = client.get_database("sjtubbs")
+        load_codecs(db, board)
+        pipeline = [{"$sample": {"size": sample}}, {"$project": {"_id": False}}]
+        return [MongoPost(**doc) for doc in db.get_collection(board).aggregate(pipeline)]
+
+
+@benchmark.command()
+@click.option("--board", "-b", help="The board to sample <pre> bodies from.")
+@click.option("--sample", "-n", help="The number of documents to sample.", default=500)
+@click.option(
+    "--snapshot",
+    help="Sample from a snapshot file instead of mongo.",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+)
+@click.option(
+    "--corpus",
+    help="Use every document of the board in the slow-document regression corpus.",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+)
+def markdown(board: str, sample: int, snapshot: str | None, corpus: str | None):
+    """Compare bbs_markdownify with markdownify on a sample of real posts."""
+    docs = sample_posts(board, sample, snapshot, corpus)
+
+    bodies: list[str] = []
+    for doc in docs:
+        for page in doc.pages:
+            soup = BeautifulSoup(page, features="html.parser")
+            bodies.extend(Parser.to_raw_html(pre) for pre in soup.find_all("pre"))
+
+    timings: dict[str, float] = {}
+    outputs: dict[str, list[str]] = {}
+    converters = {"markdownify": markdownify.markdownify, "bbs": bbs_markdownify}
+    for name, convert in converters.items():
+        start = time.perf_counter()
+        outputs[name] = [convert(body) for body in bodies]
+        timings[name] = time.perf_counter() - start
+
+    mismatches = [
+        body
+        for body, want, got in zip(bodies, outputs["markdownify"], outputs["bbs"])
+        if want != got
+    ]
+    for body in mismatches[:5]:
+        print("Mismatch:", repr(body[:200]))
+    print(f"{len(bodies)} posts from {len(docs)} documents, {len(mismatches)} mismatches")
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds / max(len(bodies), 1) * 1e6:.1f}us/post")
+    print(f"speedup: {timings['markdownify'] / max(timings['bbs'], 1e-9):.1f}x")
+
+
+@benchmark.command()
+@click.option("--board", "-b", help="The board collection to scan.")
+@click.option("--limit", "-n", help="The number of documents to read.", default=5000)
+def codec(board: str, limit: int):
+    """Measure bytes read and docs/sec when streaming a board the way docgen does.
+
+    Run it before and after `compressor.py migrate` to compare the two layouts.
+    """
+    with pymongo.MongoClient(config.mongo) as client:
+        db = client.get_database("sjtubbs")
+        load_codecs(db, board)
+        collection = db.get_collection(board)
+        compressed = collection.count_documents({"codec": {"$ne": None}})
+        total = collection.estimated_document_count()
+
+        options = collection.codec_options.with_options(document_class=RawBSONDocument)
+        raw = collection.with_options(codec_options=options)
+        wire_bytes = 0
+        docs = 0
+        start = time.perf_counter()
+        for doc in raw.find({}, {"_id": False}).sort("reid", 1).limit(limit):
+            wire_bytes += len(doc.raw)
+            docs += 1
+        read_seconds = time.perf_counter() - start
+
+        page_bytes = 0
+        start = time.perf_counter()
+        cursor = collection.find({}, {"_id": False}).sort("reid", 1).limit(limit)
+        for doc in cursor:
+            # 与解析器一样访问全部页面，压缩过的页面在这里解码
+            page_bytes += sum(len(page.encode()) for page in MongoPost(**doc).pages)
+        decode_seconds = time.perf_counter() - start
+
+    print(f"{board}: {compressed}/{total} documents compressed")
+    print(
+        f"read {docs} documents, {wire_bytes / 2**20:.1f}MiB BSON, "
+        f"{page_bytes / 2**20:.1f}MiB pages"
+    )
+    print(f"ratio: {page_bytes / max(wire_bytes, 1):.2f}x")
+    print(f"raw read: {docs / max(read_seconds, 1e-9):.0f} docs/sec")
+    print(f"read + decode: {docs / max(decode_seconds, 1e-9):.0f} docs/sec")
+
+
+PIPELINE_STAGES = [
+    "seed",
+    "filter.fetch",
+    "filter.cluster",
+    "filter.llm",
+    "filter.save",
+    "reimport",
+    "parse",
+    "organize",
+    "import",
+    "enqueue",
+    "worker",
+    "bulk",
+]
+# reimporter 以 --slow-threshold 0 运行时慢日志中记录的各阶段，逐文档给出延迟
+DOCUMENT_STAGES = ["parse", "organize", "import"]
+REIMPORTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reimporter.py")
+
+
+@benchmark.command()
+@click.argument("corpus", type=click.Path(exists=True, file_okay=False))
+@click.option("--board", "-b", help="Only run the documents of this board.", default=None)
+@click.option("--repeat", "-r", help="Parse each document this many times.", default=3)
+def regression(corpus: str, board: str | None, repeat: int):
+    """Parse the documents captured by reimporter --capture-slow, slowest first."""
+    rows: list[tuple[float, str, str, int, int]] = []
+    for doc in load_corpus(corpus, board):
+        best = float("inf")
+        posts = 0
+        for _ in range(repeat):
+            post = MongoPost(**doc)
+            start = time.perf_counter()
+            if parser := make_parser(post):
+                try:
+                    posts = len(parser.parse().posts)
+                except (MetadataPassError, RegroupPassError):
+                    posts = -1
+            best = min(best, time.perf_counter() - start)
+        rows.append((best, doc["section"], doc["reid"], len(doc["pages"]), posts))
+
+    rows.sort(reverse=True)
+    print(f"{'board':<16}{'reid':>12}{'pages':>7}{'posts':>7}{'parse ms':>11}")
+    for seconds, section, reid, pages, posts in rows:
+        print(f"{section:<16}{reid:>12}{pages:>7}{posts:>7}{seconds * 1e3:>11.1f}")
+    print(f"{len(rows)} documents, {sum(r[0] for r in rows):.2f}s in total")
+
+
+@dataclass
+class StageTiming:
+    stage: str
+    size: int
+    items: int = 0
+    seconds: float = 0.0
+    # 每个请求/文档/批次的耗时，单位秒
+    latencies: list[float] = field(default_factory=list)
+
+    def record(self, seconds: float, items: int = 1) -> None:
+        self.items += items
+        self.seconds += seconds
+        self.latencies.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def mock_openai(latency: float, per_line: float):
+    """替换 filter.AsyncOpenAI：按提示中的帖子数模拟延迟，并按 reid 给出固定的判定"""
+    id_re = re.compile(r"^\d+\. 标题：.*ID：(\d+)$", re.MULTILINE)
+
+    class MockAsyncOpenAI:
+        def __init__(self, **kwargs):
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+        async def create(self, model: str, messages: list[dict], **kwargs):
+            reids = id_re.findall(messages[0]["content"])
+            await asyncio.sleep(latency + per_line * len(reids))
+            verdicts = [("KEEP", "DISCARD", "MAYBE")[int(r) % 3] for r in reids]
+            content = "\n".join(f"{i}. {v}" for i, v in enumerate(verdicts, 1))
+            message = SimpleNamespace(content=content)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    return MockAsyncOpenAI
+
+
+async def run_filter(
+    filter_module,
+    redis_url: str,
+    board: str,
+    limit: int,
+    timings: dict[str, StageTiming],
+):
+    reid_filter = filter_module.ReidFilter(redis_url=redis_url)
+    try:
+        start = time.perf_counter()
+        reids = await reid_filter.get_batch_reids(board)
+        timings["filter.fetch"].record(time.perf_counter() - start, len(reids))
+
+        start = time.perf_counter()
+        clusters = reid_filter.cluster_reids(board, reids, limit)
+        timings["filter.cluster"].record(time.perf_counter() - start, len(reids))
+
+        kept = []
+        for batch in itertools.batched([c[0] for c in clusters], limit):
+            start = time.perf_counter()
+            valuable, _ = await reid_filter.filter_with_llm(list(batch))
+            timings["filter.llm"].record(time.perf_counter() - start, len(batch))
+            kept.extend(valuable)
+
+        start = time.perf_counter()
+        await reid_filter.save_filtered_workset(board, kept, "valuable")
+        timings["filter.save"].record(time.perf_counter() - start, len(kept))
+    finally:
+        await reid_filter.close_redis()
+
+
+def reset_schema(dsn: str) -> None:
+    engine = create_engine(dsn)
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def prepare_root(directory: str, redis_url: str, postgres: str) -> str:
+    """
+    为 reimporter 子进程准备 $ROOT：config.yml 只改写 redis 与 postgres，
+    检查点、缓存、慢日志、死信与子进程的输出都落在这个目录中。
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "config.yml"), "w") as f:
+        yaml.safe_dump(asdict(config) | {"redis": redis_url, "postgres": postgres}, f)
+    return directory
+
+
+def start_reimporter(root: str, log: str, *args: str) -> subprocess.Popen:
+    """以真实的命令行运行 reimporter.py，工作目录与 $ROOT 都是 root，输出追加到 <root>/<log>.log"""
+    with open(os.path.join(root, f"{log}.log"), "a") as out:
+        return subprocess.Popen(
+            [sys.executable, REIMPORTER, *args],
+            cwd=root,
+            env=os.environ | {"ROOT": root},
+            stdout=out,
+            stderr=subprocess.STDOUT,
+        )
+
+
+def run_reimporter(
+    root: str, log: str, timing: StageTiming, items: int, *args: str, processes: int = 1
+) -> None:
+    """同时启动 processes 个 reimporter，整个阶段的耗时计入 timing，每个进程的耗时作为一次延迟"""
+    start = time.perf_counter()
+    running = [start_reimporter(root, log, *args) for _ in range(processes)]
+    for process in running:
+        if process.wait() != 0:
+            raise click.ClickException(
+                f"reimporter {' '.join(args)} exited with {process.returncode}, "
+                f"see {os.path.join(root, log)}.log"
+            )
+        timing.latencies.append(time.perf_counter() - start)
+    timing.items += items
+    timing.seconds += time.perf_counter() - start
+
+
+def read_document_stages(root: str, board: str, timings: dict[str, StageTiming]) -> None:
+    """读出并删除慢日志，其中每个文档各阶段的耗时即为该阶段的逐项延迟"""
+    path = os.path.join(root, "slowlog", f"{board}.jsonl")
+    with open(path, "r") as f:
+        for line in f:
+            for stage, seconds in json.loads(line)["stages"].items():
+                if stage in DOCUMENT_STAGES:
+                    timings[stage].record(seconds)
+    os.remove(path)
+
+
+@benchmark.command()
+@click.option(
+    "--sizes",
+    help="Comma-separated numbers of synthetic topics to run the pipeline with.",
+    default="100,1000,5000",
+)
+@click.option("--replies", help="The maximum number of replies per topic.", default=30)
+@click.option("--batch-size", help="The reimporter import batch size.", default=200)
+@click.option(
+    "--queue-workers",
+    help="The number of `reimporter --worker` processes that drain the work queue together.",
+    default=2,
+)
+@click.option("--llm-latency", help="Seconds the mocked LLM takes per request.", default=0.5)
+@click.option(
+    "--llm-per-line",
+    help="Extra seconds the mocked LLM takes per prompt line.",
+    default=0.02,
+)
+@click.option(
+    "--redis",
+    "redis_url",
+    help="Use this scratch redis instead of starting redis-server. It will be flushed.",
+    default=None,
+)
+@click.option(
+    "--postgres",
+    help="Use this scratch database instead of running initdb. All tables will be dropped.",
+    default=None,
+)
+@click.option(
+    "--bulk",
+    help="Also measure the --bulk loader on a fresh schema.",
+    is_flag=True,
+    default=False,
+)
+@click.option("--output", "-o", help="Write the raw timings to a JSON file.", default=None)
+def pipeline(
+    sizes: str,
+    replies: int,
+    batch_size: int,
+    queue_workers: int,
+    llm_latency: float,
+    llm_per_line: float,
+    redis_url: str | None,
+    postgres: str | None,
+    bulk: bool,
+    output: str | None,
+):
+    """Run filter.py and the reimporter CLI end to end on synthetic boards with local stand-ins.
+
+    The reimporter runs as a subprocess with its own $ROOT and config.yml under a
+    temporary directory, reading the board from a snapshot instead of mongodb.
+    """
+    # filter.py 在导入时就会打开日志文件，只在这里导入
+    os.makedirs("logs", exist_ok=True)
+    import filter as filter_module
+    from pypkg.organize import ReplyOrganizer
+
+    filter_module.AsyncOpenAI = mock_openai(llm_latency, llm_per_line)
+    # 先在本进程中加载一次句向量模型，首次运行时的下载不计入 reimporter 各阶段的耗时
+    ReplyOrganizer()
+    board = "Bench"
+    results: list[StageTiming] = []
+    with ExitStack() as stack:
+        try:
+            if redis_url is None:
+                redis_url = stack.enter_context(LocalRedis()).url
+            if postgres is None:
+                postgres = stack.enter_context(LocalPostgres()).dsn
+        except ServerUnavailable as e:
+            raise click.UsageError(f"{e}, pass --redis/--postgres to use scratch instances")
+        workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix="bench-"))
+        client = connect(redis_url)
+
+        for size in map(int, sizes.split(",")):
+            timings = {stage: StageTiming(stage, size) for stage in PIPELINE_STAGES}
+            root = prepare_root(os.path.join(workdir, str(size)), redis_url, postgres)
+            common = ["-b", board, "--batch-size", str(batch_size)]
+
+            # 用快照代替 mongo 中的版块集合，redis 中写入 golang 端的 workset 与 reid 记录
+            client.flushdb()
+            reset_schema(postgres)
+            path = os.path.join(root, f"{board}.snap")
+            start = time.perf_counter()
+            writer = SnapshotWriter(path)
+            pipe = client.pipeline(transaction=False)
+            for doc in synthetic_board(board, size, replies):
+                writer.write(doc)
+                pipe.sadd(f"workset:reid:{board}", doc["reid"])
+                pipe.set(f"reid:{doc['reid']}", reid_entry(doc))
+            writer.close()
+            pipe.execute()
+            timings["seed"].record(time.perf_counter() - start, size)
+            common += ["--snapshot", path]
+
+            asyncio.run(run_filter(filter_module, redis_url, board, 200, timings))
+
+            # 单进程顺序导入：慢日志阈值为 0 时每个文档的解析、回复重建与导入耗时都会被记录
+            run_reimporter(
+                root, "reimport", timings["reimport"], size, *common, "--slow-threshold", "0"
+            )
+            read_document_stages(root, board, timings)
+
+            # 同一批文档经 redis 队列分给多个 worker 导入一个空库
+            reset_schema(postgres)
+            run_reimporter(root, "enqueue", timings["enqueue"], size, *common, "--enqueue")
+            run_reimporter(
+                root,
+                "worker",
+                timings["worker"],
+                size,
+                *common,
+                "--worker",
+                processes=queue_workers,
+            )
+
+            if bulk:
+                reset_schema(postgres)
+                run_reimporter(root, "bulk", timings["bulk"], size, *common, "--bulk")
+
+            results.extend(t for t in timings.values() if t.items)
+
+    print(
+        f"{'stage':<16}{'size':>8}{'items':>9}{'seconds':>10}"
+        f"{'items/s':>11}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for t in results:
+        print(
+            f"{t.stage:<16}{t.size:>8}{t.items:>9}{t.seconds:>10.2f}"
+            f"{t.items / max(t.seconds, 1e-9):>11.1f}"
+            f"{t.percentile(0.5) * 1e3:>10.1f}{t.percentile(0.95) * 1e3:>10.1f}"
+        )
+    if output:
+        with open(output, "w") as f:
+            json.dump([asdict(t) for t in results], f)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,91 @@
+import click
+import pymongo
+from bson import Binary
+from tqdm import tqdm
+
+from pypkg.codec import (
+    LazyPages,
+    PageCodec,
+    load_codecs,
+    lookup_codec,
+    save_codec,
+    train_dictionary,
+)
+from pypkg.config import load_config
+
+config = load_config()
+
+
+@click.group()
+def compressor():
+    pass
+
+
+@compressor.command()
+@click.option("--board", "-b", help="The board whose pages the dictionary is trained on.")
+@click.option("--sample", "-n", help="The number of documents to sample.", default=2000)
+def train(board: str, sample: int):
+    """Train a zstd dictionary for the pages of a board."""
+    with pymongo.MongoClient(config.mongo) as client:
+        db = client.get_database("sjtubbs")
+        # 已经用旧字典压缩过的文档先解码，重新训练时同样可以作为样本
+        load_codecs(db, board)
+        pipeline = [{"$sample": {"size": sample}}]
+        docs = list(db.get_collection(board).aggregate(pipeline))
+        pages: list[str] = []
+        for doc in docs:
+            source = lookup_codec(doc["codec"]) if doc.get("codec") else None
+            pages.extend(LazyPages(doc["pages"], source))
+        codec = PageCodec(train_dictionary(pages))
+        save_codec(db, board, codec)
+    print(f"Trained dictionary {codec.dict_id} ({len(codec.dictionary)} bytes) for {board}")
+
+
+@compressor.command()
+@click.option("--board", "-b", help="The board collection to rewrite.")
+@click.option("--batch", help="The number of documents per bulk write.", default=500)
+@click.option(
+    "--decompress",
+    help="Rewrite compressed documents back to plain pages.",
+    is_flag=True,
+    default=False,
+)
+def migrate(board: str, batch: int, decompress: bool):
+    """Compress (or decompress) the pages of every document in a board collection.
+
+    Documents compressed with an older dictionary are re-encoded with the latest one.
+    """
+    with pymongo.MongoClient(config.mongo) as client:
+        db = client.get_database("sjtubbs")
+        collection = db.get_collection(board)
+        codec = load_codecs(db, board)
+        if not decompress and codec is None:
+            raise click.UsageError(f"No dictionary for {board}, run `train` first")
+
+        if decompress:
+            query = {"codec": {"$ne": None}}
+        else:
+            query = {"codec": {"$ne": codec.dict_id}}
+        total = collection.count_documents(query)
+        ops: list[pymongo.UpdateOne] = []
+        with tqdm(total=total, desc=board) as pbar:
+            for doc in collection.find(query, {"_id": True, "pages": True, "codec": True}):
+                source = lookup_codec(doc["codec"]) if doc.get("codec") else None
+                pages = LazyPages(doc["pages"], source)
+                if decompress:
+                    update = {"$set": {"pages": list(pages)}, "$unset": {"codec": ""}}
+                else:
+                    pages = [Binary(codec.encode(p)) for p in pages]
+                    update = {"$set": {"pages": pages, "codec": codec.dict_id}}
+                ops.append(pymongo.UpdateOne({"_id": doc["_id"]}, update))
+                if len(ops) >= batch:
+                    collection.bulk_write(ops, ordered=False)
+                    pbar.update(len(ops))
+                    ops = []
+            if ops:
+                collection.bulk_write(ops, ordered=False)
+                pbar.update(len(ops))
+
+
+if __name__ == "__main__":
+    compressor()
@@ -0,0 +1,168 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+
+import click
+import pymongo
+
+from pypkg.cache import TopicCache
+from pypkg.codec import load_codecs
+from pypkg.config import load_config
+from pypkg.deadletter import STAGE_ORGANIZE, DeadLetterSink, JsonlDeadLetters
+from pypkg.discourse import DiscourseShard
+from pypkg.organize import ReplyOrganizer
+from pypkg.snapshot import Snapshot
+from reimporter import CACHE_DIRECTORY, cached_documents, parse_documents
+
+config = load_config()
+
+EXPORT_DIRECTORY: str = os.getenv("ROOT") + "/discourse"
+FILE_DIRECTORY: str = os.getenv("ROOT") + "/files"
+# 每个导出进程的内存粗略上限：句向量模型约 1.1GB，加上一个主题的解析结果与 sqlite 的缓冲
+WORKER_MEMORY = 2 * 2**30
+
+# 每个导出进程只加载一次句向量模型，由 init_worker 创建，之后导出的所有版块共用
+organizer: ReplyOrganizer | None = None
+
+
+def init_worker() -> None:
+    global organizer
+    organizer = ReplyOrganizer()
+
+
+def default_workers() -> int:
+    """CPU 核数与物理内存所能容纳的进程数中较小的一个"""
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return max(1, min(os.cpu_count() or 1, memory // WORKER_MEMORY))
+
+
+def list_boards(snapshots: str | None) -> list[str]:
+    if snapshots:
+        return sorted(
+            name.removesuffix(".snap")
+            for name in os.listdir(snapshots)
+            if name.endswith(".snap")
+        )
+    with pymongo.MongoClient(config.mongo) as client:
+        names = client.get_database("sjtubbs").list_collection_names()
+    # _codecs 等以下划线开头的集合不是版块
+    return sorted(name for name in names if not name.startswith("_"))
+
+
+def export_board(
+    board: str, output: str, snapshots: str | None, from_cache: bool
+) -> tuple[str, int, int, int, float]:
+    """
+    在独立进程中把一个版块导出为 <output>/<board>.db。
+
+    文档逐个解析、重建回复后立即写入分片，不经过 postgres，内存占用与版块大小无关；
+    出错的文档记入 <output>/deadletters/<board>.jsonl，不影响其余文档。
+    """
+    start = time.perf_counter()
+    dead_letters = DeadLetterSink(
+        JsonlDeadLetters(os.path.join(output, "deadletters"), board)
+    )
+    shard = DiscourseShard(
+        os.path.join(output, f"{board}.db"),
+        board,
+        os.path.join(FILE_DIRECTORY, board),
+        config.asset_uri_base,
+    )
+    try:
+        with ExitStack() as stack:
+            if from_cache:
+                cache = TopicCache(CACHE_DIRECTORY, board)
+                stack.callback(cache.close)
+                source = cached_documents(cache)
+            elif snapshots:
+                path = os.path.join(snapshots, f"{board}.snap")
+                collection = stack.enter_context(Snapshot(path))
+                source = parse_documents(collection, dead_letters=dead_letters)
+            else:
+                client = stack.enter_context(pymongo.MongoClient(config.mongo))
+                db = client.get_database("sjtubbs")
+                load_codecs(db, board)
+                collection = db.get_collection(board)
+                source = parse_documents(collection, dead_letters=dead_letters)
+            for reid, topic in source:
+                if not topic:
+                    continue
+                try:
+                    organizer.organize(topic)
+                except Exception as e:
+                    dead_letters.record(reid, STAGE_ORGANIZE, e)
+                    continue
+                shard.add(topic)
+    except BaseException:
+        shard.abort()
+        raise
+    shard.close()
+    elapsed = time.perf_counter() - start
+    return board, shard.topics, shard.posts, dead_letters.total, elapsed
+
+
+@click.command()
+@click.option(
+    "--board",
+    "-b",
+    help="Comma-separated boards to export. Defaults to every board in mongodb or in --snapshots.",
+    default=None,
+)
+@click.option(
+    "--output",
+    "-o",
+    help="The directory that receives one <board>.db shard per board. Defaults to discourse/ under $ROOT.",
+    default=None,
+)
+@click.option(
+    "--snapshots",
+    help="Read boards from <board>.snap files in this directory instead of mongodb.",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+)
+@click.option(
+    "--from-cache",
+    help="Read already parsed topics from the parse cache and skip mongodb and parsing.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--workers",
+    "-w",
+    help="The number of boards exported in parallel, each in its own process with its own copy of the sentence model. Defaults to what the CPU count and the physical memory allow.",
+    type=int,
+    default=None,
+)
+def exporter(
+    board: str | None,
+    output: str | None,
+    snapshots: str | None,
+    from_cache: bool,
+    workers: int | None,
+):
+    """Export parsed topics, posts, reply links and the asset manifest for a Discourse bulk import."""
+    boards = board.split(",") if board else list_boards(snapshots)
+    output = output or EXPORT_DIRECTORY
+    os.makedirs(output, exist_ok=True)
+    # 大版块先开始，避免最后只剩一个进程在跑
+    if snapshots:
+        boards.sort(
+            key=lambda b: os.path.getsize(os.path.join(snapshots, f"{b}.snap")),
+            reverse=True,
+        )
+    workers = min(workers or default_workers(), len(boards))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [
+            pool.submit(export_board, b, output, snapshots, from_cache) for b in boards
+        ]
+        for future in as_completed(futures):
+            name, topics, posts, failed, elapsed = future.result()
+            print(
+                f"{name}: {topics} topics, {posts} posts, {failed} dead letters "
+                f"in {elapsed:.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    exporter()
@@ -1,9 +1,14 @@
 import asyncio
+import hashlib
 import itertools
 import json
 import logging
 import os
+import random
+import re
 import sys
+import unicodedata
+from collections import Counter, defaultdict
 from dataclasses import dataclass
 from datetime import datetime
 
@@ -36,6 +41,105 @@ class Reid:
         return f"Reid(reid={self.reid}, title={self.title}, author={self.author}, section={self.section})"
 
 
+# 标题开头的回复、转载标记，可以重复出现，例如 "Re: Re: [转载] xxx"
+TITLE_PREFIX_RE = re.compile(
+    r"^(?:\s*(?:re|回复|答复|fw|fwd|转载|转)\s*[:：]|\s*[\[(]转载[\])])+", re.IGNORECASE
+)
+# 标题中任意位置的转载、合集标签，例如 "【合集】xxx"、"xxx [转载]"
+TITLE_TAG_RE = re.compile(r"[\[(【](?:转载|合集)[\])】]")
+TITLE_NOISE_RE = re.compile(r"[\W_]+")
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_title(title: str) -> str:
+    """全角转半角、去掉回复与转载前缀、转载与合集标签和所有标点空白，只保留用于比较的文字"""
+    title = unicodedata.normalize("NFKC", title)
+    title = TITLE_PREFIX_RE.sub("", title)
+    title = TITLE_TAG_RE.sub("", title)
+    return TITLE_NOISE_RE.sub("", title).lower()
+
+
+def title_shingles(title: str) -> set[str]:
+    if len(title) < 2:
+        return {title}
+    return {title[i : i + 2] for i in range(len(title) - 1)}
+
+
+class TitleClusterer:
+    """
+    用 MinHash + LSH 把同一版块内几乎相同的标题聚成一类。
+
+    签名分成 MINHASH_BANDS 段，每段 MINHASH_ROWS 行，任意一段完全相同的两个标题成为候选，
+    再用真实的 Jaccard 相似度确认，最后用并查集合并，避免两两比较。
+    """
+
+    threshold: float
+    coefficients: list[tuple[int, int]]
+
+    def __init__(self, threshold: float = 0.7, seed: int = 0x5EED):
+        self.threshold = threshold
+        rng = random.Random(seed)
+        self.coefficients = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(MINHASH_BANDS * MINHASH_ROWS)
+        ]
+
+    def signature(self, shingles: set[str]) -> list[int]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+            for s in shingles
+        ]
+        return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.coefficients]
+
+    def cluster(self, reids: list[Reid]) -> list[list[Reid]]:
+        """返回聚类结果，每一类的第一个元素（reid 最小的）作为代表"""
+        titles = [normalize_title(r.title) for r in reids]
+        shingles = [title_shingles(t) for t in titles]
+        parent = list(range(len(reids)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i: int, j: int):
+            i, j = find(i), find(j)
+            if i != j:
+                parent[max(i, j)] = min(i, j)
+
+        # 规范化后完全相同的标题直接合并，空标题不参与聚类
+        exact: dict[str, int] = {}
+        buckets: defaultdict[tuple, list[int]] = defaultdict(list)
+        for i, title in enumerate(titles):
+            if not title:
+                continue
+            if title in exact:
+                union(exact[title], i)
+                continue
+            exact[title] = i
+            sig = self.signature(shingles[i])
+            for band in range(MINHASH_BANDS):
+                rows = sig[band * MINHASH_ROWS : (band + 1) * MINHASH_ROWS]
+                buckets[(band, *rows)].append(i)
+
+        for members in buckets.values():
+            for i, j in itertools.combinations(members, 2):
+                if find(i) == find(j):
+                    continue
+                a, b = shingles[i], shingles[j]
+                if len(a & b) / len(a | b) >= self.threshold:
+                    union(i, j)
+
+        groups: dict[int, list[Reid]] = {}
+        # reid 是数字字符串，按数值排序，"999" 排在 "1000" 之前
+        for i in sorted(range(len(reids)), key=lambda i: int(reids[i].reid)):
+            groups.setdefault(find(i), []).append(reids[i])
+        return list(groups.values())
+
+
 class ReidFilter:
     def __init__(
         self,
@@ -43,12 +147,17 @@ class ReidFilter:
         llm_api_key: str | None = None,
         llm_base_url: str | None = None,
         llm_model: str = "qwen-plus",
+        cluster_threshold: float | None = 0.7,
     ):
         self.redis_url: str = redis_url
         self.llm_api_key: str | None = llm_api_key
         self.llm_base_url: str | None = llm_base_url
         self.llm_model: str = llm_model
         self.redis_client: redis.Redis | None = None
+        # 为 None 时不聚类，每个标题单独交给 LLM
+        self.clusterer: TitleClusterer | None = (
+            TitleClusterer(cluster_threshold) if cluster_threshold is not None else None
+        )
 
     async def connect_redis(self):
         """连接Redis数据库"""
@@ -103,6 +212,27 @@ class ReidFilter:
             groups[section].append(reid)
         return groups
 
+    def cluster_reids(self, board: str, reids: list[Reid], limit: int) -> list[list[Reid]]:
+        """把近似重复的标题聚类，并在日志中记录节省的 LLM 请求数与各类大小"""
+        if not self.clusterer:
+            return [[reid] for reid in reids]
+        clusters = self.clusterer.cluster(reids)
+        saved_lines = len(reids) - len(clusters)
+        saved_calls = -(-len(reids) // limit) - -(-len(clusters) // limit)
+        sizes = Counter(len(c) for c in clusters)
+        logging.info(
+            f"{board}: {len(reids)} 个帖子聚为 {len(clusters)} 类，"
+            f"节省 {saved_lines} 行提示、{saved_calls} 次LLM请求"
+        )
+        logging.info(
+            f"{board}: 聚类大小分布 "
+            + ", ".join(f"{size}:{count}" for size, count in sorted(sizes.items()))
+        )
+        for c in sorted(clusters, key=len, reverse=True)[:10]:
+            if len(c) > 1:
+                logging.info(f"{board}: 聚类 {len(c)} 个，代表 {c[0]}")
+        return clusters
+
     def save_llm_results(
         self,
         board: str,
@@ -273,12 +403,15 @@ async def main():
 
     async def process_one_board(filter: ReidFilter, board: str, limit=20):
         reids = await filter.get_batch_reids(board)  # 限制数量用于测试
+        # 每一类只把代表交给 LLM，判定结果应用到同类的所有帖子
+        clusters = {c[0].reid: c for c in filter.cluster_reids(board, reids, limit)}
+        representatives = [c[0] for c in clusters.values()]
         filtered_reids = []
         sus_reids = []
-        total_batches = (len(reids) + limit - 1) // limit
+        total_batches = (len(representatives) + limit - 1) // limit
         async with semaphore:
             for reid_list in tqdm(
-                itertools.batched(reids, limit),
+                itertools.batched(representatives, limit),
                 total=total_batches,
                 desc=board,
                 unit="batch",
@@ -287,8 +420,10 @@ async def main():
                 filtered_reids_list, sus_reid_list = await filter.filter_with_llm(
                     list(reid_list)
                 )
-                filtered_reids.extend(filtered_reids_list)
-                sus_reids.extend(sus_reid_list)
+                for reid in filtered_reids_list:
+                    filtered_reids.extend(clusters[reid.reid])
+                for reid in sus_reid_list:
+                    sus_reids.extend(clusters[reid.reid])
             await filter.save_filtered_workset(board, filtered_reids, "valuable")
             await filter.save_filtered_workset(board, sus_reids, "suspicious")
         return filtered_reids, sus_reids
@@ -5,6 +5,7 @@ go 1.25.3
 require (
 	github.com/cheggaaa/pb/v3 v3.1.7
 	github.com/gocolly/colly/v2 v2.2.0
+	github.com/klauspost/compress v1.16.7
 	github.com/redis/rueidis v1.0.67
 	github.com/spf13/viper v1.21.0
 	github.com/urfave/cli/v3 v3.5.0
@@ -28,7 +29,6 @@ require (
 	github.com/golang/protobuf v1.5.4 // indirect
 	github.com/golang/snappy v1.0.0 // indirect
 	github.com/kennygrant/sanitize v1.2.4 // indirect
-	github.com/klauspost/compress v1.16.7 // indirect
 	github.com/mattn/go-colorable v0.1.14 // indirect
 	github.com/mattn/go-isatty v0.0.20 // indirect
 	github.com/mattn/go-runewidth v0.0.16 // indirect
@@ -6,3 +6,12 @@ type Post struct {
 	Pages     []string  `bson:"pages"`
 	Section   string    `bson:"section"`
 }
+
+// CompressedPost 的每一页都用 Codec 对应的 zstd 字典压缩
+type CompressedPost struct {
+	Reid    string   `bson:"reid"`
+	Title   string   `bson:"title"`
+	Pages   [][]byte `bson:"pages"`
+	Section string   `bson:"section"`
+	Codec   string   `bson:"codec"`
+}
@@ -0,0 +1,51 @@
+package storage
+
+import (
+	"context"
+	"errors"
+
+	"github.com/klauspost/compress/zstd"
+	"go.mongodb.org/mongo-driver/v2/bson"
+	"go.mongodb.org/mongo-driver/v2/mongo"
+	"go.mongodb.org/mongo-driver/v2/mongo/options"
+)
+
+// 与 pypkg/codec.py 保持一致
+const (
+	codecCollection = "_codecs"
+	codecLevel      = 9
+)
+
+type PageCodec struct {
+	DictID     string `bson:"dict_id"`
+	Dictionary []byte `bson:"dictionary"`
+	encoder    *zstd.Encoder
+}
+
+// loadCodec 读取该版块最新训练的字典，没有训练过时返回 nil，页面按原样写入
+func loadCodec(db *mongo.Database, section string) *PageCodec {
+	var codec PageCodec
+	err := db.Collection(codecCollection).FindOne(
+		context.Background(),
+		bson.D{{Key: "board", Value: section}},
+		options.FindOne().SetSort(bson.D{{Key: "created_at", Value: -1}}),
+	).Decode(&codec)
+	if errors.Is(err, mongo.ErrNoDocuments) {
+		return nil
+	}
+	if err != nil {
+		panic(err)
+	}
+	codec.encoder, err = zstd.NewWriter(nil,
+		zstd.WithEncoderDict(codec.Dictionary),
+		zstd.WithEncoderLevel(zstd.EncoderLevelFromZstd(codecLevel)),
+	)
+	if err != nil {
+		panic(err)
+	}
+	return &codec
+}
+
+func (c *PageCodec) Encode(page string) ([]byte, error) {
+	return c.encoder.EncodeAll([]byte(page), nil), nil
+}
@@ -12,6 +12,7 @@ import (
 type PostStorage struct {
 	c       *mongo.Collection
 	section string
+	codec   *PageCodec
 }
 
 func NewPostStorage(section string) *PostStorage {
@@ -24,12 +25,31 @@ func NewPostStorage(section string) *PostStorage {
 	return &PostStorage{
 		c:       c,
 		section: section,
+		codec:   loadCodec(c.Database(), section),
 	}
 }
 
 func (s *PostStorage) InsertPost(post *models.Post) error {
 	ctx := context.Background()
-	_, err := s.c.InsertOne(ctx, post)
+	if s.codec == nil {
+		_, err := s.c.InsertOne(ctx, post)
+		return err
+	}
+	pages := make([][]byte, len(post.Pages))
+	for i, page := range post.Pages {
+		data, err := s.codec.Encode(page)
+		if err != nil {
+			return err
+		}
+		pages[i] = data
+	}
+	_, err := s.c.InsertOne(ctx, &models.CompressedPost{
+		Reid:    post.Reid,
+		Title:   post.Title,
+		Pages:   pages,
+		Section: post.Section,
+		Codec:   s.codec.DictID,
+	})
 	return err
 }
 
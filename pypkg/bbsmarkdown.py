@@ -0,0 +1,147 @@
+import html
+import re
+
+import markdownify
+
+# SJTUBBS 的 <pre> 正文中只会出现 font/a/img/br 这几种标签，其余情况交给 markdownify 处理
+VOID_TAGS = {"img", "br"}
+
+TAG_RE = re.compile(r"<(/?)(font|a|img|br)\b([^<>]*)>", re.IGNORECASE)
+MARKUP_RE = re.compile(r"<[a-zA-Z/!?]")
+ATTR_RE = re.compile(
+    r"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?"""
+)
+NEWLINE_WHITESPACE_RE = re.compile(r"[\t \r\n]*[\r\n][\t \r\n]*")
+WHITESPACE_RE = re.compile(r"[\t ]+")
+EXTRACT_NEWLINES_RE = re.compile(r"^(\n*)((?:.*[^\n])?)(\n*)$", flags=re.DOTALL)
+
+
+class UnsupportedMarkup(Exception):
+    pass
+
+
+class Element:
+    name: str
+    attrs: dict[str, str]
+    children: list["Element | str"]
+
+    def __init__(self, name: str, attrs: dict[str, str] | None = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.children = []
+
+
+def parse_attrs(raw: str) -> dict[str, str]:
+    attrs: dict[str, str] = {}
+    for m in ATTR_RE.finditer(raw.rstrip("/")):
+        value = m[2] if m[2] is not None else m[3] if m[3] is not None else m[4]
+        attrs[m[1].lower()] = html.unescape(value) if value is not None else ""
+    return attrs
+
+
+def add_text(parent: Element, text: str) -> None:
+    # html.parser 对正文中 & 的处理与 html.unescape 并不一致，含 & 的片段直接回退
+    if "&" in text or MARKUP_RE.search(text):
+        raise UnsupportedMarkup(text)
+    if text:
+        parent.children.append(text)
+
+
+def parse(source: str) -> Element:
+    """按 html.parser 的规则把仅含 font/a/img/br 的片段解析成简单的树"""
+    root = Element("[document]")
+    stack = [root]
+    pos = 0
+    for m in TAG_RE.finditer(source):
+        add_text(stack[-1], source[pos : m.start()])
+        pos = m.end()
+        closing, name, raw_attrs = m[1], m[2].lower(), m[3]
+        if closing:
+            # 与 BeautifulSoup 一致：关闭到最近的同名标签，找不到则忽略
+            for i in range(len(stack) - 1, 0, -1):
+                if stack[i].name == name:
+                    del stack[i:]
+                    break
+            continue
+        element = Element(name, parse_attrs(raw_attrs))
+        stack[-1].children.append(element)
+        if name not in VOID_TAGS and not raw_attrs.rstrip().endswith("/"):
+            stack.append(element)
+    add_text(stack[-1], source[pos:])
+    return root
+
+
+def escape(text: str) -> str:
+    text = NEWLINE_WHITESPACE_RE.sub("\n", text)
+    text = WHITESPACE_RE.sub(" ", text)
+    return text.replace("*", r"\*").replace("_", r"\_")
+
+
+def chomp(text: str) -> tuple[str, str, str]:
+    prefix = " " if text and text[0] == " " else ""
+    suffix = " " if text and text[-1] == " " else ""
+    return prefix, suffix, text.strip()
+
+
+def render(element: Element) -> str:
+    """与 markdownify 默认选项下的输出逐字一致"""
+    child_strings = [
+        escape(child) if isinstance(child, str) else render(child)
+        for child in element.children
+    ]
+
+    # 在子节点边界处合并换行，最多保留两个
+    collapsed = [""]
+    for child_string in child_strings:
+        if not child_string:
+            continue
+        leading_nl, content, trailing_nl = EXTRACT_NEWLINES_RE.match(
+            child_string
+        ).groups()
+        if collapsed[-1] and leading_nl:
+            prev_trailing_nl = collapsed.pop()
+            leading_nl = "\n" * min(2, max(len(prev_trailing_nl), len(leading_nl)))
+        collapsed.extend([leading_nl, content, trailing_nl])
+    text = "".join(collapsed)
+
+    match element.name:
+        case "[document]":
+            return text.strip("\n")
+        case "br":
+            return "  \n"
+        case "img":
+            alt = element.attrs.get("alt") or ""
+            src = element.attrs.get("src") or ""
+            title = element.attrs.get("title") or ""
+            title_part = ' "%s"' % title.replace('"', r"\"") if title else ""
+            return "![%s](%s%s)" % (alt, src, title_part)
+        case "a":
+            prefix, suffix, text = chomp(text)
+            if not text:
+                return ""
+            href = element.attrs.get("href")
+            title = element.attrs.get("title")
+            if text.replace(r"\_", "_") == href and not title:
+                return "<%s>" % href
+            if not href:
+                return text
+            title_part = ' "%s"' % title.replace('"', r"\"") if title else ""
+            return "%s[%s](%s%s)%s" % (prefix, text, href, title_part, suffix)
+        case _:
+            return text
+
+
+def bbs_markdownify(source: str) -> str:
+    """
+    将 <pre> 中的 BBS 正文转换为 markdown，输出与 markdownify.markdownify 相同。
+
+    输入须是 BeautifulSoup 序列化后的片段（Parser.to_raw_html），属性值总是带双引号、
+    其中的引号与 & 已经转义；tests/test_bbsmarkdown.py 在随机生成的片段上对比两者。
+
+    不再重新构建 BeautifulSoup，而是直接在字符串上识别 font/a/img/br 四种标签；
+    遇到其他标签、注释等无法确定语义的内容时回退到 markdownify。
+    """
+    try:
+        return render(parse(source))
+    except UnsupportedMarkup:
+        return markdownify.markdownify(source)
@@ -0,0 +1,353 @@
+import csv
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .models.postgres import DEFERRED_DDL_LOCK, make_engine
+from .parser import ParsedTopic
+from .search import segment
+from .threadtree import thread_tree
+
+TARGET_TABLES = ["authors", "boards", "topics", "posts"]
+
+# 暂存表由所有版块共用，同一时间只能有一个批量加载
+STAGING_LOCK = 0x5354_4147
+
+STAGING_DDL = """
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_topics (
+    reid integer,
+    board text,
+    author text,
+    title text,
+    content text,
+    created_at timestamp,
+    search_text text,
+    embedding text,
+    original_reid integer
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_posts (
+    reid integer,
+    seq integer,
+    author text,
+    content text,
+    created_at timestamp,
+    reply_to_seq integer,
+    search_text text,
+    embedding text,
+    depth integer,
+    root_seq integer,
+    path text
+);
+CREATE TABLE IF NOT EXISTS staging_deferred_ddl (
+    phase integer,
+    statement text
+);
+"""
+
+# 约束与索引的定义会先保存在 staging_deferred_ddl 中，即使导入中途崩溃也能恢复
+CAPTURE_DEFERRED_SQL = """
+INSERT INTO staging_deferred_ddl (phase, statement)
+SELECT CASE c.contype WHEN 'f' THEN 2 ELSE 1 END,
+       format('ALTER TABLE %%s ADD CONSTRAINT %%I %%s',
+              c.conrelid::regclass, c.conname, pg_get_constraintdef(c.oid))
+FROM pg_constraint c
+WHERE c.conrelid = ANY(%(tables)s::regclass[]) AND c.contype IN ('f', 'u')
+UNION ALL
+-- make_engine 可能已经补建了同名索引，恢复时跳过
+SELECT 1, regexp_replace(pg_get_indexdef(i.indexrelid),
+                         '^CREATE (UNIQUE )?INDEX ', 'CREATE \\1INDEX IF NOT EXISTS ')
+FROM pg_index i
+WHERE i.indrelid = ANY(%(tables)s::regclass[])
+  AND NOT i.indisprimary
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+"""
+
+DROP_DEFERRED_SQL = """
+SELECT format('ALTER TABLE %%s DROP CONSTRAINT %%I', c.conrelid::regclass, c.conname)
+FROM pg_constraint c
+WHERE c.conrelid = ANY(%(tables)s::regclass[]) AND c.contype IN ('f', 'u')
+ORDER BY c.contype = 'u'
+"""
+
+DROP_INDEXES_SQL = """
+SELECT format('DROP INDEX %%s', i.indexrelid::regclass)
+FROM pg_index i
+WHERE i.indrelid = ANY(%(tables)s::regclass[]) AND NOT i.indisprimary
+"""
+
+# 与 import_parsed_topics 一样跳过已经导入过的 reid（reid 在所有版块中唯一）
+RESOLVE_SQL = """
+DELETE FROM staging_posts s USING topics t WHERE t.reid = s.reid;
+DELETE FROM staging_topics s USING topics t WHERE t.reid = s.reid;
+
+INSERT INTO authors (username)
+SELECT DISTINCT s.author
+FROM (SELECT author FROM staging_topics UNION SELECT author FROM staging_posts) s
+WHERE NOT EXISTS (SELECT 1 FROM authors a WHERE a.username = s.author);
+
+INSERT INTO boards (name)
+SELECT DISTINCT s.board
+FROM staging_topics s
+WHERE NOT EXISTS (SELECT 1 FROM boards b WHERE b.name = s.board);
+
+INSERT INTO topics (
+    reid, title, created_at, content, search_vector, embedding, original_reid,
+    author_id, board_id
+)
+SELECT s.reid, s.title, s.created_at, s.content,
+       to_tsvector('simple', s.search_text), s.embedding::vector, s.original_reid,
+       a.id, b.id
+FROM staging_topics s
+JOIN authors a ON a.username = s.author
+JOIN boards b ON b.name = s.board
+ORDER BY s.reid;
+
+CREATE UNLOGGED TABLE staging_posts_numbered AS
+SELECT o.*, nextval(pg_get_serial_sequence('posts', 'id')) AS id
+FROM (SELECT * FROM staging_posts ORDER BY reid, seq) o;
+CREATE INDEX ON staging_posts_numbered (reid, seq);
+ANALYZE staging_posts_numbered;
+
+INSERT INTO posts (
+    id, content, created_at, search_vector, embedding, topic_id, author_id, reply_to_id,
+    depth, root_id, path
+)
+SELECT p.id, p.content, p.created_at, to_tsvector('simple', p.search_text),
+       p.embedding::vector, t.id, a.id, r.id, p.depth, rt.id, p.path
+FROM staging_posts_numbered p
+JOIN topics t ON t.reid = p.reid
+JOIN authors a ON a.username = p.author
+LEFT JOIN staging_posts_numbered r ON r.reid = p.reid AND r.seq = p.reply_to_seq
+LEFT JOIN staging_posts_numbered rt ON rt.reid = p.reid AND rt.seq = p.root_seq
+ORDER BY p.id;
+"""
+
+
+def hold_constraints(session: Session) -> None:
+    """
+    普通导入在每个事务开始时调用：等待正在移除约束的批量加载结束，
+    并且在本事务提交之前，新的批量加载不能移除约束。
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(
+            text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": DEFERRED_DDL_LOCK}
+        )
+
+
+class BulkLoader:
+    """
+    版块首次全量导入使用的批量加载器，整个存档可以逐个版块地加载。
+
+    - 多个连接并行地将 ParsedTopic 以 COPY 写入 UNLOGGED 暂存表
+    - 用集合化的 SQL 一次性解析作者、版块、主题与 reply_to_id
+    - 只有存档还是空的时候才移除外键、唯一约束与二级索引，导入完成后再统一重建；
+      此时持有 DEFERRED_DDL_LOCK，普通导入会等待加载结束。之后的版块保留约束与索引直接加载，
+      不会每个版块都重建一遍整个存档的索引
+    - 失败时 abort() 恢复约束与索引；进程被杀掉时，下一次 prepare() 会先恢复上次留下的
+    """
+
+    dsn: str
+    workers: int
+    # 一直持有 advisory lock 的连接，关闭时锁随之释放
+    lock_conn: "psycopg2.extensions.connection | None"
+    connections: "list[psycopg2.extensions.connection]"
+    defer: bool
+
+    def __init__(self, dsn: str, workers: int = 4):
+        self.dsn = dsn
+        self.workers = workers
+        self.lock_conn = None
+        self.connections = []
+        self.defer = False
+
+    def lock(self, key: int) -> None:
+        with self.lock_conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (key,))
+
+    def unlock(self, key: int) -> None:
+        with self.lock_conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (key,))
+
+    def prepare(self, board: str) -> None:
+        try:
+            self.start(board)
+        except BaseException:
+            # 移除约束与保存定义在同一个事务中，未提交的部分随连接关闭回滚
+            self.close()
+            raise
+
+    def start(self, board: str) -> None:
+        make_engine(self.dsn).dispose()
+        self.lock_conn = psycopg2.connect(self.dsn)
+        self.lock_conn.autocommit = True
+        self.lock(STAGING_LOCK)
+        self.connections = [psycopg2.connect(self.dsn) for _ in range(self.workers)]
+        conn = self.connections[0]
+        with conn.cursor() as cur:
+            # 其他版块已经导入的数据不受影响，只要求这个版块还没有导入过
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM topics t JOIN boards b "
+                "ON b.id = t.board_id WHERE b.name = %s)",
+                (board,),
+            )
+            if cur.fetchone()[0]:
+                raise RuntimeError(f"bulk load requires {board} to have no topics yet")
+            cur.execute(STAGING_DDL)
+            cur.execute("TRUNCATE staging_topics, staging_posts")
+            conn.commit()
+
+        # 先等正在进行的普通导入提交，再判断存档是否为空，避免两者之间有新的主题写入
+        self.lock(DEFERRED_DDL_LOCK)
+        self.restore()
+        with conn.cursor() as cur:
+            cur.execute("SELECT NOT EXISTS (SELECT 1 FROM topics)")
+            self.defer = cur.fetchone()[0]
+            if self.defer:
+                cur.execute(CAPTURE_DEFERRED_SQL, {"tables": TARGET_TABLES})
+                for query in (DROP_DEFERRED_SQL, DROP_INDEXES_SQL):
+                    cur.execute(query, {"tables": TARGET_TABLES})
+                    for (statement,) in cur.fetchall():
+                        cur.execute(statement)
+            conn.commit()
+        if not self.defer:
+            self.unlock(DEFERRED_DDL_LOCK)
+    @staticmethod
+    def to_vector_text(embedding: list[float] | None) -> str | None:
+        if embedding is None:
+            return None
+        return "[" + ",".join(map(str, embedding)) + "]"
+
+    @staticmethod
+    def to_csv(topics: list[ParsedTopic]) -> tuple[io.StringIO, io.StringIO]:
+        topic_buf, post_buf = io.StringIO(), io.StringIO()
+        topic_writer, post_writer = csv.writer(topic_buf), csv.writer(post_buf)
+        for topic in topics:
+            topic_writer.writerow(
+                [
+                    topic.reid,
+                    topic.board,
+                    topic.author.username,
+                    topic.title,
+                    topic.content,
+                    topic.created_at.isoformat(),
+                    segment(f"{topic.title}\n{topic.content}"),
+                    BulkLoader.to_vector_text(topic.embedding),
+                    topic.original_reid,
+                ]
+            )
+            tree = thread_tree(topic.posts)
+            for seq, post in enumerate(topic.posts):
+                content = post.content if post.quote_embedded else post.text_in
+                post_writer.writerow(
+                    [
+                        topic.reid,
+                        seq,
+                        post.author.username,
+                        content,
+                        post.created_at.isoformat(),
+                        post.reply_to_id if post.reply_to_id != -1 else None,
+                        segment(content),
+                        BulkLoader.to_vector_text(post.embedding),
+                        tree[seq].depth,
+                        tree[seq].root_seq,
+                        tree[seq].path,
+                    ]
+                )
+        topic_buf.seek(0)
+        post_buf.seek(0)
+        return topic_buf, post_buf
+
+    def parallel(self, fn, shards: list) -> None:
+        """每个连接一个线程，第 i 个连接处理 shards[i]"""
+        with ThreadPoolExecutor(max_workers=len(self.connections)) as pool:
+            list(pool.map(fn, self.connections, shards))
+
+    def copy_shard(self, conn, topics: list[ParsedTopic]) -> None:
+        if not topics:
+            return
+        topic_buf, post_buf = self.to_csv(topics)
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                "COPY staging_topics FROM STDIN WITH "
+                "(FORMAT csv, FORCE_NOT_NULL (board, author, title, content))",
+                topic_buf,
+            )
+            cur.copy_expert(
+                "COPY staging_posts FROM STDIN WITH "
+                "(FORMAT csv, FORCE_NOT_NULL (author, content))",
+                post_buf,
+            )
+        conn.commit()
+
+    def load(self, topics: list[ParsedTopic]) -> None:
+        n = len(self.connections)
+        self.parallel(self.copy_shard, [topics[i::n] for i in range(n)])
+
+    def restore(self) -> None:
+        """
+        重建 staging_deferred_ddl 中的约束与索引，每条语句与删除它的记录在同一个事务中提交，
+        中途失败后再次调用只会执行剩下的语句
+        """
+
+        def run(conn, statements: list[str]) -> None:
+            with conn.cursor() as cur:
+                for statement in statements:
+                    cur.execute(statement)
+                    cur.execute(
+                        "DELETE FROM staging_deferred_ddl WHERE statement = %s",
+                        (statement,),
+                    )
+                    conn.commit()
+
+        conn = self.connections[0]
+        with conn.cursor() as cur:
+            cur.execute("SELECT phase, statement FROM staging_deferred_ddl")
+            deferred = cur.fetchall()
+        conn.commit()
+        n = len(self.connections)
+        # 先重建唯一约束与索引，外键依赖前者，放在第二阶段
+        for phase in (1, 2):
+            statements = [s for p, s in deferred if p == phase]
+            self.parallel(run, [statements[i::n] for i in range(n)])
+
+    def finish(self) -> None:
+        conn = self.connections[0]
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS staging_posts_numbered")
+            cur.execute(RESOLVE_SQL)
+        conn.commit()
+        self.restore()
+        with conn.cursor() as cur:
+            cur.execute(
+                "DROP TABLE staging_topics, staging_posts, "
+                "staging_posts_numbered, staging_deferred_ddl"
+            )
+            conn.commit()
+            conn.autocommit = True
+            for table in TARGET_TABLES:
+                cur.execute(f"ANALYZE {table}")
+        self.close()
+
+    def abort(self) -> None:
+        """加载失败时调用：暂存表中的数据还没有写入正式表，清空即可，再恢复移除的约束与索引"""
+        try:
+            for conn in self.connections:
+                conn.rollback()
+            if self.connections:
+                with self.connections[0].cursor() as cur:
+                    cur.execute("TRUNCATE staging_topics, staging_posts")
+                self.connections[0].commit()
+                self.restore()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        if self.lock_conn:
+            self.lock_conn.close()
+            self.lock_conn = None
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import zlib
+from collections.abc import Iterator
+from importlib import metadata
+
+from . import bbsmarkdown, parser
+from .parser import ParsedTopic
+
+COMMIT_INTERVAL = 200
+
+
+def parser_version() -> str:
+    """解析器相关源码与 markdownify 版本的摘要，任何一方变化都会换用新的缓存文件"""
+    h = hashlib.sha1()
+    for module in (parser, bbsmarkdown):
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    h.update(metadata.version("markdownify").encode())
+    return h.hexdigest()[:12]
+
+
+class TopicCache:
+    """
+    Parser.parse() 结果的磁盘缓存，每个版块、每个解析器版本一个 sqlite 文件。
+
+    缓存的是 ReplyOrganizer 处理之前的 ParsedTopic（pickle 后 zlib 压缩），
+    无法解析的文档缓存为 None，这样只改动回复重建或导入逻辑时可以跳过解析。
+    """
+
+    path: str
+    conn: sqlite3.Connection
+    pending: int
+
+    def __init__(self, directory: str, board: str):
+        os.makedirs(directory, exist_ok=True)
+        version = parser_version()
+        self.path = os.path.join(directory, f"{board}-{version}.sqlite3")
+        # 只清理本版块旧版本的缓存及其 WAL 文件，版块名带“-”的其他版块（如 a 与 a-b）互不影响
+        stale_re = re.compile(rf"{re.escape(board)}-[0-9a-f]{{12}}\.sqlite3(-wal|-shm)?")
+        for name in os.listdir(directory):
+            if stale_re.fullmatch(name) and not name.startswith(os.path.basename(self.path)):
+                os.remove(os.path.join(directory, name))
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS topics (reid TEXT PRIMARY KEY, data BLOB)"
+        )
+        self.pending = 0
+
+    @staticmethod
+    def encode(topic: ParsedTopic | None) -> bytes:
+        return zlib.compress(pickle.dumps(topic, pickle.HIGHEST_PROTOCOL), 1)
+
+    @staticmethod
+    def decode(data: bytes) -> ParsedTopic | None:
+        return pickle.loads(zlib.decompress(data))
+
+    def get(self, reid: str) -> ParsedTopic | None:
+        row = self.conn.execute(
+            "SELECT data FROM topics WHERE reid = ?", (reid,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(reid)
+        return self.decode(row[0])
+
+    def put(self, reid: str, topic: ParsedTopic | None) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO topics (reid, data) VALUES (?, ?)",
+            (reid, self.encode(topic)),
+        )
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self.pending = 0
+
+    def count(self, after: str | None = None) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM topics WHERE reid > ?", (after or "",)
+        ).fetchone()[0]
+
+    def items(self, after: str | None = None) -> Iterator[tuple[str, ParsedTopic | None]]:
+        cursor = self.conn.execute(
+            "SELECT reid, data FROM topics WHERE reid > ? ORDER BY reid", (after or "",)
+        )
+        for reid, data in cursor:
+            yield reid, self.decode(data)
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
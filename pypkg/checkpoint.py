@@ -0,0 +1,49 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+# reid 之后的一批文档正在导入，尚未提交
+PHASE_IMPORTING = "importing"
+# reid 及之前的文档都已提交
+PHASE_IMPORTED = "imported"
+PHASE_DONE = "done"
+
+
+@dataclass
+class Checkpoint:
+    board: str
+    # 最后一个已经提交到 postgres 的 reid，按 mongo 中 reid 的字符串顺序推进
+    reid: str | None
+    phase: str
+    updated_at: str = ""
+
+
+class CheckpointStore:
+    """每个版块一个 JSON 文件，先写临时文件再原子替换，进程在任意时刻退出都不会留下半个检查点"""
+
+    directory: str
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, board: str) -> str:
+        return os.path.join(self.directory, f"{board}.json")
+
+    def load(self, board: str) -> Checkpoint | None:
+        try:
+            with open(self.path(board), "r") as f:
+                return Checkpoint(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        checkpoint.updated_at = datetime.now().isoformat()
+        path = self.path(checkpoint.board)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(checkpoint), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
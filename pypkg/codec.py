@@ -0,0 +1,102 @@
+import hashlib
+from collections.abc import Iterable, Sequence
+from datetime import datetime
+
+import zstandard
+from bson import Binary
+
+CODEC_COLLECTION = "_codecs"
+# 与 zstd 命令行训练字典时的默认大小相同
+DICT_SIZE = 110 * 1024
+LEVEL = 9
+
+
+def train_dictionary(samples: Iterable[str], size: int = DICT_SIZE) -> bytes:
+    """用 zstd 的 COVER 算法从同一版块的样本页面训练字典，样本太少时 zstandard 会报错"""
+    return zstandard.train_dictionary(
+        size, [sample.encode() for sample in samples], level=LEVEL
+    ).as_bytes()
+
+
+class PageCodec:
+    """用同一版块训练的 zstd 字典压缩与解压页面"""
+
+    dict_id: str
+    dictionary: bytes
+    compressor: zstandard.ZstdCompressor
+    decompressor: zstandard.ZstdDecompressor
+
+    def __init__(self, dictionary: bytes):
+        self.dictionary = bytes(dictionary)
+        self.dict_id = hashlib.sha1(self.dictionary).hexdigest()[:16]
+        zdict = zstandard.ZstdCompressionDict(self.dictionary)
+        self.compressor = zstandard.ZstdCompressor(level=LEVEL, dict_data=zdict)
+        self.decompressor = zstandard.ZstdDecompressor(dict_data=zdict)
+
+    def encode(self, page: str) -> bytes:
+        return self.compressor.compress(page.encode())
+
+    def decode(self, data: bytes) -> str:
+        # 不依赖帧头中的原始长度，retriever 写入的帧同样可以解码
+        return self.decompressor.decompressobj().decompress(data).decode()
+
+
+_codecs: dict[str, PageCodec] = {}
+
+
+def register_codec(codec: PageCodec) -> None:
+    _codecs[codec.dict_id] = codec
+
+
+def lookup_codec(dict_id: str) -> PageCodec:
+    return _codecs[dict_id]
+
+
+def load_codecs(db, board: str) -> PageCodec | None:
+    """注册该版块保存过的所有字典，返回最新的一个用于写入"""
+    latest = None
+    cursor = db.get_collection(CODEC_COLLECTION).find({"board": board})
+    for doc in cursor.sort("created_at", 1):
+        latest = PageCodec(bytes(doc["dictionary"]))
+        register_codec(latest)
+    return latest
+
+
+def save_codec(db, board: str, codec: PageCodec) -> None:
+    db.get_collection(CODEC_COLLECTION).update_one(
+        {"board": board, "dict_id": codec.dict_id},
+        {
+            "$setOnInsert": {
+                "dictionary": Binary(codec.dictionary),
+                "created_at": datetime.now(),
+            }
+        },
+        upsert=True,
+    )
+    register_codec(codec)
+
+
+class LazyPages(Sequence[str]):
+    """按需解码的页面列表，只有被访问到的页面才会被解码；codec 为 None 时页面是未压缩的 UTF-8"""
+
+    raw: Sequence[bytes | memoryview]
+    codec: PageCodec | None
+    decoded: list[str | None]
+
+    def __init__(self, raw: Sequence[bytes | memoryview], codec: PageCodec | None):
+        self.raw = raw
+        self.codec = codec
+        self.decoded = [None] * len(raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        page = self.decoded[i]
+        if page is None:
+            raw = self.raw[i]
+            page = self.codec.decode(raw) if self.codec else str(raw, "utf-8")
+            self.decoded[i] = page
+        return page
@@ -0,0 +1,145 @@
+import json
+import os
+import traceback
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+import redis
+
+STAGE_PARSE = "parse"
+STAGE_ORGANIZE = "organize"
+STAGE_IMPORT = "import"
+
+
+@dataclass
+class DeadLetter:
+    board: str
+    reid: str
+    stage: str
+    error: str
+    traceback: str
+    failed_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    @classmethod
+    def from_exception(
+        cls, board: str, reid, stage: str, e: BaseException
+    ) -> "DeadLetter":
+        return cls(
+            board=board,
+            reid=str(reid),
+            stage=stage,
+            error=f"{type(e).__name__}: {e}",
+            traceback="".join(traceback.format_exception(e)),
+        )
+
+
+class JsonlDeadLetters:
+    """
+    单机导入使用的死信文件，每个版块一个 JSONL。
+
+    文件只追加：失败写入一条 DeadLetter，重试成功后写入一条 {"reid", "resolved": true}，
+    读取时以每个 reid 的最后一条记录为准，进程在任意时刻退出都不会丢失死信。
+    """
+
+    board: str
+    path: str
+
+    def __init__(self, directory: str, board: str):
+        os.makedirs(directory, exist_ok=True)
+        self.board = board
+        self.path = os.path.join(directory, f"{board}.jsonl")
+
+    @property
+    def location(self) -> str:
+        return self.path
+
+    def add(self, letter: DeadLetter) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps(asdict(letter), ensure_ascii=False) + "\n")
+
+    def pending(self) -> dict[str, DeadLetter]:
+        letters: dict[str, DeadLetter] = {}
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get("resolved"):
+                        letters.pop(entry["reid"], None)
+                    else:
+                        letters[entry["reid"]] = DeadLetter(**entry)
+        except FileNotFoundError:
+            pass
+        return letters
+
+    def resolve(self, reids: Iterable[str]) -> None:
+        with open(self.path, "a") as f:
+            for reid in reids:
+                f.write(json.dumps({"reid": str(reid), "resolved": True}) + "\n")
+
+
+class RedisDeadLetters:
+    """多机 worker 共用的死信，保存在 redis 哈希 deadletter:<board> 中，reid -> 最近一次失败"""
+
+    client: redis.Redis
+    board: str
+    key: str
+
+    def __init__(self, client: redis.Redis, board: str):
+        self.client = client
+        self.board = board
+        self.key = f"deadletter:{board}"
+
+    @property
+    def location(self) -> str:
+        return f"redis {self.key}"
+
+    def add(self, letter: DeadLetter) -> None:
+        raw = json.dumps(asdict(letter), ensure_ascii=False)
+        self.client.hset(self.key, letter.reid, raw)
+
+    def pending(self) -> dict[str, DeadLetter]:
+        return {
+            reid.decode(): DeadLetter(**json.loads(raw))
+            for reid, raw in self.client.hgetall(self.key).items()
+        }
+
+    def resolve(self, reids: Iterable[str]) -> None:
+        reids = [str(reid) for reid in reids]
+        if reids:
+            self.client.hdel(self.key, *reids)
+
+
+class DeadLetterSink:
+    """
+    导入流程中各阶段共用的死信入口。
+
+    retrying 为 --retry-dead-letters 重新处理的 reid，settle() 时其中本次没有再失败的
+    会被标记为已解决；再次失败的保留最新的错误。
+    """
+
+    store: JsonlDeadLetters | RedisDeadLetters
+    retrying: set[str]
+    failed: set[str]
+    total: int
+
+    def __init__(
+        self, store: JsonlDeadLetters | RedisDeadLetters, retrying: Iterable[str] = ()
+    ):
+        self.store = store
+        self.retrying = set(map(str, retrying))
+        self.failed = set()
+        self.total = 0
+
+    def record(self, reid, stage: str, e: BaseException) -> None:
+        letter = DeadLetter.from_exception(self.store.board, reid, stage, e)
+        print(f"Dead letter {letter.reid} ({stage}): {letter.error}")
+        self.store.add(letter)
+        self.failed.add(letter.reid)
+        self.total += 1
+
+    def settle(self, reids: Iterable[str]) -> None:
+        """一批文档导入完成后调用"""
+        if self.retrying:
+            reids = set(map(str, reids)) & self.retrying
+            self.store.resolve(sorted(reids - self.failed))
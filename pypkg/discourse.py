@@ -0,0 +1,195 @@
+import os
+import sqlite3
+
+from .organize import REID_PREFIX_RE, strip_quote_blocks
+from .parser import ParsedAuthor, ParsedTopic
+
+# 与 TopicCache 相同，攒够一定数量的主题再提交，内存中只保留当前事务
+COMMIT_INTERVAL = 500
+
+# 表结构参照 Discourse generic bulk importer 的中间库，id 使用原站的 reid 与用户名
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    name TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    category_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    original_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    topic_id INTEGER NOT NULL,
+    post_number INTEGER NOT NULL,
+    reply_to_post_number INTEGER,
+    user_id TEXT NOT NULL,
+    raw TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    topic_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    path TEXT NOT NULL,
+    present INTEGER NOT NULL
+);
+"""
+
+
+def post_id(reid, post_number: int) -> str:
+    return f"{reid}-{post_number}"
+
+
+class DiscourseShard:
+    """
+    一个版块的 Discourse 导入文件。
+
+    主题帖为 post_number 1，第 i 个回帖为 i + 2；ReplyOrganizer 重建出的回复关系写入
+    reply_to_post_number。正文沿用 IndentionNode 生成的 [quote="author"] 标记，
+    图片在正文中已经指向 asset_uri_base，uploads 记录它与原始地址、本地文件的对应关系。
+    先写入 <path>.tmp，close() 时才替换为正式文件，中断的导出不会留下半个分片。
+    """
+
+    board: str
+    path: str
+    asset_directory: str
+    asset_uri_base: str
+    conn: sqlite3.Connection
+    pending: int
+    topics: int
+    posts: int
+
+    def __init__(
+        self, path: str, board: str, asset_directory: str, asset_uri_base: str
+    ):
+        self.board = board
+        self.path = path
+        self.asset_directory = asset_directory
+        self.asset_uri_base = asset_uri_base
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(
+            "INSERT INTO categories (id, name) VALUES (?, ?)", (board, board)
+        )
+        self.pending = 0
+        self.topics = 0
+        self.posts = 0
+
+    @property
+    def tmp_path(self) -> str:
+        return self.path + ".tmp"
+
+    def add_user(self, author: ParsedAuthor, created_at: str) -> str:
+        # 原站没有注册时间，以在该版块第一次发帖的时间代替
+        self.conn.execute(
+            "INSERT OR IGNORE INTO users (id, username, name, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (author.username, author.username, author.nickname, created_at),
+        )
+        return author.username
+
+    def add_post(
+        self,
+        reid,
+        post_number: int,
+        reply_to: int | None,
+        author: ParsedAuthor,
+        raw: str,
+        created_at: str,
+    ) -> None:
+        user_id = self.add_user(author, created_at)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                post_id(reid, post_number),
+                reid,
+                post_number,
+                reply_to,
+                user_id,
+                raw,
+                created_at,
+            ),
+        )
+        self.posts += 1
+
+    def add_upload(self, reid, url: str) -> None:
+        filename = url.split("/")[-1]
+        path = os.path.join(self.asset_directory, filename)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO uploads VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                f"{self.board}/{filename}",
+                reid,
+                url,
+                f"{self.asset_uri_base}/{self.board}/{filename}",
+                path,
+                os.path.exists(path),
+            ),
+        )
+
+    def add(self, topic: ParsedTopic) -> None:
+        created_at = topic.created_at.isoformat()
+        user_id = self.add_user(topic.author, created_at)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO topics VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                topic.reid,
+                topic.title,
+                self.board,
+                user_id,
+                created_at,
+                topic.original_reid,
+            ),
+        )
+        # reid 已经作为主题的 id 导出，去掉解析器写在正文开头的 reid
+        raw = REID_PREFIX_RE.sub("", topic.content)
+        self.add_post(topic.reid, 1, None, topic.author, raw, created_at)
+        for seq, post in enumerate(topic.posts):
+            reply_to = post.reply_to_id + 2 if post.reply_to_id != -1 else None
+            raw = post.content
+            # 回复关系已经由 reply_to_post_number 表达时去掉引文块，只保留作者本人的完整正文；
+            # 嵌入了多层引文或没有找到被回复帖子的回帖保留原样
+            if reply_to is not None and not post.quote_embedded:
+                raw = strip_quote_blocks(raw).strip("\n")
+            self.add_post(
+                topic.reid,
+                seq + 2,
+                reply_to,
+                post.author,
+                raw,
+                post.created_at.isoformat(),
+            )
+        for url in topic.assets:
+            self.add_upload(topic.reid, url)
+        self.topics += 1
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.conn.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        self.conn.close()
+        os.remove(self.tmp_path)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+import redis
+
+
+class ServerUnavailable(Exception):
+    pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def require(binary: str) -> str:
+    path = shutil.which(binary)
+    if path is None:
+        raise ServerUnavailable(f"{binary} is not on PATH")
+    return path
+
+
+class LocalRedis:
+    """在临时端口上启动一个不落盘的 redis-server，退出时关闭"""
+
+    url: str
+    process: subprocess.Popen | None
+
+    def __init__(self):
+        self.url = ""
+        self.process = None
+
+    def __enter__(self) -> "LocalRedis":
+        port = free_port()
+        self.process = subprocess.Popen(
+            [require("redis-server"), "--port", str(port)]
+            + ["--save", "", "--appendonly", "no"],
+            stdout=subprocess.DEVNULL,
+        )
+        self.url = f"redis://127.0.0.1:{port}"
+        client = redis.Redis.from_url(self.url)
+        for _ in range(100):
+            try:
+                client.ping()
+                return self
+            except redis.ConnectionError:
+                time.sleep(0.05)
+        self.__exit__()
+        raise ServerUnavailable("redis-server did not start")
+
+    def __exit__(self, *exc) -> None:
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+class LocalPostgres:
+    """
+    用 initdb 在临时目录中建一个只监听 unix socket 的 postgres 实例，退出时删除。
+
+    pg_trgm 与 pgvector 需要已经安装在这份 postgres 中。
+    """
+
+    dsn: str
+    directory: str
+
+    def __init__(self):
+        self.dsn = ""
+        self.directory = ""
+
+    def __enter__(self) -> "LocalPostgres":
+        initdb, pg_ctl = require("initdb"), require("pg_ctl")
+        self.directory = tempfile.mkdtemp(prefix="bench-pg-")
+        data = os.path.join(self.directory, "data")
+        subprocess.run(
+            [initdb, "-D", data, "-U", "bench", "--auth=trust", "--no-sync"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        port = free_port()
+        options = f"-p {port} -k {self.directory} -c listen_addresses='' -c fsync=off"
+        log = os.path.join(self.directory, "log")
+        subprocess.run(
+            [pg_ctl, "-D", data, "-o", options, "-l", log, "-w", "start"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        self.dsn = f"postgresql://bench@/postgres?host={self.directory}&port={port}"
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.directory:
+            data = os.path.join(self.directory, "data")
+            subprocess.run(
+                [require("pg_ctl"), "-D", data, "-m", "immediate", "stop"],
+                stdout=subprocess.DEVNULL,
+            )
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = ""
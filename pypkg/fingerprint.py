@@ -0,0 +1,155 @@
+import hashlib
+import json
+import re
+import unicodedata
+from collections.abc import Iterable
+
+import redis
+
+from .organize import topic_body
+from .parser import ParsedTopic
+
+FINGERPRINT_BITS = 64
+# 4 段各 16 位：汉明距离不超过 3 的两个指纹至少有一段完全相同
+BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // BANDS
+MAX_DISTANCE = 3
+SHINGLE_SIZE = 3
+# 规范化后过短的正文（“如题”“rt”之类）不做比较，避免误判
+MIN_LENGTH = 30
+
+# 图片地址里带着版块名，同一篇文章转载到不同版块后地址不同
+IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+NOISE_RE = re.compile(r"[\W_]+")
+
+
+def normalize_body(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    text = IMAGE_RE.sub("", text)
+    return NOISE_RE.sub("", text).lower()
+
+
+def simhash(text: str) -> int | None:
+    """正文按字符 3-gram 计算的 64 位 SimHash，正文过短时返回 None"""
+    body = normalize_body(text)
+    if len(body) < MIN_LENGTH:
+        return None
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+        for s in {body[i : i + SHINGLE_SIZE] for i in range(len(body) - SHINGLE_SIZE + 1)}
+    ]
+    threshold = len(hashes) / 2
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if sum((h >> bit) & 1 for h in hashes) > threshold:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class FingerprintIndex:
+    """
+    跨版块共享的正文指纹索引，保存在 redis 中，所有版块的导入进程与 worker 共用。
+
+    - fingerprint:topics 记录每个原帖的版块与指纹
+    - fingerprint:band:<i>:<value> 为指纹第 i 段等于 value 的原帖 reid 集合
+    - fingerprint:seen:<board> / fingerprint:dups:<board> 用于统计各版块的重复率
+
+    只有导入提交之后的原帖才会被 register() 加入索引，先被导入的一份视为原帖，导入失败或
+    --dryrun 的主题不会留在索引中；同一批次或两个进程同时处理同一篇文章的两份拷贝时，
+    两份都可能被当作原帖，只是少去重一次，不影响正确性。
+    """
+
+    client: redis.Redis
+    max_distance: int
+
+    def __init__(self, client: redis.Redis, max_distance: int = MAX_DISTANCE):
+        self.client = client
+        self.max_distance = max_distance
+
+    @staticmethod
+    def bands(fingerprint: int) -> list[str]:
+        mask = (1 << BAND_BITS) - 1
+        return [
+            f"fingerprint:band:{i}:{(fingerprint >> (i * BAND_BITS)) & mask:04x}"
+            for i in range(BANDS)
+        ]
+
+    def lookup(self, fingerprint: int, reid: int) -> tuple[int, str] | None:
+        """返回与指纹最接近的其他原帖 (reid, board)"""
+        pipe = self.client.pipeline(transaction=False)
+        for key in self.bands(fingerprint):
+            pipe.smembers(key)
+        candidates = set().union(*pipe.execute()) - {str(reid).encode()}
+        if not candidates:
+            return None
+        candidates = sorted(candidates, key=int)
+        best = None
+        for candidate, raw in zip(
+            candidates, self.client.hmget("fingerprint:topics", candidates)
+        ):
+            if raw is None:
+                continue
+            entry = json.loads(raw)
+            distance = hamming(fingerprint, entry["fingerprint"])
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, int(candidate), entry["board"])
+        return best[1:] if best else None
+
+    def register(self, originals: Iterable[tuple[int, str, int]]) -> None:
+        """登记已经导入提交的原帖，参数为 originals() 的结果"""
+        pipe = self.client.pipeline(transaction=False)
+        for reid, board, fingerprint in originals:
+            pipe.hset(
+                "fingerprint:topics",
+                str(reid),
+                json.dumps({"board": board, "fingerprint": fingerprint}),
+            )
+            for key in self.bands(fingerprint):
+                pipe.sadd(key, str(reid))
+        pipe.execute()
+
+    @staticmethod
+    def originals(topics: Iterable[ParsedTopic]) -> list[tuple[int, str, int]]:
+        """check() 判定为原帖的主题的 (reid, board, fingerprint)，导入提交之后交给 register()"""
+        return [
+            (topic.reid, topic.board, topic.fingerprint)
+            for topic in topics
+            if topic.fingerprint is not None and topic.original_reid is None
+        ]
+
+    def check(self, topic: ParsedTopic) -> str | None:
+        """
+        计算主题正文的指纹并查找原帖，找到时设置 topic.original_reid 并返回原帖所在版块；
+        指纹保存在 topic.fingerprint 中，此时还不登记，见 register()
+        """
+        original = None
+        topic.fingerprint = simhash(topic_body(topic))
+        if topic.fingerprint is not None:
+            original = self.lookup(topic.fingerprint, topic.reid)
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.sadd(f"fingerprint:seen:{topic.board}", str(topic.reid))
+        if original:
+            topic.original_reid = original[0]
+            pipe.sadd(f"fingerprint:dups:{topic.board}", str(topic.reid))
+        else:
+            pipe.srem(f"fingerprint:dups:{topic.board}", str(topic.reid))
+        pipe.execute()
+        return original[1] if original else None
+
+    def report(self) -> dict[str, tuple[int, int]]:
+        """各版块 (已检查的主题数, 其中的转载/重复数)"""
+        boards = sorted(
+            key.decode().removeprefix("fingerprint:seen:")
+            for key in self.client.scan_iter("fingerprint:seen:*")
+        )
+        pipe = self.client.pipeline(transaction=False)
+        for board in boards:
+            pipe.scard(f"fingerprint:seen:{board}")
+            pipe.scard(f"fingerprint:dups:{board}")
+        counts = pipe.execute()
+        return {board: (counts[2 * i], counts[2 * i + 1]) for i, board in enumerate(boards)}
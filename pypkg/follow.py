@@ -0,0 +1,188 @@
+import json
+import os
+import time
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+
+# 单机版 mongod 不支持 change stream 时返回的错误码
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+
+# 变更事件中不需要页面内容，在服务器端去掉以免每个事件都带上整篇帖子
+CHANGE_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "replace", "update"]}}},
+    {"$project": {"fullDocument.pages": 0}},
+]
+
+
+@dataclass
+class FollowCursor:
+    board: str
+    # 最后一个已经导入的 change stream 事件，为 None 时从当前时刻开始监听
+    token: dict | None = None
+    # 轮询模式下最后一个已经导入的 reid，与检查点一样按字符串顺序推进
+    reid: str | None = None
+    updated_at: str = ""
+
+    @staticmethod
+    def path(directory: str, board: str) -> str:
+        return os.path.join(directory, f"{board}.follow.json")
+
+    @classmethod
+    def load(cls, directory: str, board: str) -> "FollowCursor":
+        try:
+            with open(cls.path(directory, board), "r") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return cls(board)
+
+    def save(self, directory: str) -> None:
+        self.updated_at = datetime.now().isoformat()
+        path = self.path(directory, self.board)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(self), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+
+@dataclass
+class FollowBatch:
+    # 按事件顺序去重后的 reid
+    reids: list[str] = field(default_factory=list)
+    # 其中内容被改写、需要删除旧主题后重新导入的 reid
+    changed: set[str] = field(default_factory=set)
+    token: dict | None = None
+
+    def add(self, reid: str, changed: bool = False) -> None:
+        if reid not in self.reids:
+            self.reids.append(reid)
+        if changed:
+            self.changed.add(reid)
+
+
+def is_content_change(change: dict) -> bool:
+    """
+    replace 与 update 事件视为帖子被重新抓取。
+
+    compressor.py 迁移页面时总会同时改写 codec 字段，这类 update 的内容并没有变化，直接忽略。
+    """
+    if change["operationType"] != "update":
+        return True
+    description = change.get("updateDescription", {})
+    touched = set(description.get("updatedFields", {})) | set(
+        description.get("removedFields", [])
+    )
+    return "codec" not in touched
+
+
+class ChangeFeed:
+    """
+    把版块集合上的新文档与改写的文档切成微批次。
+
+    优先使用 change stream（mongo 需要以副本集方式运行，单节点副本集即可）；
+    单机版 mongod 不支持时退化为按 reid 轮询，此时只能发现新文档。
+    启动时先按 reid 补上 cursor.reid 之后已经存在的文档，再开始消费事件，
+    重复的 reid 会在导入时被跳过。
+    """
+
+    collection: Collection
+    cursor: FollowCursor
+    batch_size: int
+    linger: float
+    poll_interval: float
+
+    def __init__(
+        self,
+        collection: Collection,
+        cursor: FollowCursor,
+        batch_size: int = 200,
+        linger: float = 1.0,
+        poll_interval: float = 1.0,
+    ):
+        self.collection = collection
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.linger = linger
+        self.poll_interval = poll_interval
+
+    def open_stream(self):
+        try:
+            return self.collection.watch(
+                CHANGE_PIPELINE,
+                resume_after=self.cursor.token,
+                max_await_time_ms=max(int(self.linger * 1000), 1),
+            )
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED:
+                return None
+            raise
+
+    def newer(self, after: str | None, limit: int) -> list[str]:
+        query = {"reid": {"$gt": after}} if after else {}
+        cursor = (
+            self.collection.find(query, {"_id": False, "reid": True})
+            .sort("reid", 1)
+            .limit(limit)
+        )
+        return [doc["reid"] for doc in cursor]
+
+    def catch_up(self) -> Iterator[FollowBatch]:
+        after = self.cursor.reid
+        while reids := self.newer(after, self.batch_size):
+            yield FollowBatch(reids)
+            if len(reids) < self.batch_size:
+                return
+            after = reids[-1]
+
+    def poll(self) -> Iterator[FollowBatch]:
+        while True:
+            yield from self.catch_up()
+            time.sleep(self.poll_interval)
+
+    def reid_of(self, change: dict) -> str | None:
+        if doc := change.get("fullDocument"):
+            return doc.get("reid")
+        # update 事件只带有 _id
+        doc = self.collection.find_one(
+            {"_id": change["documentKey"]["_id"]}, {"_id": False, "reid": True}
+        )
+        return doc["reid"] if doc else None
+
+    def consume(self, stream) -> Iterator[FollowBatch]:
+        while stream.alive:
+            batch = FollowBatch()
+            deadline = None
+            while len(batch.reids) < self.batch_size:
+                change = stream.try_next()
+                if change is None:
+                    if not stream.alive:
+                        break
+                    # 没有新事件时一直等待；已有事件时最多再等 linger 秒凑满批次
+                    if batch.reids and time.monotonic() >= deadline:
+                        break
+                    continue
+                if not is_content_change(change):
+                    continue
+                if reid := self.reid_of(change):
+                    batch.add(reid, change["operationType"] != "insert")
+                    deadline = deadline or time.monotonic() + self.linger
+            # 空批次的 poi 会被当成整个版块，不能交给导入流程
+            if batch.reids:
+                batch.token = stream.resume_token
+                yield batch
+
+    def batches(self) -> Iterator[FollowBatch]:
+        stream = self.open_stream()
+        if stream is None:
+            print("Change streams are not supported by this mongod, polling instead")
+            yield from self.poll()
+            return
+        with stream:
+            # stream 先于补齐打开，补齐期间写入的文档不会漏掉
+            yield from self.catch_up()
+            yield from self.consume(stream)
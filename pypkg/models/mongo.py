@@ -1,9 +1,18 @@
+from collections.abc import Sequence
 from dataclasses import dataclass
 
+from ..codec import LazyPages, lookup_codec
+
+
 @dataclass()
 class MongoPost:
     reid: str
     title: str
-    pages: list[str]
+    pages: Sequence[str]
     section: str
-    pass
+    # 页面经过 pypkg.codec 压缩时为字典的 dict_id
+    codec: str | None = None
+
+    def __post_init__(self):
+        if self.codec:
+            self.pages = LazyPages(self.pages, lookup_codec(self.codec))
@@ -1,18 +1,30 @@
 from datetime import datetime
 
+from pgvector.sqlalchemy import Vector
 from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     create_engine,
+    inspect,
+    text,
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 
 Base = declarative_base()
 
+# 批量加载移除约束与索引期间独占持有的 advisory lock，见 pypkg.bulkload
+DEFERRED_DDL_LOCK = 0x4444_4C00
+
+# paraphrase-multilingual-mpnet-base-v2 的输出维度
+EMBEDDING_DIM = 768
+
 
 class Author(Base):
     __tablename__ = "authors"
@@ -52,6 +64,12 @@ class Topic(Base):
     title = Column(String(100), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     content = Column(Text, nullable=False)
+    # 标题与正文按 pypkg.search.segment 切分后的检索向量
+    search_vector = Column(TSVECTOR)
+    # ReplyOrganizer 计算的语义向量
+    embedding = Column(Vector(EMBEDDING_DIM))
+    # 转载自其他版块时原帖的 reid，原帖可能在之后才导入，因此不设外键
+    original_reid = Column(Integer, nullable=True, index=True)
 
     author_id = Column(Integer, ForeignKey("authors.id"), nullable=False)
     board_id = Column(Integer, ForeignKey("boards.id"), nullable=False)
@@ -60,6 +78,22 @@ class Topic(Base):
     board = relationship("Board", back_populates="topics")
     posts = relationship("Post", back_populates="topic", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_topics_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_topics_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_topics_embedding",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
     def __repr__(self):
         return (
             f"<Topic(id={self.id}, title='{self.title}', author_id={self.author_id})>"
@@ -72,23 +106,99 @@ class Post(Base):
     id = Column(Integer, primary_key=True)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    search_vector = Column(TSVECTOR)
+    embedding = Column(Vector(EMBEDDING_DIM))
 
     topic_id = Column(Integer, ForeignKey("topics.id"), nullable=False)
     author_id = Column(Integer, ForeignKey("authors.id"), nullable=False)
     reply_to_id = Column(Integer, ForeignKey('posts.id'), nullable=True)  # 可为空
+    # 物化的回复树（见 pypkg.threadtree）：深度、所在回复链的最顶层回帖与楼层号路径
+    depth = Column(Integer)
+    root_id = Column(Integer, ForeignKey("posts.id"), nullable=True)
+    path = Column(Text(collation="C"))
 
     topic = relationship("Topic", back_populates="posts")
     author = relationship("Author", back_populates="posts")
 
-    parent = relationship("Post", remote_side=[id], back_populates="replies")
-    replies = relationship("Post", back_populates="parent")
+    parent = relationship(
+        "Post", remote_side=[id], back_populates="replies", foreign_keys=[reply_to_id]
+    )
+    replies = relationship("Post", back_populates="parent", foreign_keys=[reply_to_id])
+
+    __table_args__ = (
+        Index("ix_posts_topic_path", "topic_id", "path"),
+        Index("ix_posts_root_id", "root_id"),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_posts_embedding",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
 
     def __repr__(self):
         return f"<Post(id={self.id}, content='{self.content[:20]}...', topic_id={self.topic_id}, author_id={self.author_id})>"
 
 
-def make_session(postgres: str):
+def make_engine(postgres: str):
     engine = create_engine(postgres, echo=False)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
     Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
+    upgrade_schema(engine)
+    return engine
+
+
+def upgrade_statements(dialect, inspector=None) -> list[str]:
+    """
+    把模型中后来新增的列与索引补到已有的表上。
+
+    create_all 只会创建缺少的表，不会修改已有的表；这里的语句都带 IF NOT EXISTS，可以重复执行。
+    新增的列都允许为空，旧数据由相应的 backfill 填充。给出 inspector 时只生成缺少的列与索引。
+    """
+    compiler = dialect.ddl_compiler(dialect, None)
+    statements: list[str] = []
+    for table in Base.metadata.sorted_tables:
+        columns = indexes = None
+        if inspector is not None:
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for column in table.columns:
+            if column.primary_key or (columns is not None and column.name in columns):
+                continue
+            spec = compiler.get_column_specification(column)
+            for fk in column.foreign_keys:
+                spec += f" REFERENCES {fk.column.table.name} ({fk.column.name})"
+            statements.append(
+                f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {spec}"
+            )
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if indexes is not None and index.name in indexes:
+                continue
+            create = CreateIndex(index, if_not_exists=True)
+            statements.append(str(create.compile(dialect=dialect)))
+    return statements
+
+
+def upgrade_schema(engine) -> None:
+    """
+    每次连接数据库时补上缺少的列与索引，旧库无需手动升级。
+
+    表结构已是最新时不执行任何 ALTER，不会给表加锁；批量加载移除了索引时等待它结束，
+    不抢先重建被暂时移除的索引。
+    """
+    with engine.begin() as conn:
+        if not upgrade_statements(engine.dialect, inspect(conn)):
+            return
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": DEFERRED_DDL_LOCK}
+        )
+        for statement in upgrade_statements(engine.dialect, inspect(conn)):
+            conn.execute(text(statement))
+
+
+def make_session(postgres: str):
+    Session = sessionmaker(bind=make_engine(postgres))
     return Session()
@@ -1,33 +1,141 @@
+import re
+from collections import defaultdict
+
 import torch
 from sentence_transformers import SentenceTransformer, util
 
-from .parser import ParsedTopic
+from .parser import ParsedTopic, QuoteReplyTo
+
+QUOTE_BLOCK_RE = re.compile(r'\[quote="[^"]*"\](?:(?!\[quote=)[\s\S])*?\[/quote\]')
+NORMALIZE_RE = re.compile(r"[\W_]+")
+OMITTED_HINT = "以下引言省略"
+# 解析器写在主题正文开头的 reid
+REID_PREFIX_RE = re.compile(r"\Areid=\d+\n*")
+SHINGLE_SIZE = 3
+
+
+def normalize_text(text: str) -> str:
+    return NORMALIZE_RE.sub("", text).lower()
+
+
+def strip_quote_blocks(text: str) -> str:
+    # 由内向外逐层去掉 [quote] 块，只保留作者本人写下的文字
+    while True:
+        stripped = QUOTE_BLOCK_RE.sub("", text)
+        if stripped == text:
+            return text
+        text = stripped
+
+
+def topic_body(topic: ParsedTopic) -> str:
+    """主题帖的完整正文，去掉开头的 reid 与引文块，只保留作者本人写下的文字"""
+    return strip_quote_blocks(REID_PREFIX_RE.sub("", topic.content))
+
+
+def shingles(text: str) -> set[str]:
+    return {text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+class LexicalIndex:
+    """主题内的 n-gram 倒排索引，用于在调用模型之前对引用做精确匹配"""
+
+    texts: list[str]
+    usernames: list[str]
+    postings: dict[str, set[int]]
+
+    def __init__(self, topic: ParsedTopic):
+        self.texts = [normalize_text(strip_quote_blocks(topic.content))] + [
+            normalize_text(strip_quote_blocks(post.content)) for post in topic.posts
+        ]
+        self.usernames = [topic.author.username] + [
+            post.author.username for post in topic.posts
+        ]
+        self.postings = defaultdict(set)
+        for i, text in enumerate(self.texts):
+            for shingle in shingles(text):
+                self.postings[shingle].add(i)
+
+    @staticmethod
+    def quote_lines(quote: QuoteReplyTo) -> list[str]:
+        lines = []
+        for line in quote.raw.splitlines():
+            if OMITTED_HINT in line:
+                continue
+            line = normalize_text(line)
+            if len(line) >= 2:
+                lines.append(line)
+        return lines
+
+    def match(self, quote: QuoteReplyTo, limit: int) -> int | None:
+        """返回唯一完整包含引用内容的候选下标，候选仅限 [0, limit)；存在歧义时返回 None"""
+        lines = self.quote_lines(quote)
+        if not lines:
+            return None
+
+        # 用最长的一行在倒排索引中求交集，缩小需要逐字核对的候选范围
+        pool = set(range(limit))
+        for shingle in shingles(max(lines, key=len)):
+            pool &= self.postings.get(shingle, set())
+            if not pool:
+                return None
+
+        matched = [
+            i for i in sorted(pool) if all(line in self.texts[i] for line in lines)
+        ]
+        if len(matched) > 1:
+            username = quote.author.split(" ")[0].strip()
+            matched = [i for i in matched if self.usernames[i] == username]
+        if len(matched) != 1:
+            return None
+        return matched[0]
 
 
 class ReplyOrganizer:
     trans: SentenceTransformer
+    embed: bool
 
-    def __init__(self, model: str = "paraphrase-multilingual-mpnet-base-v2"):
+    def __init__(
+        self, model: str = "paraphrase-multilingual-mpnet-base-v2", embed: bool = False
+    ):
         self.trans = SentenceTransformer(model)
+        self.embed = embed
 
     def organize(self, topic: ParsedTopic):
         candidates = [topic.content] + [post.text_in for post in topic.posts]
-        query_dict = {}
+        index = LexicalIndex(topic)
+        query_posts: list[int] = []
         queries: list[str] = []
         for i, post in enumerate(topic.posts):
             if not post.quote_reply_to:
                 continue
-            query_dict[len(queries)] = i
+            # 第 i 个回帖只能回复主题帖以及它之前的回帖，即候选 [0, i + 1)
+            if (j := index.match(post.quote_reply_to, i + 1)) is not None:
+                post.reply_to_id = j - 1
+                continue
+            query_posts.append(i)
             queries.append(post.quote_reply_to.raw)
 
+        if self.embed:
+            # 语义索引保存去掉引文块后的完整正文，匹配引用用的候选只有 text_in，需另外编码
+            bodies = [topic_body(topic)] + [
+                strip_quote_blocks(post.content) for post in topic.posts
+            ]
+            vectors = self.trans.encode(bodies, convert_to_tensor=True).cpu().tolist()
+            topic.embedding = vectors[0]
+            for post, vector in zip(topic.posts, vectors[1:]):
+                post.embedding = vector
+
         if len(queries) == 0:
             return
 
         query_embeddings = self.trans.encode(queries, convert_to_tensor=True)
         cand_embeddings = self.trans.encode(candidates, convert_to_tensor=True)
-        top_k = 2
         cos_scores = util.cos_sim(query_embeddings, cand_embeddings)
-        for i in range(len(queries)):
-            top_results = torch.topk(cos_scores[i][: i + 1], k=min(i + 1, top_k))
-            indices = top_results[1]
-            topic.posts[query_dict[i]].reply_to_id = (indices[0] - 1).item()
+
+        # 一次性屏蔽每条引用所在回帖及其之后的候选，再对所有引用同时取 argmax
+        limits = torch.tensor(query_posts, device=cos_scores.device) + 1
+        cand_range = torch.arange(cos_scores.shape[1], device=cos_scores.device)
+        visible = cand_range.unsqueeze(0) < limits.unsqueeze(1)
+        parents = cos_scores.masked_fill(~visible, float("-inf")).argmax(dim=1) - 1
+        for i, parent in zip(query_posts, parents.tolist()):
+            topic.posts[i].reply_to_id = parent
@@ -1,13 +1,14 @@
+import functools
 import re
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
 from typing import override
 
-import markdownify
 import requests
 from bs4 import BeautifulSoup, Tag
 
+from .bbsmarkdown import bbs_markdownify
 from .config import load_config
 from .models.mongo import MongoPost
 
@@ -16,6 +17,9 @@ LEGACY_SEPARATOR = "☆───────────────────
 SYSTEM_HINT = "自动发信系统"
 ANNOUNCE_HINT = "校内机关通知"
 BASE_URL = "http://bbs.sjtu.edu.cn"
+# 发信人、标题、发信站都在正文的前几行
+HEADER_LINES = 4
+CN_DATETIME_RE = re.compile(r"(\d{4})年(\d{1,2})月(\d{1,2})日(\d{1,2}):(\d{1,2}):(\d{1,2})")
 
 
 @dataclass
@@ -39,6 +43,7 @@ class ParsedPost:
     quote_reply_to: QuoteReplyTo | None
     quote_embedded: bool
     reply_to_id: int = -1
+    embedding: list[float] | None = None
 
 
 @dataclass
@@ -52,6 +57,11 @@ class ParsedTopic:
     text_in: str
     posts: list[ParsedPost]
     assets: list[str]
+    embedding: list[float] | None = None
+    # 由 FingerprintIndex 判定为其他版块已有主题的转载时，指向原帖的 reid
+    original_reid: int | None = None
+    # FingerprintIndex.check 计算的正文指纹，原帖导入提交之后才登记到索引中
+    fingerprint: int | None = None
 
 
 class Node:
@@ -261,11 +271,14 @@ class Parser(ABC):
         return assets
 
     @staticmethod
+    @functools.lru_cache(maxsize=1 << 16)
     def convert_datetime(s: str) -> datetime:
-        try:
-            return datetime.strptime(s.split(" ")[0].strip(), "%Y年%m月%d日%H:%M:%S")
-        except ValueError:
-            pass
+        # 绝大多数时间戳是中文格式，直接用正则取出各字段，避免 strptime 与异常开销
+        if m := CN_DATETIME_RE.fullmatch(s.split(" ")[0].strip()):
+            try:
+                return datetime(*map(int, m.groups()))
+            except ValueError:
+                pass
         try:
             return datetime.strptime(s, "%a %b %d %H:%M:%S %Y")
         except Exception:
@@ -274,13 +287,13 @@ class Parser(ABC):
 
 
 class BBSParser(Parser):
-    author_re: re.Pattern[str]
-    created_at_re: re.Pattern[str]
+    header_re: re.Pattern[str]
 
     def __init__(self, mongo_post: MongoPost):
         super().__init__(mongo_post)
-        self.author_re = re.compile(r"发信人: (.*)\s*\((.*)\)?, ")
-        self.created_at_re = re.compile(r"发信站: .* \((.*)\)")
+        self.header_re = re.compile(
+            r"发信人: (.*)\s*\((.*)\)?, |发信站: .* \((.*)\)"
+        )
 
     def regroup(self) -> tuple[Tag, list[Tag]]:
         pres: list[Tag] = []
@@ -290,31 +303,53 @@ class BBSParser(Parser):
                 pres.append(pre)
         return pres[0], pres[1:]
 
-    def author_pass(self, pre: Tag) -> ParsedAuthor:
-        assert isinstance(pre.text, str)
+    @staticmethod
+    def header_text(pre: Tag) -> str:
+        """只拼接前 HEADER_LINES 行的文字，而不是对整个帖子求 pre.text"""
+        parts: list[str] = []
+        lines = 0
+        for s in pre.strings:
+            parts.append(s)
+            lines += s.count("\n")
+            if lines >= HEADER_LINES:
+                break
+        text = "".join(parts)
+        return text[: text.rfind("\n") + 1]
+
+    def scan_header(self, text: str) -> tuple[re.Match[str] | None, str | None]:
+        author_match = None
+        date = None
+        for m in self.header_re.finditer(text):
+            if m[1] is not None:
+                author_match = author_match or m
+            elif date is None:
+                date = m[3]
+            if author_match and date is not None:
+                break
+        return author_match, date
+
+    def header_pass(self, pre: Tag) -> tuple[ParsedAuthor, datetime]:
+        author_match, date = self.scan_header(self.header_text(pre))
+        if not author_match or date is None:
+            # 帖子头不在前几行时退回到全文搜索
+            author_match, date = self.scan_header(pre.text)
         try:
-            author_match = self.author_re.search(pre.text)
             assert author_match
             username = author_match[1].strip()
             assert username
             nickname = author_match[2].strip()
-            return ParsedAuthor(username, nickname)
+            author = ParsedAuthor(username, nickname)
         except Exception:
             raise MetadataPassError()
-
-    def date_pass(self, pre: Tag) -> datetime:
-        assert isinstance(pre.text, str)
-        m = self.created_at_re.search(pre.text)
-        try:
-            return self.convert_datetime(str(m[1]))
-        except TypeError:
+        if date is None:
             raise MetadataPassError()
+        return author, self.convert_datetime(date)
 
     def text_pass(self, pre: Tag) -> str:
         t = self.to_raw_html(pre)
         t = "\n".join(t.split("\n\n")[1:])
         t = t.split("--")[0]
-        t = markdownify.markdownify(t)
+        t = bbs_markdownify(t)
         t = self.strip_all_repost(t)
         return t
 
@@ -335,8 +370,7 @@ class BBSParser(Parser):
         except Exception:
             raise RegroupPassError()
 
-        topic_author = self.author_pass(topic_pre)
-        topic_date = self.date_pass(topic_pre)
+        topic_author, topic_date = self.header_pass(topic_pre)
         assets = self.relabel_or_strip_imgs(topic_pre)
 
         topic_text = self.text_pass(topic_pre)
@@ -344,8 +378,7 @@ class BBSParser(Parser):
         posts: list[ParsedPost] = []
 
         for post_pre in post_pres:
-            author = self.author_pass(post_pre)
-            date = self.date_pass(post_pre)
+            author, date = self.header_pass(post_pre)
             assets.extend(self.relabel_or_strip_imgs(post_pre))
             text = self.text_pass(post_pre)
             post_result = self.reference_pass(text)
@@ -413,7 +446,7 @@ class BBSLegacyParser(Parser):
             assert whole_page
             assets = self.relabel_or_strip_imgs(whole_page)
             whole_page = self.to_raw_html(whole_page)
-            whole_page = markdownify.markdownify(whole_page)
+            whole_page = bbs_markdownify(whole_page)
             whole_page = re.sub(
                 r"(\s:)+☆──────────────────────────────────────☆", "", whole_page
             )
@@ -0,0 +1,189 @@
+import re
+from dataclasses import dataclass
+
+from sqlalchemy import bindparam, func, literal, or_, select, union_all, update
+from sqlalchemy.orm import Session
+
+from .models.postgres import Author, Board, Post, Topic
+
+CJK_CHARS = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+CJK_RE = re.compile(f"[{CJK_CHARS}]+")
+TOKEN_RE = re.compile(f"[{CJK_CHARS}]+|[^\\W_{CJK_CHARS}]+")
+SNIPPET_LENGTH = 120
+BACKFILL_BATCH = 1000
+
+
+def segment(text: str) -> str:
+    """
+    将文本切分为空格分隔的词元，供 to_tsvector('simple', ...) 使用。
+
+    PostgreSQL 自带的分词器不认识中文，这里把连续的汉字切成重叠的二元组，
+    其余的字母数字串按小写整体保留。
+    """
+    tokens: list[str] = []
+    for m in TOKEN_RE.finditer(text):
+        run = m[0]
+        if not CJK_RE.fullmatch(run):
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return " ".join(tokens)
+
+
+def backfill_search_vectors(session: Session, batch_size: int = BACKFILL_BATCH) -> int:
+    """
+    为引入全文检索之前导入的主题与回帖补上 search_vector。
+
+    分词在 python 中完成，按 id 分批读取与更新，每批单独提交；
+    中断后重新执行只会处理仍为空的行。
+    """
+    total = 0
+    targets = [
+        (Topic, (Topic.title, Topic.content), lambda row: f"{row[1]}\n{row[2]}"),
+        (Post, (Post.content,), lambda row: row[1]),
+    ]
+    for model, columns, text_of in targets:
+        # 直接更新表而不是 ORM 实体，session.execute 会按参数列表执行 executemany
+        table = model.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            .values(search_vector=func.to_tsvector("simple", bindparam("search_text")))
+        )
+        last = 0
+        while True:
+            rows = session.execute(
+                select(model.id, *columns)
+                .where(model.search_vector.is_(None), model.id > last)
+                .order_by(model.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            params = [
+                {"row_id": row[0], "search_text": segment(text_of(row))} for row in rows
+            ]
+            session.execute(stmt, params)
+            session.commit()
+            total += len(rows)
+            last = rows[-1][0]
+    return total
+
+
+def to_tsquery_text(query: str) -> str:
+    """把用户输入转成 to_tsquery 语法：同一个词内的二元组按 <-> 相邻匹配，词与词之间取交集"""
+    terms: list[str] = []
+    for word in query.split():
+        tokens = segment(word).split()
+        if len(tokens) == 1 and CJK_RE.fullmatch(tokens[0]):
+            # 单个汉字不会单独出现在索引中，用前缀匹配以它开头的二元组
+            terms.append(f"{tokens[0]}:*")
+        elif tokens:
+            terms.append("(" + " <-> ".join(tokens) + ")")
+    return " & ".join(terms)
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    reid: int
+    title: str
+    board: str
+    author: str
+    rank: float
+    snippet: str
+
+
+def search(
+    session: Session,
+    query: str,
+    board: str | None = None,
+    author: str | None = None,
+    limit: int = 20,
+) -> list[SearchHit]:
+    """在主题与回帖中全文检索，按相关度排序返回，可按版块与作者过滤"""
+    tsquery_text = to_tsquery_text(query)
+    if not tsquery_text:
+        return []
+    tsquery = func.to_tsquery("simple", tsquery_text)
+    title_pattern = "%" + re.sub(r"([%_\\])", r"\\\1", query.strip()) + "%"
+
+    topics = (
+        session.query(
+            literal("topic").label("kind"),
+            Topic.reid.label("reid"),
+            Topic.title.label("title"),
+            Board.name.label("board"),
+            Author.username.label("author"),
+            (
+                func.ts_rank_cd(Topic.search_vector, tsquery)
+                + func.similarity(Topic.title, query)
+            ).label("rank"),
+            func.left(Topic.content, SNIPPET_LENGTH).label("snippet"),
+        )
+        .join(Board, Topic.board_id == Board.id)
+        .join(Author, Topic.author_id == Author.id)
+        .filter(Topic.original_reid.is_(None))
+        .filter(
+            or_(
+                Topic.search_vector.op("@@")(tsquery),
+                Topic.title.ilike(title_pattern),
+            )
+        )
+    )
+    posts = (
+        session.query(
+            literal("post").label("kind"),
+            Topic.reid.label("reid"),
+            Topic.title.label("title"),
+            Board.name.label("board"),
+            Author.username.label("author"),
+            func.ts_rank_cd(Post.search_vector, tsquery).label("rank"),
+            func.left(Post.content, SNIPPET_LENGTH).label("snippet"),
+        )
+        .join(Topic, Post.topic_id == Topic.id)
+        .join(Board, Topic.board_id == Board.id)
+        .join(Author, Post.author_id == Author.id)
+        .filter(Post.search_vector.op("@@")(tsquery))
+    )
+    if board:
+        topics = topics.filter(Board.name == board)
+        posts = posts.filter(Board.name == board)
+    if author:
+        topics = topics.filter(Author.username == author)
+        posts = posts.filter(Author.username == author)
+
+    hits = union_all(topics.subquery().select(), posts.subquery().select()).subquery()
+    rows = session.query(hits).order_by(hits.c.rank.desc()).limit(limit).all()
+    return [SearchHit(**row._asdict()) for row in rows]
+
+
+def similar_topics(
+    session: Session, reid: int, board: str | None = None, limit: int = 10
+) -> list[SearchHit]:
+    """按 ReplyOrganizer 保存的语义向量查找与给定主题最相近的主题"""
+    target = session.query(Topic.embedding).filter(Topic.reid == reid).scalar()
+    if target is None:
+        return []
+    distance = Topic.embedding.cosine_distance(target)
+    query = (
+        session.query(
+            literal("topic").label("kind"),
+            Topic.reid.label("reid"),
+            Topic.title.label("title"),
+            Board.name.label("board"),
+            Author.username.label("author"),
+            (1 - distance).label("rank"),
+            func.left(Topic.content, SNIPPET_LENGTH).label("snippet"),
+        )
+        .join(Board, Topic.board_id == Board.id)
+        .join(Author, Topic.author_id == Author.id)
+        .filter(Topic.embedding.isnot(None), Topic.reid != reid)
+        .filter(Topic.original_reid.is_(None))
+    )
+    if board:
+        query = query.filter(Board.name == board)
+    rows = query.order_by(distance).limit(limit).all()
+    return [SearchHit(**row._asdict()) for row in rows]
@@ -0,0 +1,84 @@
+import glob
+import json
+import os
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+
+STAGES = ["parse", "organize", "assets", "import"]
+
+
+class SlowDocumentGuard:
+    """
+    记录每个文档在解析、回复重建、下载图片与导入各阶段的耗时。
+
+    文档导入完成后调用 finish()，任一阶段超过阈值的 reid 追加到 <directory>/<board>.jsonl；
+    指定 corpus 时同时把原始的 mongo 文档保存为 <corpus>/<board>/<reid>.json，
+    供 benchmark.py 的回归测试使用。
+    """
+
+    board: str
+    threshold: float
+    path: str
+    corpus: str | None
+    timings: dict[str, dict[str, float]]
+    raw: dict[str, dict]
+
+    def __init__(
+        self, directory: str, board: str, threshold: float, corpus: str | None = None
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.board = board
+        self.threshold = threshold
+        self.path = os.path.join(directory, f"{board}.jsonl")
+        self.corpus = os.path.join(corpus, board) if corpus else None
+        if self.corpus:
+            os.makedirs(self.corpus, exist_ok=True)
+        self.timings = {}
+        self.raw = {}
+
+    def record(self, reid: str, stage: str, seconds: float, doc: dict | None = None) -> None:
+        reid = str(reid)
+        stages = self.timings.setdefault(reid, {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+        # 只在需要保存回归样本时才持有原始文档，直到该批次导入完成
+        if doc is not None and self.corpus:
+            self.raw[reid] = doc
+
+    def finish(self, reids: Iterable[str]) -> int:
+        """结算一批已经导入（或被跳过）的文档，返回其中慢文档的数量"""
+        slow = 0
+        with open(self.path, "a") as f:
+            for reid in map(str, reids):
+                stages = self.timings.pop(reid, {})
+                doc = self.raw.pop(reid, None)
+                if not stages or max(stages.values()) < self.threshold:
+                    continue
+                slow += 1
+                breakdown = " ".join(f"{k} {v:.2f}s" for k, v in stages.items())
+                print(f"Slow document {reid}: {breakdown}")
+                entry = {
+                    "reid": reid,
+                    "board": self.board,
+                    "stages": stages,
+                    "total": sum(stages.values()),
+                    "logged_at": datetime.now().isoformat(),
+                }
+                f.write(json.dumps(entry) + "\n")
+                if doc is not None:
+                    self.capture(doc)
+        return slow
+
+    def capture(self, doc: dict) -> None:
+        entry = {k: v for k, v in doc.items() if k not in ("_id", "pages", "codec")}
+        # 压缩过的页面在这里解码，样本不依赖 mongo 中的字典
+        entry["pages"] = list(doc["pages"])
+        with open(os.path.join(self.corpus, f"{doc['reid']}.json"), "w") as f:
+            json.dump(entry, f, ensure_ascii=False)
+
+
+def load_corpus(corpus: str, board: str | None = None) -> Iterator[dict]:
+    """按 reid 顺序读出回归样本，可以直接传给 MongoPost(**doc)"""
+    pattern = os.path.join(corpus, board or "*", "*.json")
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r") as f:
+            yield json.load(f)
@@ -0,0 +1,233 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+
+from .codec import LazyPages, PageCodec, lookup_codec, register_codec
+
+# 文件布局：
+#   MAGIC | 记录 ... | 索引 | FOOTER
+# 记录：u32 元数据长度 | JSON 元数据（reid/title/section/codec/各页长度） | 各页原始字节
+# 索引：u32 字典数 | (u16 id 长度, id, u32 字典长度, 字典) ... | u32 记录数 | (u16 reid 长度, reid, u64 偏移) ...
+# FOOTER：u64 索引偏移 | u64 记录数 | MAGIC
+# 追加导出时新的记录、索引与 FOOTER 写在旧 FOOTER 之后，读取时使用最后一个索引完整的 FOOTER，
+# 中断的追加留在其后的字节会被忽略，并在下一次追加时截掉。
+MAGIC = b"BBSSNAP1"
+FOOTER = struct.Struct("<QQ8s")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+U64 = struct.Struct("<Q")
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+class Snapshot:
+    """
+    只读的版块快照，通过 mmap 访问。
+
+    页面以 memoryview 切片的形式交给 LazyPages，只有解析器真正访问到的页面才会被解码；
+    多个进程可以同时打开同一个快照，共享操作系统的页缓存。
+    """
+
+    path: str
+    mm: mmap.mmap
+    view: memoryview
+    # 最后一个有效 FOOTER 的结束位置
+    size: int
+    reids: list[str]
+    offsets: list[int]
+    codecs: dict[str, PageCodec]
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        if len(self.mm) < len(MAGIC) + FOOTER.size or self.mm[: len(MAGIC)] != MAGIC:
+            raise SnapshotFormatError(f"{path} is not a board snapshot")
+        self.size = self.find_footer()
+        for codec in self.codecs.values():
+            register_codec(codec)
+
+    def find_footer(self) -> int:
+        """
+        从文件末尾向前找到索引完整、并且恰好结束在 FOOTER 之前的最后一个 FOOTER，返回它的结束位置。
+
+        追加导出中断时旧 FOOTER 之后会留下半截记录，甚至半截索引；页面字节中偶然出现的 MAGIC
+        也不会被误认为 FOOTER，因为它前面的索引不可能恰好解析到这个位置。
+        """
+        end = len(self.mm)
+        while end >= len(MAGIC) + FOOTER.size:
+            footer = end - FOOTER.size
+            index_offset, count, magic = FOOTER.unpack_from(self.mm, footer)
+            if magic == MAGIC and len(MAGIC) <= index_offset < footer:
+                try:
+                    if self.read_index(index_offset, count) == footer:
+                        return end
+                except Exception:
+                    # 候选位置上的任何解析错误都说明它不是 FOOTER
+                    pass
+            end = self.mm.rfind(MAGIC, len(MAGIC), end - 1) + len(MAGIC)
+        raise SnapshotFormatError(f"{self.path} has no footer, the last export did not finish")
+
+    def read_index(self, pos: int, count: int) -> int:
+        """读取索引，返回索引结束的位置"""
+        self.codecs = {}
+        (n_codecs,) = U32.unpack_from(self.mm, pos)
+        pos += U32.size
+        for _ in range(n_codecs):
+            (size,) = U16.unpack_from(self.mm, pos)
+            dict_id = self.mm[pos + U16.size : pos + U16.size + size].decode()
+            pos += U16.size + size
+            (size,) = U32.unpack_from(self.mm, pos)
+            codec = PageCodec(self.mm[pos + U32.size : pos + U32.size + size])
+            pos += U32.size + size
+            if codec.dict_id != dict_id:
+                raise SnapshotFormatError(f"Corrupted dictionary {dict_id}")
+            self.codecs[dict_id] = codec
+
+        (n_records,) = U32.unpack_from(self.mm, pos)
+        pos += U32.size
+        if n_records != count:
+            raise SnapshotFormatError(f"Index of {self.path} is truncated")
+        self.reids = []
+        self.offsets = []
+        for _ in range(n_records):
+            (size,) = U16.unpack_from(self.mm, pos)
+            self.reids.append(self.mm[pos + U16.size : pos + U16.size + size].decode())
+            pos += U16.size + size
+            self.offsets.append(U64.unpack_from(self.mm, pos)[0])
+            pos += U64.size
+        return pos
+
+    def __len__(self) -> int:
+        return len(self.reids)
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def read(self, offset: int) -> dict:
+        (size,) = U32.unpack_from(self.mm, offset)
+        start = offset + U32.size
+        meta = json.loads(self.mm[start : start + size])
+        pos = start + size
+        pages = []
+        for length in meta.pop("pages"):
+            pages.append(self.view[pos : pos + length])
+            pos += length
+        codec = meta.pop("codec")
+        meta["pages"] = LazyPages(pages, self.codecs[codec] if codec else None)
+        return meta
+
+    def get(self, reid: str) -> dict:
+        i = bisect.bisect_left(self.reids, reid)
+        if i == len(self.reids) or self.reids[i] != reid:
+            raise KeyError(reid)
+        return self.read(self.offsets[i])
+
+    def count(self, after: str | None = None) -> int:
+        if after is None:
+            return len(self.reids)
+        return len(self.reids) - bisect.bisect_right(self.reids, after)
+
+    def docs(self, after: str | None = None) -> Iterator[dict]:
+        start = 0 if after is None else bisect.bisect_right(self.reids, after)
+        for offset in self.offsets[start:]:
+            yield self.read(offset)
+
+    def close(self) -> None:
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            # 仍有 LazyPages 引用着页面切片，交给垃圾回收在它们释放后关闭
+            pass
+
+
+class SnapshotWriter:
+    """
+    按 reid 升序写入快照。
+
+    新建时先写临时文件，close() 后原子替换；append=True 时在已有快照末尾追加 reid 更大的文档，
+    旧的 FOOTER 在新的写完之前始终有效。追加前先截掉上一次中断的追加留下的字节。
+    """
+
+    path: str
+    target: str
+    reids: list[str]
+    offsets: list[int]
+    codecs: dict[str, PageCodec]
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.reids = []
+        self.offsets = []
+        self.codecs = {}
+        if append and os.path.exists(path):
+            with Snapshot(path) as snapshot:
+                self.reids = list(snapshot.reids)
+                self.offsets = list(snapshot.offsets)
+                self.codecs = dict(snapshot.codecs)
+                size = snapshot.size
+            self.target = path
+            self.f = open(path, "r+b")
+            self.f.truncate(size)
+            self.f.seek(size)
+        else:
+            self.target = path + ".tmp"
+            self.f = open(self.target, "wb")
+            self.f.write(MAGIC)
+
+    @property
+    def last_reid(self) -> str | None:
+        return self.reids[-1] if self.reids else None
+
+    def write(self, doc: dict) -> None:
+        reid = doc["reid"]
+        if self.reids and reid <= self.reids[-1]:
+            raise ValueError(f"Snapshot must be sorted by reid: {reid} after {self.reids[-1]}")
+        codec = doc.get("codec")
+        if codec and codec not in self.codecs:
+            self.codecs[codec] = lookup_codec(codec)
+        pages = [p if isinstance(p, bytes) else p.encode() for p in doc["pages"]]
+        meta = json.dumps(
+            {
+                "reid": reid,
+                "title": doc["title"],
+                "section": doc["section"],
+                "codec": codec,
+                "pages": [len(p) for p in pages],
+            },
+            ensure_ascii=False,
+        ).encode()
+        self.reids.append(reid)
+        self.offsets.append(self.f.tell())
+        self.f.write(U32.pack(len(meta)))
+        self.f.write(meta)
+        for page in pages:
+            self.f.write(page)
+
+    def close(self) -> None:
+        index_offset = self.f.tell()
+        self.f.write(U32.pack(len(self.codecs)))
+        for dict_id, codec in self.codecs.items():
+            raw_id = dict_id.encode()
+            self.f.write(U16.pack(len(raw_id)) + raw_id)
+            self.f.write(U32.pack(len(codec.dictionary)) + codec.dictionary)
+        self.f.write(U32.pack(len(self.reids)))
+        for reid, offset in zip(self.reids, self.offsets):
+            raw_reid = reid.encode()
+            self.f.write(U16.pack(len(raw_reid)) + raw_reid + U64.pack(offset))
+        self.f.write(FOOTER.pack(index_offset, len(self.reids), MAGIC))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        if self.target != self.path:
+            os.replace(self.target, self.path)
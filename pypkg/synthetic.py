@@ -0,0 +1,87 @@
+import json
+import random
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+# 生成的页面与 SJTUBBS 的帖子页结构一致，能走完 BBSParser 的全部流程
+WORDS = [
+    "交大", "选课", "宿舍", "食堂", "考试", "图书馆", "讲座", "实验室", "导师", "保研",
+    "实习", "招聘", "闵行", "徐汇", "校车", "自习", "论文", "社团", "毕业", "学长",
+    "水源", "版面", "回复", "推荐", "经验", "问题", "请问", "大家", "觉得", "今天",
+]
+REPLY_PREFIXES = ["", "", "", "Re: ", "【合集】", "[转载] "]
+POSTS_PER_PAGE = 20
+WEEKDAYS = "一二三四五六日"
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return "".join(rng.choice(WORDS) for _ in range(words)) + rng.choice("。？！，")
+
+
+def post_block(
+    rng: random.Random,
+    board: str,
+    title: str,
+    author: str,
+    created_at: datetime,
+    lines: list[str],
+    quote: tuple[str, list[str]] | None,
+) -> str:
+    stamp = created_at.strftime("%Y年%m月%d日%H:%M:%S") + f" 星期{WEEKDAYS[created_at.weekday()]}"
+    body = "\n".join(lines)
+    if quote:
+        quoted = "\n".join(f": {line}" for line in quote[1][:3])
+        body += f"\n【 在 {quote[0]} 的大作中提到: 】\n{quoted}"
+    return (
+        f"<pre>发信人: {author} (nick{author[-2:]}), 信区: {board}\n"
+        f"标  题: {title}\n"
+        f"发信站: 饮水思源 ({stamp})\n\n"
+        f"{body}\n--\n"
+        f"※ 来源:·饮水思源 bbs.sjtu.edu.cn·[FROM: 10.0.{rng.randrange(256)}.{rng.randrange(256)}]\n"
+        "</pre>"
+    )
+
+
+def synthetic_document(
+    rng: random.Random, board: str, reid: str, max_replies: int
+) -> dict:
+    """一个主题的 mongo 文档（reid/title/pages/section），回帖随机引用之前的楼层"""
+    title = rng.choice(REPLY_PREFIXES) + sentence(rng, rng.randint(2, 6))[:-1]
+    created_at = datetime(2005, 1, 1) + timedelta(minutes=rng.randrange(10_000_000))
+    blocks: list[str] = []
+    history: list[tuple[str, list[str]]] = []
+    for floor in range(rng.randint(0, max_replies) + 1):
+        author = f"user{rng.randrange(5000):04d}"
+        lines = [sentence(rng, rng.randint(4, 16)) for _ in range(rng.randint(1, 6))]
+        quote = rng.choice(history) if history and rng.random() < 0.6 else None
+        blocks.append(post_block(rng, board, title, author, created_at, lines, quote))
+        history.append((author, lines))
+        created_at += timedelta(minutes=rng.randrange(1, 600))
+    pages = [
+        "<html><body>" + "".join(blocks[i : i + POSTS_PER_PAGE]) + "</body></html>"
+        for i in range(0, len(blocks), POSTS_PER_PAGE)
+    ]
+    return {"reid": reid, "title": title, "pages": pages, "section": board}
+
+
+def synthetic_board(
+    board: str, count: int, max_replies: int = 30, seed: int = 0
+) -> Iterator[dict]:
+    """按 reid 升序生成 count 个文档，相同的参数总是生成相同的内容"""
+    rng = random.Random(f"{board}:{seed}")
+    for i in range(count):
+        yield synthetic_document(rng, board, str(1_000_000_000 + i), max_replies)
+
+
+def reid_entry(doc: dict) -> str:
+    """golang 端在 redis 中保存的 reid:<reid> 记录，filter.py 从这里读取标题"""
+    author = doc["pages"][0].split("发信人: ", 1)[1].split(" ", 1)[0]
+    return json.dumps(
+        {
+            "reid": doc["reid"],
+            "title": doc["title"],
+            "author": author,
+            "section": doc["section"],
+        },
+        ensure_ascii=False,
+    )
@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .models.postgres import Post
+from .parser import ParsedPost
+
+# 路径由每一层的楼层号组成，定宽补零后按字节序排序即为树的先序遍历顺序
+SEGMENT_WIDTH = 6
+SEPARATOR = "."
+# "/" 紧跟在 "." 之后，[path, path + "/") 恰好覆盖 path 自身与它的所有后代
+SUBTREE_END = "/"
+
+BACKFILL_SQL = f"""
+WITH RECURSIVE numbered AS (
+    SELECT id, reply_to_id,
+           lpad((row_number() OVER (PARTITION BY topic_id ORDER BY id) - 1)::text,
+                {SEGMENT_WIDTH}, '0') AS segment
+    FROM posts
+    WHERE topic_id IN (SELECT DISTINCT topic_id FROM posts WHERE path IS NULL)
+), tree AS (
+    SELECT id, 0 AS depth, id AS root_id, segment AS path
+    FROM numbered
+    WHERE reply_to_id IS NULL
+    UNION ALL
+    SELECT n.id, t.depth + 1, t.root_id, t.path || '{SEPARATOR}' || n.segment
+    FROM numbered n
+    JOIN tree t ON n.reply_to_id = t.id
+)
+UPDATE posts
+SET depth = tree.depth, root_id = tree.root_id, path = tree.path
+FROM tree
+WHERE posts.id = tree.id
+"""
+
+
+@dataclass
+class ThreadNode:
+    depth: int
+    # 所在回复链最顶层回帖在 ParsedTopic.posts 中的下标
+    root_seq: int
+    path: str
+
+
+def segment(seq: int) -> str:
+    return str(seq).zfill(SEGMENT_WIDTH)
+
+
+def thread_tree(posts: list[ParsedPost]) -> list[ThreadNode]:
+    """
+    根据 reply_to_id 计算每个回帖的深度、根与物化路径。
+
+    ReplyOrganizer 只会把回帖关联到更早的楼层，因此按顺序一次遍历即可；
+    不满足这一点的 reply_to_id 按直接回复主题处理，避免出现环。
+    """
+    nodes: list[ThreadNode] = []
+    for seq, post in enumerate(posts):
+        parent = post.reply_to_id
+        if 0 <= parent < seq:
+            p = nodes[parent]
+            path = p.path + SEPARATOR + segment(seq)
+            nodes.append(ThreadNode(p.depth + 1, p.root_seq, path))
+        else:
+            nodes.append(ThreadNode(0, seq, segment(seq)))
+    return nodes
+
+
+def ancestor_paths(path: str) -> list[str]:
+    parts = path.split(SEPARATOR)
+    return [SEPARATOR.join(parts[:i]) for i in range(1, len(parts))]
+
+
+def subtree(session: Session, post: Post) -> list[Post]:
+    """post 及其所有后代，按楼层的先序遍历顺序返回，走 (topic_id, path) 索引的一次范围查询"""
+    return (
+        session.query(Post)
+        .filter(
+            Post.topic_id == post.topic_id,
+            Post.path >= post.path,
+            Post.path < post.path + SUBTREE_END,
+        )
+        .order_by(Post.path)
+        .all()
+    )
+
+
+def ancestors(session: Session, post: Post) -> list[Post]:
+    """从最顶层回帖到 post 的父回帖，按深度排序"""
+    paths = ancestor_paths(post.path)
+    if not paths:
+        return []
+    return (
+        session.query(Post)
+        .filter(Post.topic_id == post.topic_id, Post.path.in_(paths))
+        .order_by(Post.path)
+        .all()
+    )
+
+
+def backfill(session: Session) -> int:
+    """为在引入物化路径之前导入的回帖补上 depth/root_id/path"""
+    result = session.execute(text(BACKFILL_SQL))
+    session.commit()
+    return result.rowcount
@@ -0,0 +1,192 @@
+import itertools
+import os
+import socket
+import uuid
+
+import redis
+
+# KEYS 依次为 queue、leases、owners、attempts，owners 记录每个 reid 由哪个 worker 持有
+
+# 从队列头部取出至多 ARGV[1] 个 reid，以 redis 服务器时间加 ARGV[2] 秒作为租约期限，持有者为 ARGV[3]
+LEASE_SCRIPT = """
+local reids = redis.call('LPOP', KEYS[1], ARGV[1])
+if not reids then
+    return {}
+end
+local deadline = tonumber(redis.call('TIME')[1]) + tonumber(ARGV[2])
+for _, reid in ipairs(reids) do
+    redis.call('ZADD', KEYS[2], deadline, reid)
+    redis.call('HSET', KEYS[3], reid, ARGV[3])
+end
+return reids
+"""
+
+# 租约过期的 reid 计一次失败后放回队列尾部；失败次数达到 ARGV[1] 的不再放回，返回给调用方
+REQUEUE_SCRIPT = """
+local now = tonumber(redis.call('TIME')[1])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)
+local exhausted = {}
+for _, reid in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], reid)
+    redis.call('HDEL', KEYS[3], reid)
+    if redis.call('HINCRBY', KEYS[4], reid, 1) >= tonumber(ARGV[1]) then
+        redis.call('HDEL', KEYS[4], reid)
+        table.insert(exhausted, reid)
+    else
+        redis.call('RPUSH', KEYS[1], reid)
+    end
+end
+return exhausted
+"""
+
+# 以下脚本只处理仍由 ARGV[1] 持有的 reid：租约过期后被其他 worker 重新领取的不受影响
+
+# 放回队列，不计失败次数（worker 被中断）
+RELEASE_SCRIPT = """
+local released = 0
+for i = 2, #ARGV do
+    local reid = ARGV[i]
+    if redis.call('HGET', KEYS[3], reid) == ARGV[1] then
+        redis.call('ZREM', KEYS[2], reid)
+        redis.call('HDEL', KEYS[3], reid)
+        redis.call('RPUSH', KEYS[1], reid)
+        released = released + 1
+    end
+end
+return released
+"""
+
+# 计一次失败后放回队列；失败次数达到 ARGV[2] 的不再放回，返回给调用方
+RETRY_SCRIPT = """
+local exhausted = {}
+for i = 3, #ARGV do
+    local reid = ARGV[i]
+    if redis.call('HGET', KEYS[3], reid) == ARGV[1] then
+        redis.call('ZREM', KEYS[2], reid)
+        redis.call('HDEL', KEYS[3], reid)
+        if redis.call('HINCRBY', KEYS[4], reid, 1) >= tonumber(ARGV[2]) then
+            redis.call('HDEL', KEYS[4], reid)
+            table.insert(exhausted, reid)
+        else
+            redis.call('RPUSH', KEYS[1], reid)
+        end
+    end
+end
+return exhausted
+"""
+
+# 完成处理，删除租约与失败次数
+ACK_SCRIPT = """
+local acked = 0
+for i = 2, #ARGV do
+    local reid = ARGV[i]
+    if redis.call('HGET', KEYS[3], reid) == ARGV[1] then
+        redis.call('ZREM', KEYS[2], reid)
+        redis.call('HDEL', KEYS[3], reid)
+        redis.call('HDEL', KEYS[4], reid)
+        acked = acked + 1
+    end
+end
+return acked
+"""
+
+
+def connect(addr: str) -> redis.Redis:
+    """config.yml 中的 redis 地址与 golang 端共用，只有 host:port 时补上协议"""
+    if "://" not in addr:
+        addr = "redis://" + addr
+    return redis.Redis.from_url(addr)
+
+
+class WorkQueue:
+    """
+    基于 redis 的 reid 分发队列，供多台机器上的 reimporter 共同消费。
+
+    - reimport:queue:<board> 为待处理的 reid 列表
+    - reimport:leases:<board> 为已被领取的 reid，分数为租约到期时间
+    - reimport:owners:<board> 记录每个租约的持有者，只有持有者可以 ack、retry 或 release
+    - reimport:attempts:<board> 为每个 reid 失败（retry 或租约过期）的次数
+    - 处理完成后 ack，可重试的失败 retry，被中断时 release；租约过期的 reid 会被任意 worker
+      放回队列。失败达到 max_attempts 次的 reid 不再放回，由调用方记为死信
+    """
+
+    client: redis.Redis
+    queue_key: str
+    lease_key: str
+    owner_key: str
+    attempt_key: str
+    lease_seconds: int
+    max_attempts: int
+    owner: str
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        board: str,
+        lease_seconds: int = 600,
+        max_attempts: int = 3,
+    ):
+        self.client = client
+        self.queue_key = f"reimport:queue:{board}"
+        self.lease_key = f"reimport:leases:{board}"
+        self.owner_key = f"reimport:owners:{board}"
+        self.attempt_key = f"reimport:attempts:{board}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lease = client.register_script(LEASE_SCRIPT)
+        self._requeue = client.register_script(REQUEUE_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._retry = client.register_script(RETRY_SCRIPT)
+        self._ack = client.register_script(ACK_SCRIPT)
+
+    @property
+    def keys(self) -> list[str]:
+        return [self.queue_key, self.lease_key, self.owner_key, self.attempt_key]
+
+    def enqueue(self, reids, chunk: int = 1000) -> int:
+        """清空旧的队列、租约与失败次数后重新入队"""
+        count = 0
+        self.client.delete(*self.keys)
+        for batch in itertools.batched(reids, chunk):
+            self.client.rpush(self.queue_key, *batch)
+            count += len(batch)
+        return count
+
+    def lease(self, count: int) -> list[str]:
+        reids = self._lease(
+            keys=self.keys, args=[count, self.lease_seconds, self.owner]
+        )
+        return [r.decode() for r in reids]
+
+    def ack(self, reids: list[str]) -> int:
+        if not reids:
+            return 0
+        return self._ack(keys=self.keys, args=[self.owner, *reids])
+
+    def retry(self, reids: list[str]) -> list[str]:
+        """返回失败次数已经用尽、不再放回队列的 reid"""
+        if not reids:
+            return []
+        exhausted = self._retry(
+            keys=self.keys, args=[self.owner, self.max_attempts, *reids]
+        )
+        return [r.decode() for r in exhausted]
+
+    def release(self, reids: list[str]) -> int:
+        if not reids:
+            return 0
+        return self._release(keys=self.keys, args=[self.owner, *reids])
+
+    def requeue_expired(self) -> list[str]:
+        """放回租约过期的 reid，返回其中失败次数已经用尽的"""
+        exhausted = self._requeue(keys=self.keys, args=[self.max_attempts])
+        return [r.decode() for r in exhausted]
+
+    def pending(self) -> tuple[int, int]:
+        """返回 (排队中, 已领取未完成) 的数量"""
+        with self.client.pipeline() as pipe:
+            pipe.llen(self.queue_key)
+            pipe.zcard(self.lease_key)
+            queued, leased = pipe.execute()
+        return queued, leased
@@ -1,80 +1,286 @@
+import itertools
 import os
+import time
+from collections.abc import Container, Iterator
+from contextlib import ExitStack, contextmanager
 
 import click
 import pymongo
 import requests
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from tqdm import tqdm
 
+from pypkg.bulkload import BulkLoader, hold_constraints
+from pypkg.cache import TopicCache
+from pypkg.checkpoint import (
+    PHASE_DONE,
+    PHASE_IMPORTED,
+    PHASE_IMPORTING,
+    Checkpoint,
+    CheckpointStore,
+)
+from pypkg.codec import load_codecs
 from pypkg.config import load_config
+from pypkg.deadletter import (
+    STAGE_IMPORT,
+    STAGE_ORGANIZE,
+    STAGE_PARSE,
+    DeadLetterSink,
+    JsonlDeadLetters,
+    RedisDeadLetters,
+)
+from pypkg.fingerprint import FingerprintIndex
+from pypkg.follow import ChangeFeed, FollowCursor
 from pypkg.models.mongo import MongoPost
-from pypkg.models.postgres import Author, Board, Post, Topic, make_session
+from pypkg.models.postgres import (
+    Author,
+    Board,
+    Post,
+    Topic,
+    make_session,
+)
 from pypkg.organize import ReplyOrganizer
 from pypkg.parser import MetadataPassError, ParsedTopic, RegroupPassError, make_parser
+from pypkg.search import backfill_search_vectors, segment
+from pypkg.slowlog import SlowDocumentGuard
+from pypkg.snapshot import Snapshot
+from pypkg.threadtree import backfill, thread_tree
+from pypkg.workqueue import WorkQueue, connect
 
 config = load_config()
 
 BASE_FILE_DIRECTORY: str = os.getenv("ROOT") + "/files"
+CHECKPOINT_DIRECTORY: str = os.getenv("ROOT") + "/checkpoints"
+CACHE_DIRECTORY: str = os.getenv("ROOT") + "/cache"
+SLOWLOG_DIRECTORY: str = os.getenv("ROOT") + "/slowlog"
+CORPUS_DIRECTORY: str = os.getenv("ROOT") + "/corpus"
+DEADLETTER_DIRECTORY: str = os.getenv("ROOT") + "/deadletters"
 
-def docgen(collection, poi: str | list[str] | None = None):
-    if not poi:
-        for doc in collection.find({}, {"_id": False}):
-            yield doc
-    elif isinstance(poi, str):
+
+def poigen(poi: str | list[str], after: str | None = None):
+    reids = poi
+    if isinstance(poi, str):
         with open(poi, "r") as f:
-            for line in f.readlines():
-                yield collection.find_one({"reid": line.strip()}, {"_id": False})
+            reids = [line.strip() for line in f.readlines()]
+    if after is not None:
+        # 检查点不在列表中说明 poi 与上次运行的不同，从头开始会重复导入，直接报错
+        if after not in reids:
+            raise ValueError(f"checkpoint reid {after} is not in the poi list")
+        reids = reids[reids.index(after) + 1 :]
+    yield from reids
+
+
+def docgen(collection, poi: str | list[str] | None = None, after: str | None = None):
+    """逐个产出 (reid, doc)；poi 中的 reid 在 mongo 或快照里找不到时 doc 为 None"""
+    if isinstance(collection, Snapshot):
+        if not poi:
+            for doc in collection.docs(after):
+                yield doc["reid"], doc
+        else:
+            for reid in poigen(poi, after):
+                try:
+                    yield reid, collection.get(reid)
+                except KeyError:
+                    yield reid, None
+        return
+    if not poi:
+        # 按 reid 顺序遍历（走 reid 唯一索引），这样检查点可以直接用 $gt 恢复游标
+        query = {"reid": {"$gt": after}} if after is not None else {}
+        for doc in collection.find(query, {"_id": False}).sort("reid", 1):
+            yield doc["reid"], doc
     else:
-        for reid in poi:
-            yield collection.find_one({"reid": reid}, {"_id": False})
+        for reid in poigen(poi, after):
+            yield reid, collection.find_one({"reid": reid}, {"_id": False})
 
 
-def get_count(collection, poi: str | list[str] | None = None):
+def get_count(
+    collection, poi: str | list[str] | None = None, after: str | None = None
+):
     if not poi:
-        return int(collection.count_documents({}))
-    elif isinstance(poi, str):
-        with open(poi, "r") as f:
-            count = 0
-            for _ in f.readlines():
-                count += 1
-            return count
+        if isinstance(collection, Snapshot):
+            return collection.count(after)
+        query = {"reid": {"$gt": after}} if after is not None else {}
+        return int(collection.count_documents(query))
     else:
-        return len(poi)
+        return sum(1 for _ in poigen(poi, after))
 
 
-def download_all_assets(topic: ParsedTopic):
+def download_all_assets(topic: ParsedTopic, original_board: str | None = None):
     for url in topic.assets:
+        p = BASE_FILE_DIRECTORY + "/" + url.split("/")[-1]
+        if original_board:
+            # 转载的主题与原帖共用图片，原帖已经下载过的直接硬链接
+            src = os.path.join(
+                os.path.dirname(BASE_FILE_DIRECTORY), original_board, url.split("/")[-1]
+            )
+            if os.path.exists(src):
+                if not os.path.exists(p):
+                    os.link(src, p)
+                continue
         print("Downloading", url)
         r = requests.get(url)
-        p = BASE_FILE_DIRECTORY + "/" + url.split("/")[-1]
         with open(p, "wb") as f:
             f.write(r.content)
 
 
-def parse_all_topics(
-    board: str,
+def parse_documents(
+    collection,
     poi: str | list[str] | None = None,
-) -> list[ParsedTopic]:
-    topics: list[ParsedTopic] = []
-    reply_organizer = ReplyOrganizer()
+    after: str | None = None,
+    cache: TopicCache | None = None,
+    guard: SlowDocumentGuard | None = None,
+    dead_letters: DeadLetterSink | None = None,
+) -> Iterator[tuple[str, ParsedTopic | None]]:
+    for reid, doc in docgen(collection, poi, after):
+        if cache:
+            try:
+                yield reid, cache.get(reid)
+                continue
+            except KeyError:
+                pass
+        topic = None
+        start = time.perf_counter()
+        try:
+            if doc is None:
+                raise LookupError(f"document {reid} does not exist")
+            post = MongoPost(**doc)
+            if parser := make_parser(post):
+                topic = parser.parse()
+        except (MetadataPassError, RegroupPassError):
+            topic = None
+        except Exception as e:
+            if not dead_letters:
+                print(reid)
+                raise
+            # 解析器的缺陷只影响这一个文档，不缓存结果，修复后可以重试
+            dead_letters.record(reid, STAGE_PARSE, e)
+            yield reid, None
+            continue
+        if guard:
+            raw = {**doc, "pages": post.pages}
+            guard.record(reid, "parse", time.perf_counter() - start, raw)
+        if cache:
+            cache.put(reid, topic)
+        yield reid, topic
+
+
+def cached_documents(
+    cache: TopicCache,
+    poi: str | list[str] | None = None,
+    after: str | None = None,
+) -> Iterator[tuple[str, ParsedTopic | None]]:
+    if not poi:
+        yield from cache.items(after)
+        return
+    for reid in poigen(poi, after):
+        try:
+            yield reid, cache.get(reid)
+        except KeyError:
+            print("Not cached", reid)
+
+
+@contextmanager
+def open_collection(board: str, snapshot: str | None = None):
+    """打开版块的文档来源：快照文件，或加载了页面压缩字典的 mongo 集合"""
+    if snapshot:
+        with Snapshot(snapshot) as s:
+            yield s
+        return
     with pymongo.MongoClient(config.mongo) as client:
         db = client.get_database("sjtubbs")
-        collection = db.get_collection(board)
-        count = get_count(collection, poi)
+        load_codecs(db, board)
+        yield db.get_collection(board)
+
+
+def iter_parsed_topics(
+    board: str,
+    poi: str | list[str] | None = None,
+    embed: bool = False,
+    after: str | None = None,
+    cache: TopicCache | None = None,
+    from_cache: bool = False,
+    snapshot: str | None = None,
+    dedup: FingerprintIndex | None = None,
+    guard: SlowDocumentGuard | None = None,
+    dead_letters: DeadLetterSink | None = None,
+    organizer: ReplyOrganizer | None = None,
+    collection=None,
+) -> Iterator[tuple[str, ParsedTopic | None]]:
+    """
+    逐个产出 (reid, topic)，无法解析或被跳过的文档 topic 为 None，便于调用方推进检查点。
+
+    反复处理小批次时应传入同一个 organizer 与 open_collection() 打开的 collection，
+    避免每次都重新加载句向量模型、连接 mongo 与读取压缩字典。
+    """
+    reply_organizer = organizer or ReplyOrganizer(embed=embed)
+    with ExitStack() as stack:
+        if from_cache:
+            assert cache
+            count = len(list(poigen(poi, after))) if poi else cache.count(after)
+            source = cached_documents(cache, poi, after)
+        else:
+            if collection is None:
+                collection = stack.enter_context(open_collection(board, snapshot))
+            count = get_count(collection, poi, after)
+            source = parse_documents(
+                collection, poi, after, cache, guard, dead_letters
+            )
         with tqdm(total=count, desc=board) as pbar:
-            for doc in docgen(collection, poi):
-                if parser := make_parser(MongoPost(**doc)):
+            for reid, topic in source:
+                if topic:
                     try:
-                        topic = parser.parse()
-                        reply_organizer.organize(topic)
-                        download_all_assets(topic)
-                        topics.append(topic)
-                    except (MetadataPassError, RegroupPassError):
-                        pass
-                    except Exception:
-                        print(doc["reid"])
-                        raise
+                        original_board = dedup.check(topic) if dedup else None
+                        start = time.perf_counter()
+                        if original_board:
+                            # 转载的拷贝只保存主题本身并指向原帖，不重建回复、不导入回帖
+                            topic.posts = []
+                        else:
+                            reply_organizer.organize(topic)
+                        organized = time.perf_counter()
+                        download_all_assets(topic, original_board)
+                        if guard:
+                            guard.record(reid, "organize", organized - start)
+                            guard.record(reid, "assets", time.perf_counter() - organized)
+                    except Exception as e:
+                        if not dead_letters:
+                            print(reid)
+                            raise
+                        dead_letters.record(reid, STAGE_ORGANIZE, e)
+                        topic = None
                 pbar.update()
+                yield reid, topic
+
+
+def parse_all_topics(
+    board: str,
+    poi: str | list[str] | None = None,
+    embed: bool = False,
+    cache: TopicCache | None = None,
+    from_cache: bool = False,
+    snapshot: str | None = None,
+    dedup: FingerprintIndex | None = None,
+    guard: SlowDocumentGuard | None = None,
+    dead_letters: DeadLetterSink | None = None,
+) -> list[ParsedTopic]:
+    stream = iter_parsed_topics(
+        board,
+        poi,
+        embed,
+        cache=cache,
+        from_cache=from_cache,
+        snapshot=snapshot,
+        dedup=dedup,
+        guard=guard,
+        dead_letters=dead_letters,
+    )
+    pairs = list(stream)
+    if guard:
+        guard.finish(reid for reid, _ in pairs)
+    if dead_letters:
+        dead_letters.settle(reid for reid, _ in pairs)
+    topics = [t for _, t in pairs if t]
     topics.sort(key=lambda t: t.reid)
     return topics
 
@@ -103,52 +309,287 @@ def find_topic(session: Session, reid: int) -> bool:
     return session.query(Topic).filter_by(reid=reid).one_or_none() != None
 
 
-def import_parsed_topics(session: Session, parsed_topics: list["ParsedTopic"]) -> None:
+def import_parsed_topic(
+    session: Session, p_topic: "ParsedTopic", replace: bool = False
+) -> None:
+    """
+    导入单个主题及其回帖并提交，已存在的 reid 直接跳过。
+
+    replace 为 True 时先删除已导入的旧版本，删除与重新导入在同一个事务中提交。
+    """
+    hold_constraints(session)
+    if replace:
+        delete_topic(session, p_topic.reid)
+    elif find_topic(session, p_topic.reid):
+        return
+    author = get_or_create_author(session, p_topic.author.username)
+    board = get_or_create_board(session, p_topic.board)
+    topic = Topic(
+        reid=p_topic.reid,
+        title=p_topic.title,
+        author=author,
+        board=board,
+        content=p_topic.content,
+        created_at=p_topic.created_at,
+        search_vector=func.to_tsvector(
+            "simple", segment(f"{p_topic.title}\n{p_topic.content}")
+        ),
+        embedding=p_topic.embedding,
+        original_reid=p_topic.original_reid,
+    )
+    session.add(topic)
+    session.flush()
+    posts = []
+    tree = thread_tree(p_topic.posts)
+    for seq, p_post in enumerate(p_topic.posts):
+        node = tree[seq]
+        post_author = get_or_create_author(session, p_post.author.username)
+        content = p_post.content if p_post.quote_embedded else p_post.text_in
+        post = Post(
+            content=content,
+            topic=topic,
+            author=post_author,
+            created_at=p_post.created_at,
+            search_vector=func.to_tsvector("simple", segment(content)),
+            embedding=p_post.embedding,
+            reply_to_id=posts[p_post.reply_to_id].id
+            if p_post.reply_to_id != -1
+            else None,
+            depth=node.depth,
+            path=node.path,
+            root_id=posts[node.root_seq].id if node.root_seq != seq else None,
+        )
+        posts.append(post)
+        session.add(post)
+        session.flush()
+        if node.root_seq == seq:
+            # 最顶层回帖的根是它自己，id 在 flush 之后才确定
+            post.root_id = post.id
+    session.commit()
+
+
+def import_parsed_topics(
+    session: Session,
+    parsed_topics: list["ParsedTopic"],
+    guard: SlowDocumentGuard | None = None,
+    dead_letters: DeadLetterSink | None = None,
+    retry_conflicts: bool = False,
+    replace: Container[str] = (),
+) -> list["ParsedTopic"]:
     """
-    将 ParsedTopic 列表导入数据库。
+    将 ParsedTopic 列表导入数据库，返回成功提交（或已经存在）的主题。
 
     - 自动去重 Author（按 username）
     - 自动去重 Board（按 name）
     - 忽略 ParsedAuthor.nickname
     - 正确建立 Topic 和 Post 的关系
+
+    每个主题单独提交；给出 dead_letters 时，导入失败的主题回滚后记为死信，不影响同批的其他主题。
+    retry_conflicts 为 True 时（多机 worker）违反约束的主题总是抛出 IntegrityError，由调用方重新排队。
+    reid 在 replace 中的主题替换已导入的旧版本，失败时旧版本随回滚保留。
     """
-    # 为性能考虑，可以先收集所有唯一 username 和 board name，但这里逐条处理更清晰
+    imported = []
     for p_topic in parsed_topics:
-        if find_topic(session, p_topic.reid):
-            continue
-        author = get_or_create_author(session, p_topic.author.username)
-        board = get_or_create_board(session, p_topic.board)
-        topic = Topic(
-            reid=p_topic.reid,
-            title=p_topic.title,
-            author=author,
-            board=board,
-            content=p_topic.content,
-            created_at=p_topic.created_at,
-        )
-        session.add(topic)
-        session.flush()
-        posts = []
-        for p_post in p_topic.posts:
-            post_author = get_or_create_author(session, p_post.author.username)
-            post = Post(
-                content=p_post.content if p_post.quote_embedded else p_post.text_in,
-                topic=topic,
-                author=post_author,
-                created_at=p_post.created_at,
-                reply_to_id=posts[p_post.reply_to_id].id
-                if p_post.reply_to_id != -1
-                else None,
-            )
-            posts.append(post)
-            session.add(post)
-            session.flush()
-
+        start = time.perf_counter()
         try:
-            session.commit()
+            import_parsed_topic(session, p_topic, str(p_topic.reid) in replace)
         except Exception as e:
             session.rollback()
-            raise e
+            # 并发 worker 之间的冲突交给调用方重试，不算作坏文档
+            if not dead_letters or (retry_conflicts and isinstance(e, IntegrityError)):
+                raise
+            dead_letters.record(p_topic.reid, STAGE_IMPORT, e)
+            continue
+        imported.append(p_topic)
+        if guard:
+            guard.record(p_topic.reid, "import", time.perf_counter() - start)
+    return imported
+
+
+def delete_topic(session: Session, reid: str | int) -> None:
+    """删除已导入的主题及其回帖，用于重新导入被改写的文档；不提交，由调用方与重新导入一起提交"""
+    topic = session.query(Topic).filter_by(reid=reid).one_or_none()
+    if topic is None:
+        return
+    posts = session.query(Post).filter_by(topic_id=topic.id)
+    # 回帖之间互相引用，先断开再整体删除
+    posts.update({Post.reply_to_id: None, Post.root_id: None})
+    posts.delete()
+    session.delete(topic)
+    # 工作单元会把 DELETE 排在 INSERT 之后，先执行删除，重新插入同一个 reid 时才不会冲突
+    session.flush()
+
+
+def follow_board(
+    board: str,
+    embed: bool,
+    batch_size: int,
+    linger: float,
+    dedup: FingerprintIndex | None,
+    guard: SlowDocumentGuard,
+    dead_letters: DeadLetterSink,
+):
+    """
+    常驻进程：监听版块集合的新文档与改写的文档，按微批次解析、重建回复并导入。
+
+    进度保存在 checkpoints/<board>.follow.json 中，重启后从上次导入的事件继续；
+    第一次启动时从版块检查点的 reid 之后开始补齐。
+    """
+    session = make_session(config.postgres)
+    organizer = ReplyOrganizer(embed=embed)
+    cursor = FollowCursor.load(CHECKPOINT_DIRECTORY, board)
+    if cursor.token is None and cursor.reid is None:
+        checkpoint = CheckpointStore(CHECKPOINT_DIRECTORY).load(board)
+        cursor.reid = checkpoint.reid if checkpoint else None
+    with open_collection(board) as collection:
+        feed = ChangeFeed(collection, cursor, batch_size, linger, linger)
+        print(f"Following {board}")
+        for batch in feed.batches():
+            start = time.perf_counter()
+            # 常驻期间可能训练了新的字典，每个批次前重新加载
+            load_codecs(collection.database, board)
+            stream = iter_parsed_topics(
+                board,
+                batch.reids,
+                embed,
+                dedup=dedup,
+                guard=guard,
+                dead_letters=dead_letters,
+                organizer=organizer,
+                collection=collection,
+            )
+            topics = sorted((t for _, t in stream if t), key=lambda t: t.reid)
+            # 改写的文档解析失败时不会进入 topics，已导入的旧版本保持不变
+            imported = import_parsed_topics(
+                session, topics, guard, dead_letters, replace=batch.changed
+            )
+            if dedup:
+                dedup.register(dedup.originals(imported))
+            guard.finish(batch.reids)
+            dead_letters.settle(batch.reids)
+            cursor.reid = max([cursor.reid or "", *batch.reids]) or None
+            cursor.token = batch.token or cursor.token
+            cursor.save(CHECKPOINT_DIRECTORY)
+            elapsed = time.perf_counter() - start
+            print(f"Imported {len(topics)}/{len(batch.reids)} documents in {elapsed:.2f}s")
+
+
+def print_dead_letter_report(dead_letters: DeadLetterSink):
+    if dead_letters.total == 0:
+        return
+    print(
+        f"{dead_letters.total} documents failed and were recorded as dead letters "
+        f"in {dead_letters.store.location}; rerun with --retry-dead-letters"
+    )
+
+
+def print_dedup_report(index: FingerprintIndex):
+    for name, (seen, dups) in index.report().items():
+        print(f"{name}: {dups}/{seen} topics are reposts ({dups / max(seen, 1):.1%})")
+
+
+def enqueue_reids(
+    queue: WorkQueue,
+    board: str,
+    poi: str | list[str] | None,
+    snapshot: str | None = None,
+) -> int:
+    if poi:
+        return queue.enqueue(poigen(poi))
+    if snapshot:
+        with Snapshot(snapshot) as s:
+            return queue.enqueue(s.reids)
+    with pymongo.MongoClient(config.mongo) as client:
+        collection = client.get_database("sjtubbs").get_collection(board)
+        cursor = collection.find({}, {"_id": False, "reid": True}).sort("reid", 1)
+        return queue.enqueue(doc["reid"] for doc in cursor)
+
+
+def run_worker(
+    queue: WorkQueue,
+    board: str,
+    embed: bool,
+    batch_size: int,
+    cache: TopicCache | None,
+    from_cache: bool,
+    snapshot: str | None = None,
+    dedup: FingerprintIndex | None = None,
+    guard: SlowDocumentGuard | None = None,
+    dead_letters: DeadLetterSink | None = None,
+    poll_interval: float = 5.0,
+):
+    """
+    从 redis 队列领取 reid 批次，解析、重建回复并导入，直到队列与租约都清空。
+
+    主题逐个导入：与其他 worker 冲突（IntegrityError）的 reid 交给 queue.retry() 稍后重试，
+    同批的其他 reid 照常 ack；重试次数用尽或租约反复过期的 reid 记为死信。
+    """
+    session = make_session(config.postgres)
+    # 句向量模型、mongo 连接与压缩字典在所有批次之间共用
+    organizer = ReplyOrganizer(embed=embed)
+    with ExitStack() as stack:
+        collection = None
+        if not from_cache:
+            collection = stack.enter_context(open_collection(board, snapshot))
+        while True:
+            for reid in queue.requeue_expired():
+                exhausted_lease(reid, queue, dead_letters)
+            reids = queue.lease(batch_size)
+            if not reids:
+                queued, leased = queue.pending()
+                if queued == 0 and leased == 0:
+                    break
+                # 其他 worker 仍持有租约，等待它们完成或租约过期
+                time.sleep(poll_interval)
+                continue
+            conflicts: dict[str, IntegrityError] = {}
+            try:
+                stream = iter_parsed_topics(
+                    board,
+                    reids,
+                    embed,
+                    cache=cache,
+                    from_cache=from_cache,
+                    dedup=dedup,
+                    guard=guard,
+                    dead_letters=dead_letters,
+                    organizer=organizer,
+                    collection=collection,
+                )
+                topics = sorted((t for _, t in stream if t), key=lambda t: t.reid)
+                for topic in topics:
+                    try:
+                        imported = import_parsed_topics(
+                            session, [topic], guard, dead_letters, retry_conflicts=True
+                        )
+                        if dedup:
+                            dedup.register(dedup.originals(imported))
+                    except IntegrityError as e:
+                        # 与其他 worker 同时创建了同一个作者或主题
+                        conflicts[str(topic.reid)] = e
+            except BaseException:
+                queue.release(reids)
+                raise
+            for reid in queue.retry(list(conflicts)):
+                print(f"Giving up on {reid} after {queue.max_attempts} attempts")
+                if dead_letters:
+                    dead_letters.record(reid, STAGE_IMPORT, conflicts[reid])
+            done = [reid for reid in reids if reid not in conflicts]
+            queue.ack(done)
+            if guard:
+                guard.finish(done)
+            if dead_letters:
+                dead_letters.settle(done)
+
+
+def exhausted_lease(
+    reid: str, queue: WorkQueue, dead_letters: DeadLetterSink | None
+) -> None:
+    """租约反复过期通常说明处理这个文档时 worker 崩溃或卡死"""
+    print(f"Giving up on {reid}: its lease expired {queue.max_attempts} times")
+    if dead_letters:
+        error = TimeoutError(f"lease expired {queue.max_attempts} times")
+        dead_letters.record(reid, STAGE_IMPORT, error)
 
 
 @click.command()
@@ -165,23 +606,326 @@ def import_parsed_topics(session: Session, parsed_topics: list["ParsedTopic"]) -
     is_flag=True,
     default=False,
 )
-def reimporter(board: str, poi: str | list[str] | None, dryrun: bool):
+@click.option(
+    "--bulk",
+    help="First-time import: COPY into staging tables in parallel and build indexes and constraints afterwards.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--workers",
+    "-j",
+    help="The number of parallel postgres connections used by --bulk.",
+    type=int,
+    default=4,
+)
+@click.option(
+    "--embed",
+    help="Store the sentence embeddings computed by the reply organizer for semantic search.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--resume",
+    help="Continue from the last checkpoint of this board instead of starting from the first document.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--cache",
+    "use_cache",
+    help="Keep the parser output in an on-disk cache and reuse it for documents that were parsed before.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--from-cache",
+    help="Only organize and import topics from the parse cache, without reading mongo.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--snapshot",
+    help="Read the board from a snapshot file written by snapshotter.py instead of mongo.",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+)
+@click.option(
+    "--dedup",
+    help="Detect reposts across boards with a shared SimHash index in redis and link them to the original topic.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--slow-threshold",
+    help="Log documents whose parse, organize, asset or import stage takes longer than this many seconds.",
+    type=float,
+    default=5.0,
+)
+@click.option(
+    "--capture-slow",
+    help="Copy the raw mongo documents of slow topics into the regression corpus.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--backfill-threads",
+    help="Add missing columns and indexes, compute the materialized reply tree of posts imported before it existed, and exit.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--backfill-search",
+    help="Add missing columns and indexes, fill the search vectors of topics and posts imported before full-text search existed, and exit.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--retry-dead-letters",
+    help="Reprocess only the documents of this board that previously failed and were recorded as dead letters.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--follow",
+    help="Keep running and import new or re-crawled documents of the board in micro-batches as they reach mongodb.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--linger",
+    help="In --follow mode, how many seconds to wait for more documents before importing a partial micro-batch.",
+    type=float,
+    default=1.0,
+)
+@click.option(
+    "--enqueue",
+    help="Push the reids of the board (or of --poi) into the redis work queue and exit.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--worker",
+    help="Consume reids from the redis work queue until it is drained. Can run on many hosts at once.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--lease",
+    help="Seconds a worker may hold a batch before it is handed to another worker.",
+    type=int,
+    default=600,
+)
+@click.option(
+    "--max-attempts",
+    help="In --worker mode, how many times a reid may conflict or outlive its lease before it becomes a dead letter.",
+    type=int,
+    default=3,
+)
+@click.option(
+    "--batch-size",
+    help="The number of documents parsed before they are imported and the checkpoint is advanced.",
+    type=int,
+    default=200,
+)
+def reimporter(
+    board: str,
+    poi: str | list[str] | None,
+    dryrun: bool,
+    bulk: bool,
+    workers: int,
+    embed: bool,
+    resume: bool,
+    use_cache: bool,
+    from_cache: bool,
+    snapshot: str | None,
+    dedup: bool,
+    slow_threshold: float,
+    capture_slow: bool,
+    backfill_threads: bool,
+    backfill_search: bool,
+    retry_dead_letters: bool,
+    follow: bool,
+    linger: float,
+    enqueue: bool,
+    worker: bool,
+    lease: int,
+    max_attempts: int,
+    batch_size: int,
+):
     if poi:
         assert isinstance(poi, str) or isinstance(poi, list)
         if poi[0].isnumeric():
             poi = poi.split(",")
+    if resume and bulk:
+        raise click.UsageError("--resume cannot be combined with --bulk")
+    if follow and (
+        poi or resume or bulk or dryrun or snapshot or use_cache or from_cache
+    ):
+        raise click.UsageError(
+            "--follow reads mongodb directly and cannot be combined with "
+            "--poi, --resume, --bulk, --dryrun, --snapshot or the parse cache"
+        )
+    if follow and (retry_dead_letters or enqueue or worker):
+        raise click.UsageError("--follow runs on its own")
+    if retry_dead_letters and (poi or resume):
+        raise click.UsageError(
+            "--retry-dead-letters cannot be combined with --poi or --resume"
+        )
+    if backfill_threads:
+        # make_session 会先补上旧库中缺少的 depth/root_id/path 列与对应的索引
+        print(f"Backfilled {backfill(make_session(config.postgres))} posts")
+        return
+    if backfill_search:
+        session = make_session(config.postgres)
+        print(f"Backfilled search vectors of {backfill_search_vectors(session)} rows")
+        return
     global BASE_FILE_DIRECTORY
     BASE_FILE_DIRECTORY += "/" + board
     os.makedirs(BASE_FILE_DIRECTORY, exist_ok=True)
-    topics = parse_all_topics(board, poi)
-    session = make_session(config.postgres)
-    if not dryrun:
-        import_parsed_topics(session, topics)
+    cache = None
+    if use_cache or from_cache:
+        cache = TopicCache(CACHE_DIRECTORY, board)
+        # 无论正常返回、提前返回还是抛出异常，都要提交最后一批缓存
+        click.get_current_context().call_on_close(cache.close)
+    index = FingerprintIndex(connect(config.redis)) if dedup else None
+    guard = SlowDocumentGuard(
+        SLOWLOG_DIRECTORY,
+        board,
+        slow_threshold,
+        CORPUS_DIRECTORY if capture_slow else None,
+    )
+    # 多机 worker 的死信集中保存在 redis 中，任意一台机器都可以重试
+    if enqueue or worker:
+        letters = RedisDeadLetters(connect(config.redis), board)
     else:
+        letters = JsonlDeadLetters(DEADLETTER_DIRECTORY, board)
+    if retry_dead_letters:
+        poi = sorted(letters.pending(), key=int)
+        if not poi:
+            print(f"No dead letters for {board}")
+            return
+        print(f"Retrying {len(poi)} dead letters of {board}")
+    dead_letters = DeadLetterSink(letters, poi if retry_dead_letters else ())
+
+    if follow:
+        try:
+            follow_board(board, embed, batch_size, linger, index, guard, dead_letters)
+        except KeyboardInterrupt:
+            pass
+        if index:
+            print_dedup_report(index)
+        print_dead_letter_report(dead_letters)
+        return
+
+    if enqueue or worker:
+        queue = WorkQueue(connect(config.redis), board, lease, max_attempts)
+        if enqueue:
+            count = enqueue_reids(queue, board, poi, snapshot)
+            print(f"Enqueued {count} reids for {board}")
+        else:
+            run_worker(
+                queue,
+                board,
+                embed,
+                batch_size,
+                cache,
+                from_cache,
+                snapshot,
+                index,
+                guard,
+                dead_letters,
+            )
+        if index and worker:
+            print_dedup_report(index)
+        if worker:
+            print_dead_letter_report(dead_letters)
+        return
+
+    if dryrun:
+        topics = parse_all_topics(
+            board, poi, embed, cache, from_cache, snapshot, index, guard, dead_letters
+        )
+        print_dead_letter_report(dead_letters)
+        if not topics:
+            return
         for post in topics[0].posts:
             print(post.reply_to_id, post.content)
             if post.reply_to_id != -1:
                 print(topics[0].posts[post.reply_to_id])
+        if index:
+            print_dedup_report(index)
+        return
+
+    session = None
+    loader = None
+    store = None
+    if bulk:
+        loader = BulkLoader(config.postgres, workers)
+        loader.prepare(board)
+    else:
+        session = make_session(config.postgres)
+        # 重试死信只处理零散的 reid，不能推进整个版块的检查点
+        if not retry_dead_letters:
+            store = CheckpointStore(CHECKPOINT_DIRECTORY)
+
+    committed = None
+    if resume:
+        checkpoint = store.load(board)
+        if checkpoint and checkpoint.phase == PHASE_DONE:
+            print(f"{board} has already been reimported, nothing to resume")
+            return
+        if checkpoint:
+            committed = checkpoint.reid
+            print(f"Resuming {board} after reid {committed} ({checkpoint.phase})")
+
+    stream = iter_parsed_topics(
+        board,
+        poi,
+        embed,
+        committed,
+        cache,
+        from_cache,
+        snapshot,
+        index,
+        guard,
+        dead_letters,
+    )
+    # 批量加载在 finish() 时才提交，其中的原帖到那时才登记到指纹索引
+    originals = []
+    try:
+        for chunk in itertools.batched(stream, batch_size):
+            topics = sorted((t for _, t in chunk if t), key=lambda t: t.reid)
+            if store:
+                store.save(Checkpoint(board, committed, PHASE_IMPORTING))
+            if loader:
+                loader.load(topics)
+                if index:
+                    originals += index.originals(topics)
+            else:
+                imported = import_parsed_topics(session, topics, guard, dead_letters)
+                if index:
+                    index.register(index.originals(imported))
+            guard.finish(reid for reid, _ in chunk)
+            dead_letters.settle(reid for reid, _ in chunk)
+            # import_parsed_topics 会跳过已存在的 reid，崩溃在提交与写检查点之间也不会重复导入
+            committed = chunk[-1][0]
+            if store:
+                store.save(Checkpoint(board, committed, PHASE_IMPORTED))
+        if loader:
+            loader.finish()
+            if index:
+                index.register(originals)
+    except BaseException:
+        # 批量加载失败时恢复移除的约束与索引，不让整个存档停留在没有约束的状态
+        if loader:
+            loader.abort()
+        raise
+    if store:
+        store.save(Checkpoint(board, committed, PHASE_DONE))
+    if index:
+        print_dedup_report(index)
+    print_dead_letter_report(dead_letters)
 
 
 if __name__ == "__main__":
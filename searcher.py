@@ -0,0 +1,86 @@
+import statistics
+import time
+
+import click
+
+from pypkg.config import load_config
+from pypkg.models.postgres import Post, make_session
+from pypkg.search import search, similar_topics
+from pypkg.threadtree import ancestors, subtree
+
+config = load_config()
+
+
+@click.command()
+@click.argument("query")
+@click.option("--board", "-b", help="Only search topics in this board.", default=None)
+@click.option("--author", "-a", help="Only search posts by this username.", default=None)
+@click.option("--limit", "-n", help="The number of results to show.", default=20)
+@click.option(
+    "--bench",
+    help="Run the query this many times against the archive and report the latency instead of the results.",
+    type=int,
+    default=0,
+)
+@click.option(
+    "--similar",
+    help="Treat QUERY as a topic reid and list the semantically closest topics.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--thread",
+    help="Treat QUERY as a post id and show its reply chain and the replies below it.",
+    is_flag=True,
+    default=False,
+)
+def searcher(
+    query: str,
+    board: str | None,
+    author: str | None,
+    limit: int,
+    bench: int,
+    similar: bool,
+    thread: bool,
+):
+    session = make_session(config.postgres)
+
+    def run():
+        if thread:
+            post = session.get(Post, int(query))
+            return ancestors(session, post) + subtree(session, post) if post else []
+        if similar:
+            return similar_topics(session, int(query), board, limit)
+        return search(session, query, board, author, limit)
+
+    if bench:
+        latencies: list[float] = []
+        hits = []
+        for _ in range(bench):
+            start = time.perf_counter()
+            hits = run()
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f"query={query!r} runs={bench} hits={len(hits)}")
+        print(
+            f"min={latencies[0]:.2f}ms "
+            f"p50={statistics.median(latencies):.2f}ms "
+            f"p95={latencies[int(0.95 * (len(latencies) - 1))]:.2f}ms "
+            f"max={latencies[-1]:.2f}ms"
+        )
+        return
+
+    if thread:
+        for post in run():
+            line = " ".join(post.content.split())[:80]
+            print(f"{'  ' * post.depth}#{post.id} {post.author.username}: {line}")
+        return
+
+    for hit in run():
+        snippet = " ".join(hit.snippet.split())
+        print(f"[{hit.rank:.3f}] {hit.board}/{hit.reid} {hit.kind} {hit.author}: {hit.title}")
+        print(f"    {snippet}")
+
+
+if __name__ == "__main__":
+    searcher()
@@ -0,0 +1,73 @@
+import os
+
+import click
+import pymongo
+from tqdm import tqdm
+
+from pypkg.codec import load_codecs
+from pypkg.config import load_config
+from pypkg.snapshot import Snapshot, SnapshotWriter
+
+config = load_config()
+
+SNAPSHOT_DIRECTORY: str = os.getenv("ROOT") + "/snapshots"
+
+
+@click.group()
+def snapshotter():
+    pass
+
+
+@snapshotter.command()
+@click.option("--board", "-b", help="The board collection to export.")
+@click.option(
+    "--output",
+    "-o",
+    help="The snapshot file. Defaults to snapshots/<board>.snap under $ROOT.",
+    default=None,
+)
+@click.option(
+    "--append",
+    help="Only append documents whose reid is greater than the last one in the snapshot.",
+    is_flag=True,
+    default=False,
+)
+def export(board: str, output: str | None, append: bool):
+    """Write a board collection into a reid-sorted snapshot file."""
+    if output is None:
+        os.makedirs(SNAPSHOT_DIRECTORY, exist_ok=True)
+        output = os.path.join(SNAPSHOT_DIRECTORY, f"{board}.snap")
+    writer = SnapshotWriter(output, append)
+    with pymongo.MongoClient(config.mongo) as client:
+        db = client.get_database("sjtubbs")
+        load_codecs(db, board)
+        collection = db.get_collection(board)
+        after = writer.last_reid
+        query = {"reid": {"$gt": after}} if after is not None else {}
+        total = collection.count_documents(query)
+        for doc in tqdm(
+            collection.find(query, {"_id": False}).sort("reid", 1),
+            total=total,
+            desc=board,
+        ):
+            writer.write(doc)
+    writer.close()
+    print(f"{output}: {len(writer.reids)} documents")
+
+
+@snapshotter.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def info(path: str):
+    """Print the number of documents, the reid range and the dictionaries of a snapshot."""
+    with Snapshot(path) as snapshot:
+        print(f"{path}: {len(snapshot)} documents, {os.path.getsize(path) / 2**20:.1f}MiB")
+        if len(snapshot):
+            print(f"reid: {snapshot.reids[0]} .. {snapshot.reids[-1]}")
+        for dict_id, codec in snapshot.codecs.items():
+            print(f"dictionary {dict_id}: {len(codec.dictionary)} bytes")
+        if (tail := os.path.getsize(path) - snapshot.size) > 0:
+            print(f"{tail} bytes left by an interrupted append, dropped by the next --append")
+
+
+if __name__ == "__main__":
+    snapshotter()
@@ -0,0 +1,41 @@
+import importlib
+import os
+
+import pytest
+
+CONFIG = """\
+redis: "127.0.0.1:6379"
+cookie: ""
+mongo: "mongodb://127.0.0.1:27017"
+postgres: "postgresql://127.0.0.1/postgres"
+asset_uri_base: "http://assets.test"
+asset_endpoint: "http://assets.test"
+"""
+
+
+@pytest.fixture(scope="session")
+def root(tmp_path_factory):
+    """reimporter 在导入时读取 $ROOT 与当前目录下的 config.yml，这里换成临时目录"""
+    path = tmp_path_factory.mktemp("root")
+    (path / "config.yml").write_text(CONFIG)
+    cwd, saved = os.getcwd(), os.environ.get("ROOT")
+    os.environ["ROOT"] = str(path)
+    os.chdir(path)
+    yield path
+    os.chdir(cwd)
+    if saved is None:
+        del os.environ["ROOT"]
+    else:
+        os.environ["ROOT"] = saved
+
+
+@pytest.fixture(scope="session")
+def reimporter(root):
+    return importlib.import_module("reimporter")
+
+
+@pytest.fixture(scope="session")
+def filter_module(root):
+    # filter.py 在导入时就会打开 logs/ 下的日志文件
+    os.makedirs("logs", exist_ok=True)
+    return importlib.import_module("filter")
@@ -0,0 +1,92 @@
+import pytest
+from click.testing import CliRunner
+from sqlalchemy.dialects import postgresql
+
+from pypkg.models import postgres
+
+
+@pytest.mark.parametrize(
+    "flag, backfill",
+    [
+        ("--backfill-threads", "backfill"),
+        ("--backfill-search", "backfill_search_vectors"),
+    ],
+)
+def test_backfill_uses_an_upgraded_session(reimporter, monkeypatch, flag, backfill):
+    calls = []
+    monkeypatch.setattr(reimporter, "make_session", lambda dsn: calls.append("session") or "session")
+    monkeypatch.setattr(reimporter, backfill, lambda session: calls.append(session) or 0)
+    result = CliRunner().invoke(reimporter.reimporter, [flag])
+    assert result.exit_code == 0, result.output
+    assert calls == ["session", "session"]
+
+
+class FakeInspector:
+    def __init__(self, columns: dict[str, list[str]], indexes: dict[str, list[str]]):
+        self.columns = columns
+        self.indexes = indexes
+
+    def get_columns(self, table):
+        return [{"name": name} for name in self.columns.get(table, [])]
+
+    def get_indexes(self, table):
+        return [{"name": name} for name in self.indexes.get(table, [])]
+
+
+def complete_inspector() -> FakeInspector:
+    return FakeInspector(
+        {t.name: [c.name for c in t.columns] for t in postgres.Base.metadata.sorted_tables},
+        {t.name: [i.name for i in t.indexes] for t in postgres.Base.metadata.sorted_tables},
+    )
+
+
+def test_upgrade_statements_only_add_what_is_missing():
+    dialect = postgresql.dialect()
+    inspector = complete_inspector()
+    assert postgres.upgrade_statements(dialect, inspector) == []
+
+    inspector.columns["posts"].remove("embedding")
+    inspector.indexes["posts"].remove("ix_posts_embedding")
+    statements = postgres.upgrade_statements(dialect, inspector)
+    assert len(statements) == 2
+    assert statements[0].startswith("ALTER TABLE posts ADD COLUMN IF NOT EXISTS embedding")
+    assert "ix_posts_embedding" in statements[1]
+
+
+class FakeConnection:
+    def __init__(self, executed: list[str]):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        self.executed.append(str(statement))
+
+
+class FakeEngine:
+    dialect = postgresql.dialect()
+
+    def __init__(self):
+        self.executed: list[str] = []
+
+    def begin(self):
+        return FakeConnection(self.executed)
+
+
+def test_upgrade_schema_skips_the_lock_when_up_to_date(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(postgres, "inspect", lambda conn: complete_inspector())
+    postgres.upgrade_schema(engine)
+    assert engine.executed == []
+
+    inspector = complete_inspector()
+    inspector.columns["posts"].remove("search_vector")
+    monkeypatch.setattr(postgres, "inspect", lambda conn: inspector)
+    postgres.upgrade_schema(engine)
+    assert "pg_advisory_xact_lock_shared" in engine.executed[0]
+    assert engine.executed[1].startswith("ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector")
+    assert len(engine.executed) == 2
@@ -0,0 +1,125 @@
+import random
+
+import markdownify
+import pytest
+from bs4 import BeautifulSoup
+
+from pypkg.bbsmarkdown import bbs_markdownify, parse
+from pypkg.parser import Parser
+
+WORDS = [
+    "水源",
+    "交大",
+    "hello",
+    "foo_bar",
+    "*重要*",
+    "a__b",
+    "http://bbs.sjtu.edu.cn",
+    "【转载】",
+    "x < y",
+    "Tom &amp; Jerry",
+    "R&D",
+    "&lt;pre&gt;",
+    "100%",
+    "[1]",
+    "\\",
+    "`code`",
+    "#",
+]
+SPACES = [" ", "  ", "\t", "\n", "\n\n", "\r\n", " \n ", "\n\n\n", ""]
+COLORS = ["red", "#ff0000", "'blue'", '"green"', "yellow"]
+HREFS = [
+    "http://bbs.sjtu.edu.cn",
+    "http://bbs.sjtu.edu.cn/file/a_b.jpg",
+    "/bbscon?board=water&file=M.1",
+    "",
+]
+
+
+def text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 4)):
+        parts.append(rng.choice(WORDS))
+        parts.append(rng.choice(SPACES))
+    return "".join(parts)
+
+
+def attr(rng: random.Random, name: str, value: str) -> str:
+    quote = rng.choice(['"', "'", ""]) if value and " " not in value else '"'
+    return f" {name}={quote}{value}{quote}"
+
+
+def fragment(rng: random.Random, depth: int = 0) -> str:
+    """按 SJTUBBS <pre> 正文的形态生成 font/a/img/br 片段，包括未闭合与多余的结束标签"""
+    out = []
+    for _ in range(rng.randint(1, 5)):
+        kind = rng.random()
+        if kind < 0.35 or depth > 3:
+            out.append(text(rng))
+        elif kind < 0.55:
+            tag = rng.choice(["font", "FONT", "Font"])
+            inner = fragment(rng, depth + 1)
+            close = rng.choice([f"</{tag}>", "</font>", ""])
+            out.append(f"<{tag}{attr(rng, 'color', rng.choice(COLORS))}>{inner}{close}")
+        elif kind < 0.75:
+            href = rng.choice(HREFS)
+            attrs = attr(rng, "href", href) if rng.random() < 0.9 else ""
+            if rng.random() < 0.2:
+                attrs += attr(rng, "title", rng.choice(["链接", 'say "hi"']))
+            inner = href if rng.random() < 0.4 else fragment(rng, depth + 1)
+            out.append(f"<a{attrs}>{inner}</a>")
+        elif kind < 0.85:
+            attrs = attr(rng, "src", rng.choice(HREFS))
+            if rng.random() < 0.5:
+                attrs += attr(rng, "alt", rng.choice(["图", "a_b", ""]))
+            if rng.random() < 0.2:
+                attrs += attr(rng, "title", 'pic "1"')
+            out.append(f"<img{attrs}{rng.choice(['', '/', ' /'])}>")
+        elif kind < 0.95:
+            out.append(rng.choice(["<br>", "<br/>", "<BR>", "<br />"]))
+        else:
+            out.append(rng.choice(["</font>", "</a>", "<b>粗体</b>", "<!-- x -->"]))
+    return "".join(out)
+
+
+def serialize(raw: str) -> str:
+    # 与解析器相同：先由 BeautifulSoup 解析页面，再把 <pre> 的子节点序列化后转换
+    pre = BeautifulSoup(f"<pre>{raw}</pre>", features="html.parser").pre
+    return Parser.to_raw_html(pre)
+
+
+def assert_same(raw: str) -> None:
+    source = serialize(raw)
+    assert bbs_markdownify(source) == markdownify.markdownify(source), source
+
+
+@pytest.mark.filterwarnings("ignore::bs4.MarkupResemblesLocatorWarning")
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_markdownify(seed: int):
+    rng = random.Random(seed)
+    for _ in range(250):
+        assert_same(fragment(rng))
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "",
+        "   ",
+        '<font color="red">红字</font>\n第二行',
+        "<a href=\"http://bbs.sjtu.edu.cn\">http://bbs.sjtu.edu.cn</a>",
+        '<a href="http://bbs.sjtu.edu.cn"> 水源 </a>后',
+        "<a>no href</a>",
+        '<img src="/file/a.jpg" alt="a_b" title="say &quot;hi&quot;">',
+        "一<br>二<br/><br>三",
+        "<font color=red>未闭合 *加粗* foo_bar",
+        "</font>多余的结束标签",
+    ],
+)
+def test_known_fragments(source: str):
+    assert_same(source)
+
+
+def test_common_fragments_skip_markdownify():
+    # 只有 font/a/img/br 的正文不应回退到 markdownify
+    parse(serialize('<font color="red">红字</font><a href="/a">链接</a><br><img src="/b">'))
@@ -0,0 +1,171 @@
+import csv
+from datetime import datetime
+
+import pytest
+
+from pypkg import bulkload
+from pypkg.bulkload import DEFERRED_DDL_LOCK, STAGING_LOCK, BulkLoader
+from pypkg.parser import ParsedAuthor, ParsedTopic
+
+DDL = [
+    (1, "CREATE UNIQUE INDEX ix_authors_username ON authors (username)"),
+    (2, "ALTER TABLE posts ADD CONSTRAINT posts_topic_id_fkey FOREIGN KEY (topic_id)"),
+]
+
+
+class FakeDatabase:
+    """只模拟 BulkLoader 用到的查询，记录执行过的语句"""
+
+    def __init__(self, archive_empty: bool, deferred=()):
+        self.archive_empty = archive_empty
+        self.deferred = list(deferred)
+        self.executed: list[str] = []
+        self.copied = 0
+        self.connects = 0
+        self.open = 0
+        self.locks: list[int] = []
+
+    def connect(self, dsn):
+        self.connects += 1
+        self.open += 1
+        return FakeConnection(self)
+
+
+class FakeEngine:
+    def dispose(self):
+        pass
+
+
+def drops(db: FakeDatabase) -> list[str]:
+    return [sql for sql in db.executed if sql.startswith(("ALTER TABLE posts DROP", "DROP INDEX"))]
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.db.open -= 1
+
+
+class FakeCursor:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql: str, params=None):
+        db = self.db
+        db.executed.append(sql)
+        if "pg_advisory_lock" in sql:
+            db.locks.append(params[0])
+        elif "pg_advisory_unlock" in sql:
+            db.locks.remove(params[0])
+        elif "JOIN boards b" in sql:
+            self.result = [(False,)]
+        elif sql == "SELECT NOT EXISTS (SELECT 1 FROM topics)":
+            self.result = [(db.archive_empty,)]
+        elif sql == bulkload.CAPTURE_DEFERRED_SQL:
+            db.deferred = list(DDL)
+        elif sql == bulkload.DROP_DEFERRED_SQL:
+            self.result = [("ALTER TABLE posts DROP CONSTRAINT posts_topic_id_fkey",)]
+        elif sql == bulkload.DROP_INDEXES_SQL:
+            self.result = [("DROP INDEX ix_authors_username",)]
+        elif sql.startswith("SELECT phase, statement"):
+            self.result = list(db.deferred)
+        elif sql.startswith("DELETE FROM staging_deferred_ddl"):
+            db.deferred = [d for d in db.deferred if d[1] != params[0]]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def copy_expert(self, sql, buf):
+        if "staging_topics" in sql:
+            self.db.copied += sum(1 for _ in csv.reader(buf))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    def make(archive_empty: bool, deferred=()):
+        db = FakeDatabase(archive_empty, deferred)
+        monkeypatch.setattr(bulkload.psycopg2, "connect", db.connect)
+        monkeypatch.setattr(bulkload, "make_engine", lambda dsn: FakeEngine())
+        return db
+
+    return make
+
+
+def topic(reid: int) -> ParsedTopic:
+    return ParsedTopic(
+        reid=reid,
+        author=ParsedAuthor("op", "op"),
+        board="water",
+        created_at=datetime(2010, 1, 1),
+        title="title",
+        content=f"reid={reid}\n\nbody",
+        text_in="body\n",
+        posts=[],
+        assets=[],
+    )
+
+
+def restored(db: FakeDatabase) -> list[str]:
+    return [sql for sql in db.executed if sql in {s for _, s in DDL}]
+
+
+def test_later_boards_keep_constraints_and_reuse_connections(database):
+    db = database(archive_empty=False)
+    loader = BulkLoader("dsn", workers=3)
+    loader.prepare("water")
+    assert not loader.defer
+    assert db.locks == [STAGING_LOCK]
+    for start in range(0, 100, 10):
+        loader.load([topic(start + i) for i in range(10)])
+    loader.finish()
+    assert db.copied == 100
+    # 一个持锁连接加 workers 个 COPY 连接，各批次之间不再重新连接
+    assert db.connects == 4
+    assert db.open == 0
+    assert drops(db) == []
+    assert restored(db) == []
+
+
+def test_empty_archive_defers_ddl_and_restores_it_on_failure(database):
+    db = database(archive_empty=True)
+    loader = BulkLoader("dsn", workers=2)
+    loader.prepare("water")
+    assert loader.defer
+    assert db.locks == [STAGING_LOCK, DEFERRED_DDL_LOCK]
+    assert len(drops(db)) == 2
+    loader.load([topic(1)])
+    loader.abort()
+    assert restored(db) == [s for _, s in DDL]
+    assert db.deferred == []
+    assert db.open == 0
+
+
+def test_prepare_restores_ddl_left_by_a_crashed_load(database):
+    db = database(archive_empty=False, deferred=DDL)
+    loader = BulkLoader("dsn", workers=2)
+    loader.prepare("water")
+    assert restored(db) == [s for _, s in DDL]
+    assert db.deferred == []
+    loader.finish()
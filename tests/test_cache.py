@@ -0,0 +1,50 @@
+import pytest
+from click.testing import CliRunner
+
+from pypkg.cache import TopicCache, parser_version
+
+REIDS = [str(1000 + i) for i in range(5)]
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def cache_directory(reimporter, monkeypatch, tmp_path):
+    monkeypatch.setattr(reimporter, "CACHE_DIRECTORY", str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("crash", [False, True])
+def test_pending_cache_entries_survive_every_exit(
+    reimporter, monkeypatch, cache_directory, crash
+):
+    def parse_all_topics(board, poi, embed, cache, *args):
+        # 不满 COMMIT_INTERVAL，全部停留在未提交的事务中
+        for reid in REIDS:
+            cache.put(reid, None)
+        if crash:
+            raise Crash
+        return []
+
+    monkeypatch.setattr(reimporter, "parse_all_topics", parse_all_topics)
+    result = CliRunner().invoke(
+        reimporter.reimporter, ["-b", "cached", "--dryrun", "--cache"]
+    )
+    assert isinstance(result.exception, Crash) if crash else result.exit_code == 0
+
+    cache = TopicCache(cache_directory, "cached")
+    assert cache.count() == len(REIDS)
+    cache.close()
+
+
+def test_stale_cleanup_keeps_other_boards(tmp_path):
+    keep = ["a-b-0123456789ab.sqlite3", "a-b-0123456789ab.sqlite3-wal", "a-notes.txt"]
+    stale = [f"a-0123456789ab.sqlite3{suffix}" for suffix in ("", "-wal", "-shm")]
+    for name in keep + stale:
+        (tmp_path / name).touch()
+    TopicCache(str(tmp_path), "a").close()
+    current = f"a-{parser_version()}.sqlite3"
+    left = [p.name for p in tmp_path.iterdir() if not p.name.startswith(current)]
+    assert sorted(left) == sorted(keep)
@@ -0,0 +1,224 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from pypkg.cache import TopicCache
+from pypkg.checkpoint import (
+    PHASE_DONE,
+    PHASE_IMPORTED,
+    PHASE_IMPORTING,
+    Checkpoint,
+    CheckpointStore,
+)
+from pypkg.models.postgres import Base, Post, Topic
+from pypkg.organize import ReplyOrganizer
+from pypkg.parser import ParsedAuthor, ParsedPost, ParsedTopic
+from pypkg.snapshot import Snapshot, SnapshotWriter
+
+REIDS = [str(1000 + i) for i in range(10)]
+
+
+class Crash(Exception):
+    pass
+
+
+def test_store_round_trip(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    assert store.load("b") is None
+    store.save(Checkpoint("b", "1005", PHASE_IMPORTED))
+    checkpoint = store.load("b")
+    assert (checkpoint.reid, checkpoint.phase) == ("1005", PHASE_IMPORTED)
+    assert checkpoint.updated_at
+
+
+def test_crash_while_saving_keeps_previous_checkpoint(tmp_path, monkeypatch):
+    store = CheckpointStore(str(tmp_path))
+    store.save(Checkpoint("b", "1003", PHASE_IMPORTED))
+
+    def crash(obj, f):
+        f.write('{"board": "b", "re')
+        raise Crash
+
+    monkeypatch.setattr(json, "dump", crash)
+    with pytest.raises(Crash):
+        store.save(Checkpoint("b", "1004", PHASE_IMPORTED))
+    monkeypatch.undo()
+    assert store.load("b").reid == "1003"
+
+
+def test_poigen_resumes_after_checkpoint(reimporter, tmp_path):
+    poi = tmp_path / "poi"
+    poi.write_text("\n".join(REIDS) + "\n")
+    assert list(reimporter.poigen(str(poi), "1006")) == REIDS[7:]
+    assert list(reimporter.poigen(REIDS, REIDS[-1])) == []
+
+
+def test_poigen_rejects_checkpoint_outside_poi(reimporter):
+    with pytest.raises(ValueError):
+        list(reimporter.poigen(REIDS, "999"))
+
+
+def test_get_count_honours_checkpoint(reimporter, tmp_path):
+    assert reimporter.get_count(None, REIDS, "1003") == 6
+    path = str(tmp_path / "b.snap")
+    writer = SnapshotWriter(path)
+    for reid in REIDS:
+        writer.write({"reid": reid, "title": "t", "pages": ["p"], "section": "b"})
+    writer.close()
+    with Snapshot(path) as snapshot:
+        assert reimporter.get_count(snapshot, None, "1003") == 6
+        assert [reid for reid, _ in reimporter.docgen(snapshot, None, "1007")] == REIDS[8:]
+
+
+@dataclass
+class FakeTopic:
+    reid: str
+
+
+class FakeArchive:
+    """代替 postgres：记录已提交的 reid，与 import_parsed_topic 一样跳过已存在的主题"""
+
+    def __init__(self):
+        self.committed: list[str] = []
+        self.calls = 0
+        # (第几次调用, 是否在提交之后崩溃)
+        self.crash_at: tuple[int, bool] | None = None
+
+    def iter_parsed_topics(self, board, poi, embed, after, *args):
+        for reid in REIDS:
+            if after is None or reid > after:
+                yield reid, FakeTopic(reid)
+
+    def import_parsed_topics(self, session, topics, guard=None, dead_letters=None):
+        self.calls += 1
+        crash = self.crash_at and self.crash_at[0] == self.calls
+        if crash and not self.crash_at[1]:
+            raise Crash
+        for topic in topics:
+            if topic.reid not in self.committed:
+                self.committed.append(topic.reid)
+        if crash:
+            raise Crash
+
+
+@pytest.fixture
+def archive(reimporter, monkeypatch, tmp_path):
+    archive = FakeArchive()
+    monkeypatch.setattr(reimporter, "iter_parsed_topics", archive.iter_parsed_topics)
+    monkeypatch.setattr(reimporter, "import_parsed_topics", archive.import_parsed_topics)
+    monkeypatch.setattr(reimporter, "make_session", lambda dsn: None)
+    monkeypatch.setattr(reimporter, "CHECKPOINT_DIRECTORY", str(tmp_path))
+    return archive
+
+
+def run(reimporter, *args):
+    argv = ["-b", "b", "--batch-size", "3", *args]
+    return CliRunner().invoke(reimporter.reimporter, argv, catch_exceptions=True)
+
+
+@pytest.mark.parametrize("after_commit", [False, True])
+def test_resume_after_crash_imports_every_reid_once(
+    reimporter, archive, tmp_path, after_commit
+):
+    archive.crash_at = (2, after_commit)
+    result = run(reimporter)
+    assert isinstance(result.exception, Crash)
+
+    checkpoint = CheckpointStore(str(tmp_path)).load("b")
+    # 第一批已经提交，第二批在导入中崩溃
+    assert (checkpoint.reid, checkpoint.phase) == (REIDS[2], PHASE_IMPORTING)
+    assert archive.committed == (REIDS[:6] if after_commit else REIDS[:3])
+
+    archive.crash_at = None
+    result = run(reimporter, "--resume")
+    assert result.exit_code == 0, result.output
+    assert archive.committed == REIDS
+    checkpoint = CheckpointStore(str(tmp_path)).load("b")
+    assert (checkpoint.reid, checkpoint.phase) == (REIDS[-1], PHASE_DONE)
+
+
+def test_resume_of_finished_board_does_nothing(reimporter, archive, tmp_path):
+    assert run(reimporter).exit_code == 0
+    calls = archive.calls
+    result = run(reimporter, "--resume")
+    assert "nothing to resume" in result.output
+    assert archive.calls == calls
+
+
+# 在 sqlite 上建出与 postgres 相同的表，检索向量与语义向量按普通文本保存
+@compiles(TSVECTOR, "sqlite")
+@compiles(Vector, "sqlite")
+def compile_as_text(type_, compiler, **kw):
+    return "TEXT"
+
+
+def sqlite_engine(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def connect(conn, record):
+        conn.create_function("to_tsvector", 2, lambda config, text: text)
+        conn.create_collation("C", lambda a, b: (a > b) - (a < b))
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def parsed_topic(reid: str) -> ParsedTopic:
+    author = ParsedAuthor("op", "op")
+    posts = [
+        ParsedPost(author, datetime(2010, 1, 2), f"reply {i}", f"reply {i}\n", None, False)
+        for i in range(2)
+    ]
+    return ParsedTopic(int(reid), author, "b", datetime(2010, 1, 1), "t", "c", "c\n", posts, [])
+
+
+def test_killed_run_resumes_without_duplicates(reimporter, monkeypatch, tmp_path):
+    """真实的导入流程在提交之后、写入检查点之前被杀死，--resume 不会重复导入"""
+    cache = TopicCache(str(tmp_path / "cache"), "b")
+    for reid in REIDS:
+        cache.put(reid, parsed_topic(reid))
+    cache.close()
+    engine = sqlite_engine(str(tmp_path / "archive.db"))
+    monkeypatch.setattr(reimporter, "make_session", lambda dsn: sessionmaker(bind=engine)())
+    monkeypatch.setattr(reimporter, "CACHE_DIRECTORY", str(tmp_path / "cache"))
+    monkeypatch.setattr(reimporter, "CHECKPOINT_DIRECTORY", str(tmp_path))
+    # 回帖都没有引用，不会用到句向量模型
+    organizer = ReplyOrganizer.__new__(ReplyOrganizer)
+    organizer.embed = False
+    monkeypatch.setattr(reimporter, "ReplyOrganizer", lambda embed: organizer)
+
+    class KilledStore(CheckpointStore):
+        imported = 0
+
+        def save(self, checkpoint: Checkpoint) -> None:
+            if checkpoint.phase == PHASE_IMPORTED:
+                KilledStore.imported += 1
+                if KilledStore.imported == 2:
+                    raise Crash
+            super().save(checkpoint)
+
+    monkeypatch.setattr(reimporter, "CheckpointStore", KilledStore)
+    result = run(reimporter, "--from-cache")
+    assert isinstance(result.exception, Crash)
+    checkpoint = CheckpointStore(str(tmp_path)).load("b")
+    assert (checkpoint.reid, checkpoint.phase) == (REIDS[2], PHASE_IMPORTING)
+    # 第二批已经提交，只是没来得及写检查点
+    with sessionmaker(bind=engine)() as session:
+        assert session.query(Topic).count() == 6
+
+    result = run(reimporter, "--from-cache", "--resume")
+    assert result.exit_code == 0, result.output
+    with sessionmaker(bind=engine)() as session:
+        assert sorted(str(t.reid) for t in session.query(Topic)) == REIDS
+        assert session.query(Post).count() == 2 * len(REIDS)
+    checkpoint = CheckpointStore(str(tmp_path)).load("b")
+    assert (checkpoint.reid, checkpoint.phase) == (REIDS[-1], PHASE_DONE)
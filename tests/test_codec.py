@@ -0,0 +1,33 @@
+import random
+
+import pytest
+
+from pypkg.codec import LazyPages, PageCodec, train_dictionary
+
+NAMES = ["水源", "交大", "water", "SJTUNews", "今天", "食堂"]
+
+
+def page(rng: random.Random, reid: int) -> str:
+    lines = "\n".join(
+        " ".join(rng.choice(NAMES) for _ in range(rng.randint(1, 8)))
+        for _ in range(rng.randint(3, 20))
+    )
+    return (
+        '<html><body><table><tr><td><a href="bbstcon?board=water&reid='
+        f'{reid}">本篇全文</a><pre>发信人: user{rng.randint(1, 99)}, 信区: water\n'
+        f"{lines}\n--\n※ 来源:·饮水思源 bbs.sjtu.edu.cn·</pre></td></tr></table></body></html>"
+    )
+
+
+@pytest.fixture(scope="module")
+def pages() -> list[str]:
+    rng = random.Random(0)
+    return [page(rng, 1000 + i) for i in range(500)]
+
+
+def test_zstd_round_trip(pages):
+    codec = PageCodec(train_dictionary(pages[:400], size=16 * 1024))
+    encoded = [codec.encode(p) for p in pages[400:]]
+    assert sum(map(len, encoded)) < sum(len(p.encode()) for p in pages[400:]) / 4
+    assert list(LazyPages(encoded, PageCodec(codec.dictionary))) == pages[400:]
+
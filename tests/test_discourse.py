@@ -0,0 +1,50 @@
+import sqlite3
+from datetime import datetime
+
+from pypkg.discourse import DiscourseShard
+from pypkg.parser import ParsedAuthor, ParsedPost, ParsedTopic, QuoteReplyTo
+
+T0 = datetime(2010, 1, 1)
+QUESTION = "第一轮选课什么时候开始"
+
+
+def post(username: str, lines: list[str], reply_to_id: int) -> ParsedPost:
+    return ParsedPost(
+        author=ParsedAuthor(username, username),
+        created_at=T0,
+        content=f'[quote="op (o)"]\n{QUESTION}\n[/quote]\n' + "\n".join(lines),
+        # 与解析器一样，text_in 只有最后一行未引用的文字
+        text_in=lines[-1] + "\n",
+        quote_reply_to=QuoteReplyTo("op (o)", QUESTION),
+        quote_embedded=False,
+        reply_to_id=reply_to_id,
+    )
+
+
+def test_replies_keep_their_whole_body(tmp_path):
+    topic = ParsedTopic(
+        reid=1001,
+        author=ParsedAuthor("op", "op"),
+        board="water",
+        created_at=T0,
+        title="选课",
+        content=f"reid=1001\n\n{QUESTION}",
+        text_in=QUESTION + "\n",
+        posts=[
+            # 没有找到被回复的帖子，引文需要保留
+            post("alice", ["下周一开始", "记得先看培养方案", "--"], -1),
+            post("bob", ["同问", "--"], 0),
+        ],
+        assets=[],
+    )
+    shard = DiscourseShard(str(tmp_path / "water.db"), "water", str(tmp_path), "files")
+    shard.add(topic)
+    shard.close()
+
+    with sqlite3.connect(tmp_path / "water.db") as conn:
+        rows = conn.execute(
+            "SELECT post_number, reply_to_post_number, raw FROM posts ORDER BY post_number"
+        ).fetchall()
+    assert rows[0] == (1, None, QUESTION)
+    assert rows[1] == (2, None, topic.posts[0].content)
+    assert rows[2] == (3, 2, "同问\n--")
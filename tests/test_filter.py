@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.mark.parametrize(
+    "title",
+    ["Re: Re: 交大食堂推荐", "【合集】交大食堂推荐", "[转载] 交大食堂推荐！", "交大食堂推荐 (转载)"],
+)
+def test_normalize_title_strips_prefixes_and_tags(filter_module, title):
+    assert filter_module.normalize_title(title) == "交大食堂推荐"
+
+
+def test_near_duplicate_titles_share_the_smallest_reid(filter_module):
+    Reid = filter_module.Reid
+    reids = [
+        Reid("1000", "交大闵行校区食堂推荐汇总", "a", "water"),
+        Reid("999", "【合集】交大闵行校区食堂推荐汇总", "b", "water"),
+        Reid("1001", "Re: 交大闵行校区食堂推荐汇总。", "c", "water"),
+        Reid("1002", "交大闵行校区食堂推荐汇总（二）", "d", "water"),
+        Reid("998", "图书馆开放时间", "e", "water"),
+    ]
+    clusters = filter_module.TitleClusterer().cluster(reids)
+    assert [[r.reid for r in c] for c in clusters] == [
+        ["998"],
+        ["999", "1000", "1001", "1002"],
+    ]
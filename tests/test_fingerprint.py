@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import fakeredis
+
+from pypkg.fingerprint import FingerprintIndex
+from pypkg.parser import ParsedAuthor, ParsedPost, ParsedTopic
+
+ARTICLE = """【转载】闵行校区新学期选课安排
+各位同学：本学期选课分为三轮进行，第一轮为预选，第二轮为正选，第三轮为补退选。
+请大家在规定时间内登录教学信息服务网完成选课，逾期不再受理。
+有问题请联系各院系教务办公室。
+--
+"""
+OTHER = """二餐今天中午的麻辣香锅涨价了，大家觉得还值得去吗，还是改去一餐或者三餐吃。
+听说四餐新开了一个窗口，有没有人去试过，味道怎么样，价格贵不贵。
+--
+"""
+
+
+def topic(reid: int, board: str, body: str) -> ParsedTopic:
+    content = f"reid={reid}\n\n{body}"
+    return ParsedTopic(
+        reid=reid,
+        author=ParsedAuthor("op", "op"),
+        board=board,
+        created_at=datetime(2010, 1, 1),
+        title="title",
+        content=content,
+        # 与解析器一样，text_in 只有最后一行未引用的文字
+        text_in=body.splitlines()[-1] + "\n",
+        posts=[],
+        assets=[],
+    )
+
+
+def test_whole_body_is_fingerprinted():
+    index = FingerprintIndex(fakeredis.FakeRedis())
+    original = topic(1001, "water", ARTICLE)
+    assert index.check(original) is None
+    index.register(index.originals([original]))
+    # 不同版块的拷贝，reid 不同，还多引用了一段别人的话
+    repost = topic(2002, "SJTUNews", '[quote="bob (b)"]\n原文在哪\n[/quote]\n' + ARTICLE)
+    assert index.check(repost) == "water"
+    assert repost.original_reid == 1001
+    # 最后一行相同但正文完全不同的主题不是转载
+    assert index.check(topic(3003, "SJTUNews", OTHER)) is None
+    assert index.report() == {"SJTUNews": (2, 1), "water": (1, 0)}
+
+
+def test_originals_are_only_registered_after_import():
+    index = FingerprintIndex(fakeredis.FakeRedis())
+    # 第一份拷贝导入失败或只是 --dryrun，没有登记，第二份仍被当作原帖
+    assert index.check(topic(1001, "water", ARTICLE)) is None
+    second = topic(2002, "SJTUNews", ARTICLE)
+    assert index.check(second) is None
+    index.register(index.originals([second]))
+    repost = topic(3003, "water", ARTICLE)
+    assert index.check(repost) == "SJTUNews"
+    assert repost.original_reid == 2002
+    # 拷贝本身不会被登记
+    assert index.originals([repost]) == []
+
+
+class CachedTopics:
+    def __init__(self, topics: list[ParsedTopic]):
+        self.topics = topics
+
+    def count(self, after=None) -> int:
+        return len(self.topics)
+
+    def items(self, after=None):
+        for t in self.topics:
+            yield str(t.reid), t
+
+
+class Organizer:
+    def __init__(self):
+        self.organized = []
+
+    def organize(self, topic: ParsedTopic):
+        self.organized.append(topic.reid)
+
+
+def test_reposts_skip_reply_reconstruction(reimporter):
+    index = FingerprintIndex(fakeredis.FakeRedis())
+    original = topic(1001, "water", ARTICLE)
+    index.check(original)
+    index.register(index.originals([original]))
+    repost = topic(2002, "SJTUNews", ARTICLE)
+    reply = ParsedPost(
+        author=ParsedAuthor("bob", "bob"),
+        created_at=datetime(2010, 1, 2),
+        content="转了",
+        text_in="转了\n",
+        quote_reply_to=None,
+        quote_embedded=False,
+    )
+    repost.posts = [reply]
+    other = topic(2003, "SJTUNews", OTHER)
+    organizer = Organizer()
+    pairs = list(
+        reimporter.iter_parsed_topics(
+            "SJTUNews",
+            cache=CachedTopics([repost, other]),
+            from_cache=True,
+            dedup=index,
+            organizer=organizer,
+        )
+    )
+    assert organizer.organized == [2003]
+    assert [t.original_reid for _, t in pairs] == [1001, None]
+    assert repost.posts == []
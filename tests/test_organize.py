@@ -0,0 +1,160 @@
+from datetime import datetime
+
+import pytest
+import torch
+
+from pypkg.organize import ReplyOrganizer
+from pypkg.parser import ParsedAuthor, ParsedPost, ParsedTopic, QuoteReplyTo
+
+T0 = datetime(2010, 1, 1)
+
+
+class VectorEncoder:
+    """按文本返回预先指定的向量，代替句向量模型"""
+
+    def __init__(self, vectors: dict[str, list[float]]):
+        self.vectors = vectors
+        self.calls = 0
+
+    def encode(self, texts, convert_to_tensor=True):
+        self.calls += 1
+        return torch.tensor([self.vectors[text] for text in texts], dtype=torch.float)
+
+
+class NoEncoder:
+    def encode(self, texts, convert_to_tensor=True):
+        raise AssertionError("lexical matches must not reach the model")
+
+
+def organizer(trans) -> ReplyOrganizer:
+    # 不加载真实模型，只替换编码器
+    o = ReplyOrganizer.__new__(ReplyOrganizer)
+    o.trans = trans
+    o.embed = False
+    return o
+
+
+def post(username: str, text: str, quote: tuple[str, str] | None = None) -> ParsedPost:
+    quote_reply_to = QuoteReplyTo(*quote) if quote else None
+    content = text
+    if quote:
+        content = f'[quote="{quote[0]}"]\n{quote[1]}\n[/quote]\n{text}'
+    return ParsedPost(
+        author=ParsedAuthor(username, username),
+        created_at=T0,
+        content=content,
+        text_in=text,
+        quote_reply_to=quote_reply_to,
+        quote_embedded=False,
+    )
+
+
+def topic(content: str, posts: list[ParsedPost]) -> ParsedTopic:
+    return ParsedTopic(
+        reid=1,
+        author=ParsedAuthor("op", "op"),
+        board="test",
+        created_at=T0,
+        title="title",
+        content=content,
+        text_in=content,
+        posts=posts,
+        assets=[],
+    )
+
+
+def test_lexical_match_picks_quoted_post():
+    t = topic(
+        "请问闵行校区的食堂哪家最好吃",
+        [
+            post("alice", "二餐的麻辣香锅值得一试"),
+            post("bob", "同意", ("alice (a)", "二餐的麻辣香锅值得一试")),
+            post("carol", "还是一餐吧", ("op (o)", "请问闵行校区的食堂哪家最好吃")),
+        ],
+    )
+    organizer(NoEncoder()).organize(t)
+    assert [p.reply_to_id for p in t.posts] == [-1, 0, -1]
+
+
+def test_lexical_ambiguity_resolved_by_username():
+    t = topic(
+        "顶一下",
+        [
+            post("alice", "图书馆几点关门"),
+            post("bob", "图书馆几点关门"),
+            post("carol", "十点", ("bob (b)", "图书馆几点关门")),
+        ],
+    )
+    organizer(NoEncoder()).organize(t)
+    assert t.posts[2].reply_to_id == 1
+
+
+def test_embedding_fallback_picks_most_similar_earlier_post():
+    t = topic(
+        "topic",
+        [
+            post("alice", "first"),
+            post("bob", "second"),
+            post("carol", "third", ("bob (b)", "paraphrase")),
+        ],
+    )
+    trans = VectorEncoder(
+        {
+            "topic": [1, 0, 0],
+            "first": [0, 1, 0],
+            "second": [0, 0, 1],
+            "third": [1, 1, 1],
+            "paraphrase": [0, 0.2, 1],
+        }
+    )
+    organizer(trans).organize(t)
+    assert t.posts[2].reply_to_id == 1
+    assert trans.calls == 2
+
+
+def test_embedding_fallback_never_picks_a_later_post():
+    # 与引用最相似的是之后的回帖，只能在主题帖与更早的回帖中选择
+    t = topic(
+        "topic",
+        [
+            post("alice", "first"),
+            post("bob", "second", ("x (x)", "paraphrase")),
+            post("carol", "third"),
+        ],
+    )
+    trans = VectorEncoder(
+        {
+            "topic": [1, 0, 0],
+            "first": [0.6, 0.8, 0],
+            "second": [0, 0, 1],
+            "third": [0, 1, 0],
+            "paraphrase": [0, 1, 0.1],
+        }
+    )
+    organizer(trans).organize(t)
+    assert t.posts[1].reply_to_id == 0
+
+
+@pytest.mark.parametrize("quote_vector, expected", [([1, 0], -1), ([0, 1], 0)])
+def test_embedding_fallback_can_reply_to_topic(quote_vector, expected):
+    t = topic("topic", [post("alice", "first"), post("bob", "x", ("y (y)", "q"))])
+    trans = VectorEncoder(
+        {"topic": [1, 0], "first": [0, 1], "x": [1, 1], "q": quote_vector}
+    )
+    organizer(trans).organize(t)
+    assert t.posts[1].reply_to_id == expected
+
+
+def test_stored_embeddings_cover_whole_bodies_without_quotes():
+    reply = post("bob", "第二行", ("alice (a)", "第一行\n第二行"))
+    reply.content = '第一行\n[quote="alice"]\n引文\n[/quote]\n第二行'
+    t = topic("reid=1\n\n主题正文", [post("alice", "第一行\n第二行"), reply])
+    trans = VectorEncoder(
+        {"主题正文": [1, 0], "第一行\n第二行": [0, 1], "第一行\n\n第二行": [1, 1]}
+    )
+    o = organizer(trans)
+    o.embed = True
+    o.organize(t)
+    assert t.embedding == [1, 0]
+    assert [p.embedding for p in t.posts] == [[0, 1], [1, 1]]
+    assert trans.calls == 1
@@ -0,0 +1,57 @@
+import pytest
+
+from pypkg.snapshot import MAGIC, Snapshot, SnapshotFormatError, SnapshotWriter
+
+
+def doc(reid: str) -> dict:
+    return {"reid": reid, "title": f"t{reid}", "section": "water", "pages": [f"<p>{reid}</p>"]}
+
+
+def export(path: str, reids: list[str], append: bool = False) -> None:
+    writer = SnapshotWriter(path, append)
+    for reid in reids:
+        writer.write(doc(reid))
+    writer.close()
+
+
+def read(path: str) -> list[tuple[str, str]]:
+    with Snapshot(path) as snapshot:
+        return [(d["reid"], d["pages"][0]) for d in snapshot.docs()]
+
+
+def test_append(tmp_path):
+    path = str(tmp_path / "water.snap")
+    export(path, ["1001", "1002"])
+    export(path, ["1003"], append=True)
+    assert read(path) == [("1001", "<p>1001</p>"), ("1002", "<p>1002</p>"), ("1003", "<p>1003</p>")]
+
+
+@pytest.mark.parametrize(
+    "tail",
+    [
+        b"\x00\x01",
+        # 页面字节中恰好出现 MAGIC，甚至像一个 FOOTER
+        b"junk" + MAGIC + b"\x00" * 16 + MAGIC,
+    ],
+)
+def test_interrupted_append_is_ignored_and_truncated(tmp_path, tail):
+    path = str(tmp_path / "water.snap")
+    export(path, ["1001", "1002"])
+    # 追加写了一条记录与半个索引后进程被杀掉
+    writer = SnapshotWriter(path, append=True)
+    writer.write(doc("1003"))
+    writer.f.write(tail)
+    writer.f.close()
+
+    assert [reid for reid, _ in read(path)] == ["1001", "1002"]
+    export(path, ["1003", "1004"], append=True)
+    assert [reid for reid, _ in read(path)] == ["1001", "1002", "1003", "1004"]
+    with Snapshot(path) as snapshot:
+        assert snapshot.size == (tmp_path / "water.snap").stat().st_size
+
+
+def test_unfinished_snapshot_is_rejected(tmp_path):
+    path = tmp_path / "water.snap"
+    path.write_bytes(MAGIC + b"\x00" * 64)
+    with pytest.raises(SnapshotFormatError):
+        Snapshot(str(path))
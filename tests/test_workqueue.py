@@ -0,0 +1,162 @@
+import contextlib
+
+import fakeredis
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from pypkg.deadletter import DeadLetterSink, JsonlDeadLetters, RedisDeadLetters
+from pypkg.snapshot import Snapshot, SnapshotWriter
+from pypkg.workqueue import WorkQueue
+
+REIDS = [str(1000 + i) for i in range(6)]
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+
+def test_ack_only_removes_own_leases(client):
+    slow = WorkQueue(client, "b", lease_seconds=0)
+    fast = WorkQueue(client, "b")
+    slow.enqueue(REIDS[:2])
+    assert slow.lease(2) == REIDS[:2]
+    # 租约立即过期，被另一个 worker 重新领取
+    assert fast.requeue_expired() == []
+    assert fast.lease(2) == REIDS[:2]
+    assert slow.ack(REIDS[:2]) == 0
+    assert slow.release(REIDS[:2]) == 0
+    assert fast.pending() == (0, 2)
+    assert fast.ack(REIDS[:2]) == 2
+    assert fast.pending() == (0, 0)
+
+
+def test_retry_gives_up_after_max_attempts(client):
+    queue = WorkQueue(client, "b", max_attempts=2)
+    queue.enqueue(REIDS[:1])
+    assert queue.retry(queue.lease(1)) == []
+    assert queue.pending() == (1, 0)
+    assert queue.retry(queue.lease(1)) == REIDS[:1]
+    assert queue.pending() == (0, 0)
+
+
+def test_ack_resets_attempts(client):
+    queue = WorkQueue(client, "b", max_attempts=2)
+    queue.enqueue(REIDS[:1])
+    queue.retry(queue.lease(1))
+    queue.ack(queue.lease(1))
+    queue.client.rpush(queue.queue_key, REIDS[0])
+    assert queue.retry(queue.lease(1)) == []
+
+
+def test_repeatedly_expired_lease_is_given_up(client):
+    queue = WorkQueue(client, "b", lease_seconds=0, max_attempts=2)
+    queue.enqueue(REIDS[:1])
+    queue.lease(1)
+    assert queue.requeue_expired() == []
+    queue.lease(1)
+    assert queue.requeue_expired() == REIDS[:1]
+    assert queue.pending() == (0, 0)
+
+
+class Topic:
+    def __init__(self, reid):
+        self.reid = reid
+
+
+def test_worker_does_not_livelock_on_a_conflicting_reid(
+    reimporter, monkeypatch, client
+):
+    imported = []
+
+    def iter_parsed_topics(board, reids, *args, **kwargs):
+        for reid in reids:
+            yield reid, Topic(reid)
+
+    def import_parsed_topics(session, topics, guard=None, dead_letters=None, **kwargs):
+        assert kwargs == {"retry_conflicts": True}
+        for topic in topics:
+            if topic.reid == REIDS[2]:
+                raise IntegrityError("INSERT", {}, Exception("duplicate key"))
+            imported.append(topic.reid)
+
+    monkeypatch.setattr(reimporter, "iter_parsed_topics", iter_parsed_topics)
+    monkeypatch.setattr(reimporter, "import_parsed_topics", import_parsed_topics)
+    monkeypatch.setattr(reimporter, "make_session", lambda dsn: None)
+    monkeypatch.setattr(reimporter, "ReplyOrganizer", lambda embed: None)
+    monkeypatch.setattr(
+        reimporter, "open_collection", lambda *a: contextlib.nullcontext()
+    )
+
+    queue = WorkQueue(client, "b", max_attempts=3)
+    queue.enqueue(REIDS)
+    letters = RedisDeadLetters(client, "b")
+    reimporter.run_worker(
+        queue, "b", False, 4, None, False, dead_letters=DeadLetterSink(letters)
+    )
+    assert sorted(imported) == REIDS[:2] + REIDS[3:]
+    assert list(letters.pending()) == [REIDS[2]]
+    assert queue.pending() == (0, 0)
+
+
+class RollbackSession:
+    def __init__(self):
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.mark.parametrize("retry_conflicts", [False, True])
+def test_conflicts_are_dead_letters_outside_worker_mode(
+    reimporter, monkeypatch, tmp_path, retry_conflicts
+):
+    def import_parsed_topic(session, topic, replace=False):
+        raise IntegrityError("INSERT", {}, Exception("duplicate key"))
+
+    monkeypatch.setattr(reimporter, "import_parsed_topic", import_parsed_topic)
+    letters = JsonlDeadLetters(str(tmp_path), "b")
+    session = RollbackSession()
+    topics = [Topic(int(REIDS[0]))]
+    if retry_conflicts:
+        with pytest.raises(IntegrityError):
+            reimporter.import_parsed_topics(
+                session, topics, dead_letters=DeadLetterSink(letters), retry_conflicts=True
+            )
+        assert list(letters.pending()) == []
+    else:
+        reimporter.import_parsed_topics(session, topics, dead_letters=DeadLetterSink(letters))
+        assert list(letters.pending()) == [REIDS[0]]
+    assert session.rollbacks == 1
+
+
+class MissingCollection:
+    """只有 REIDS 中文档的 mongo 集合，其他 reid 的 find_one 返回 None"""
+
+    def find_one(self, query, projection):
+        reid = query["reid"]
+        if reid in REIDS:
+            return {"reid": reid, "title": "t", "pages": ["p"], "section": "b"}
+        return None
+
+
+@pytest.mark.parametrize("source", ["mongo", "snapshot"])
+def test_missing_documents_are_dead_letters(reimporter, monkeypatch, tmp_path, source):
+    monkeypatch.setattr(reimporter, "make_parser", lambda post: None)
+    letters = JsonlDeadLetters(str(tmp_path), "b")
+    poi = [REIDS[0], "999", REIDS[1]]
+    with contextlib.ExitStack() as stack:
+        if source == "mongo":
+            collection = MissingCollection()
+        else:
+            path = str(tmp_path / "b.snap")
+            writer = SnapshotWriter(path)
+            for reid in REIDS:
+                writer.write({"reid": reid, "title": "t", "pages": ["p"], "section": "b"})
+            writer.close()
+            collection = stack.enter_context(Snapshot(path))
+        parsed = reimporter.parse_documents(
+            collection, poi, dead_letters=DeadLetterSink(letters)
+        )
+        assert list(parsed) == [(reid, None) for reid in poi]
+    assert list(letters.pending()) == ["999"]